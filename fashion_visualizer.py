@@ -1,10 +1,22 @@
-import streamlit as st
-import anthropic
-import base64
 import json
-import re
-from PIL import Image
-import io
+import uuid
+
+import streamlit as st
+
+from fitlab import Photo, Preferences, prepare_photo, regenerate_look, regenerate_piece
+from fitlab.blobs import get_blob_store
+from fitlab.constants import STYLES, OCCASIONS, SEASONS, BUDGETS
+from fitlab.engine import PhotoExpired
+from fitlab.images import make_preview, format_bytes
+from fitlab.jobs import JOB_POLL_SECONDS, get_job_manager
+from fitlab.render import analysis_html, outfit_html, result_html
+from fitlab.phash import get_photo_index
+from fitlab.prefetch import PREFETCH, get_prefetcher
+from fitlab.routing import get_router
+from fitlab.scheduler import SchedulerBusy
+from fitlab.singleflight import get_generation_flights
+from fitlab.telemetry import DEBUG_PANEL, SpanRef, get_tracer, span, trace_rows
+from fitlab.usage import UsageMeter, get_usage_meter
 
 # ── Page Config ───────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -146,7 +158,8 @@ html, body, [data-testid="stAppViewContainer"] {
 .style-tag.active { background: var(--ink); color: var(--paper); border-color: var(--ink); }
 
 /* ── CTA BUTTON ── */
-div[data-testid="stButton"] > button {
+div[data-testid="stButton"] > button,
+div[data-testid="stFormSubmitButton"] > button {
     background: var(--ink) !important;
     color: var(--paper) !important;
     border: none !important;
@@ -160,7 +173,8 @@ div[data-testid="stButton"] > button {
     width: 100% !important;
     transition: all 0.2s !important;
 }
-div[data-testid="stButton"] > button:hover {
+div[data-testid="stButton"] > button:hover,
+div[data-testid="stFormSubmitButton"] > button:hover {
     background: var(--rose) !important;
 }
 
@@ -190,6 +204,7 @@ label[data-testid="stWidgetLabel"] {
     padding: 0.5rem !important;
 }
 [data-testid="stFileUploader"] label { display: none !important; }
+[data-testid="stForm"] { padding: 0 !important; }
 
 /* ── RESULT CARDS ── */
 .result-hero {
@@ -276,6 +291,19 @@ label[data-testid="stWidgetLabel"] {
     letter-spacing: 0.05em;
     text-transform: uppercase;
 }
+.piece-products {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 0.35rem 0.9rem;
+    padding: 0 0 0.4rem calc(80px + 1.2rem + 6px);
+    font-size: 0.74rem;
+    color: var(--muted);
+}
+.piece-products a {
+    color: var(--slate);
+    text-decoration: none;
+    border-bottom: 1px solid var(--blush);
+}
 
 /* Color chips */
 .palette-row {
@@ -406,31 +434,166 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
-def img_to_b64(image_bytes: bytes) -> str:
-    return base64.standard_b64encode(image_bytes).decode("utf-8")
-
-def get_image_b64_from_upload(uploaded_file) -> str:
-    return img_to_b64(uploaded_file.getvalue())
-
-STYLES = [
-    "Streetwear", "Minimalist", "Business Casual", "Boho", "Y2K",
-    "Old Money", "Grunge", "Cottagecore", "Athleisure", "Avant-Garde",
-    "Coastal", "Dark Academia", "Preppy", "Maximalist", "Androgynous"
-]
-
-OCCASIONS = ["Everyday", "Work", "Date Night", "Party", "Outdoor", "Formal", "Festival", "Travel"]
-SEASONS   = ["Spring", "Summer", "Autumn", "Winter", "All-Season"]
-BUDGETS   = ["Under ₹2K", "₹2K–5K", "₹5K–10K", "₹10K–20K", "Luxury"]
+def upload_key(uploaded_file) -> str:
+    # Streamlit gives every upload a fresh file_id; older versions lack it
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+
+# ── Rendering ─────────────────────────────────────────────────────────────────
+def render_analysis(pa: dict) -> None:
+    st.markdown(analysis_html(pa), unsafe_allow_html=True)
+
+def render_outfit(i: int, outfit: dict) -> None:
+    st.markdown(outfit_html(i, outfit), unsafe_allow_html=True)
+
+def render_result(data: dict, occasion: str, season: str, budget: str, trace: SpanRef | None = None) -> None:
+    # The whole report is a single element, timed on the trace of the run that produced it
+    with span("render", parent=trace, n_looks=len(data.get("outfits") or [])):
+        st.markdown(result_html(data, occasion, season, budget), unsafe_allow_html=True)
+
+def render_edit_panel(data: dict, prefs: dict) -> None:
+    # Re-roll one look or one piece; the reply is spliced into the stored result
+    targets = {}   # label -> (look, piece or None)
+    for i, outfit in enumerate(data.get("outfits") or []):
+        targets[f"Look {i + 1:02d} · the whole look ({outfit.get('name', '')})"] = (i, None)
+        for j, piece in enumerate(outfit.get("pieces") or []):
+            targets[f"Look {i + 1:02d} · {piece.get('type', '')}: {piece.get('item', '')}"] = (i, j)
+    if not targets:
+        return
+    with st.expander("↻ Change a look or a single piece"):
+        with st.form("edit", border=False):
+            target = st.selectbox("What to change", list(targets))
+            note = st.text_input("Anything it should respect? (optional)",
+                                 placeholder="e.g. no heels · something in navy · under ₹1,500")
+            submitted = st.form_submit_button("↻ Regenerate")
+    if not submitted:
+        return
+    look, piece = targets[target]
+    meter = UsageMeter()
+    try:
+        with st.spinner("Re-styling…"):
+            if piece is None:
+                result = regenerate_look(data, look, prefs, note, meter=meter)
+            else:
+                result = regenerate_piece(data, look, piece, prefs, note, meter=meter)
+    except (SchedulerBusy, PhotoExpired) as e:
+        st.warning(str(e))
+        return
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return
+    st.session_state.result        = result.to_dict()
+    st.session_state.last_trace_id = result.trace_id
+    st.session_state.last_span_id  = result.span_id
+    st.session_state.last_usage    = meter.summary()
+    st.rerun()
+
+def finish_job(job) -> None:
+    # Moves a finished job's outcome into session state for the rerun that shows it
+    notes = []
+    if job.status == "done":
+        result = job.result
+        st.session_state.result        = result.to_dict()
+        st.session_state.result_prefs  = job.prefs
+        st.session_state.last_trace_id = result.trace_id
+        st.session_state.last_span_id  = result.span_id
+        st.session_state.last_usage    = None if result.cached or result.coalesced else job.meter.summary()
+        if result.cached:
+            notes.append(("caption", "✦ Served from cache — same photo and preferences as an earlier run"))
+        elif result.coalesced:
+            notes.append(("caption", "✦ Joined an identical generation that was already running"))
+        if result.failures:
+            notes.append(("warning", f"Some parts didn't finish in time and were skipped: {', '.join(result.failures)}"))
+    elif job.status == "cancelled":
+        notes.append(("caption", "✦ Generation cancelled"))
+    elif isinstance(job.error, (SchedulerBusy, PhotoExpired)):
+        notes.append(("warning", str(job.error)))
+    elif isinstance(job.error, json.JSONDecodeError):
+        notes.append(("error", f"Parsing error: {job.error}"))
+    else:
+        notes.append(("error", f"Error: {job.error}"))
+    st.session_state.job_id    = None
+    st.session_state.job_notes = notes
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job(job_id: str) -> None:
+    # Polls the background generation instead of blocking the script on it;
+    # each poll is also the session's heartbeat that keeps the job alive
+    job = get_job_manager().poll(job_id, owner=st.session_state.session_id)
+    if job is None or job.finished:
+        if job is None:
+            st.session_state.job_id = None
+        else:
+            finish_job(job)
+        st.rerun()
+    progress = job.progress()
+    status, cancel = st.columns([5, 1])
+    if progress["queue"]:
+        position, seconds_left = progress["queue"]
+        status.caption(f"✦ High demand right now — you're #{position} in line, ~{seconds_left:.0f}s to go…")
+    elif progress["status"] == "queued":
+        status.caption("✦ Waiting for a free stylist…")
+    elif not progress["analysis"]:
+        status.caption("✦ Analyzing your photo…")
+    elif progress["looks"]:
+        status.caption(f"✦ Look {max(progress['looks']) + 1:02d} ready — styling the rest…")
+    else:
+        status.caption("✦ Crafting your looks…")
+    if cancel.button("✕ Cancel", key="cancel_job"):
+        get_job_manager().cancel(job_id)
+    if progress["analysis"]:
+        render_analysis(progress["analysis"])
+    for idx, outfit in sorted(progress["looks"].items()):
+        render_outfit(idx + 1, outfit)
+
+def render_debug_panel(trace_id: str | None) -> None:
+    tracer = get_tracer()
+    with st.expander("Debug · spans and metrics"):
+        spans = tracer.trace(trace_id) if trace_id else []
+        if spans:
+            st.dataframe(trace_rows(spans), hide_index=True)
+        else:
+            st.caption("No spans recorded for the last generation yet.")
+        st.caption("Model tiers")
+        st.dataframe([{"tier": name, **stats} for name, stats in get_router().snapshot().items()], hide_index=True)
+        st.caption("Near-duplicate photo index")
+        st.json(get_photo_index().snapshot(), expanded=False)
+        st.caption("Photo blob store")
+        st.json(get_blob_store().snapshot(), expanded=False)
+        st.caption("Background analyses")
+        st.json(get_prefetcher().snapshot(), expanded=False)
+        st.caption("Generation jobs")
+        st.json(get_job_manager().snapshot(), expanded=False)
+        st.code(tracer.prometheus_text(), language="text")
 
 # ── Session State ─────────────────────────────────────────────────────────────
 if "selected_styles" not in st.session_state:
     st.session_state.selected_styles = ["Minimalist"]
 if "result" not in st.session_state:
     st.session_state.result = None
-if "user_photo_b64" not in st.session_state:
-    st.session_state.user_photo_b64 = None
 if "user_photo_mime" not in st.session_state:
     st.session_state.user_photo_mime = "image/jpeg"
+if "user_photo_stats" not in st.session_state:
+    st.session_state.user_photo_stats = None
+if "user_photo_hash" not in st.session_state:
+    st.session_state.user_photo_hash = None
+if "user_photo_colours" not in st.session_state:
+    st.session_state.user_photo_colours = {}
+if "last_usage" not in st.session_state:
+    st.session_state.last_usage = None
+if "user_photo_upload_key" not in st.session_state:
+    st.session_state.user_photo_upload_key = None
+if "user_photo_preview" not in st.session_state:
+    st.session_state.user_photo_preview = None
+if "last_trace_id" not in st.session_state:
+    st.session_state.last_trace_id = None
+if "last_span_id" not in st.session_state:
+    st.session_state.last_span_id = None
+if "result_prefs" not in st.session_state:
+    st.session_state.result_prefs = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
 
 # ── Layout ────────────────────────────────────────────────────────────────────
 left, right = st.columns([1.1, 2.2], gap="small")
@@ -448,296 +611,136 @@ with left:
     )
 
     if uploaded:
-        st.session_state.user_photo_b64   = get_image_b64_from_upload(uploaded)
-        st.session_state.user_photo_mime  = uploaded.type
-        img = Image.open(uploaded)
-        st.image(img, use_container_width=True, caption="Your photo")
+        # Every widget change reruns the script; only decode/encode a new upload
+        # Session state holds only hashes; the bytes sit once in the shared
+        # blob store, and are prepared again if they have been evicted from it.
+        key   = upload_key(uploaded)
+        blobs = get_blob_store()
+        if st.session_state.user_photo_upload_key != key or not blobs.has(st.session_state.user_photo_hash):
+            photo = prepare_photo(uploaded.getvalue())
+            if st.session_state.user_photo_upload_key != key:
+                # A new photo supersedes a generation still running for the old one
+                get_job_manager().cancel_owner(st.session_state.session_id)
+                st.session_state.job_id = None
+            st.session_state.user_photo_mime       = photo.mime
+            st.session_state.user_photo_stats      = photo.stats
+            st.session_state.user_photo_hash       = photo.hash
+            st.session_state.user_photo_colours    = photo.colours
+            st.session_state.user_photo_preview    = blobs.put(make_preview(photo.data))
+            st.session_state.user_photo_upload_key = key
+            # Analyse the photo while preferences are being picked; Generate
+            # picks the analysis up (or joins it) and a new upload cancels it
+            if PREFETCH:
+                get_prefetcher().start(photo, owner=st.session_state.session_id)
+        preview = blobs.get(st.session_state.user_photo_preview)
+        if preview is None:
+            preview = make_preview(blobs.get(st.session_state.user_photo_hash))
+            st.session_state.user_photo_preview = blobs.put(preview)
+        stats = st.session_state.user_photo_stats
+        st.image(bytes(preview), use_container_width=True, caption="Your photo")
+        st.caption(
+            f"Optimised for upload: {format_bytes(stats['orig_bytes'])} → {format_bytes(stats['bytes'])} "
+            f"· ~{stats['tokens_saved']:,} image tokens saved"
+        )
+        if stats.get("match"):
+            st.caption("✦ Recognised from an earlier upload — its analysis will be reused")
+        colours = st.session_state.user_photo_colours
+        if colours.get("skin"):
+            st.caption(f"Measured skin tone {colours['skin']} · {colours['undertone']} undertone, {colours['depth']}")
     else:
+        # Upload cleared: an analysis still running for the old photo is dropped
+        if PREFETCH:
+            get_prefetcher().release(st.session_state.session_id)
         st.markdown("""
         <div class="upload-zone">
             <div class="upload-icon">🧍</div>
             <div class="upload-text">Upload a full-body photo<br>JPG · PNG · WEBP</div>
         </div>""", unsafe_allow_html=True)
 
-    st.markdown('<div class="section-label" style="margin-top:1.25rem;">✦ Style Vibes</div>', unsafe_allow_html=True)
-    st.caption("Select up to 3 styles")
-    
-    # Style selector using multiselect for simplicity + visual display
-    chosen = st.multiselect(
-        "Styles",
-        STYLES,
-        default=st.session_state.selected_styles,
-        max_selections=3,
-        label_visibility="collapsed",
-    )
+    # Preferences live in a form so editing them doesn't rerun the script;
+    # only the Generate button submits.
+    with st.form("preferences", border=False):
+        st.markdown('<div class="section-label" style="margin-top:1.25rem;">✦ Style Vibes</div>', unsafe_allow_html=True)
+        st.caption("Select up to 3 styles")
+
+        # Style selector using multiselect for simplicity + visual display
+        chosen = st.multiselect(
+            "Styles",
+            STYLES,
+            default=st.session_state.selected_styles,
+            max_selections=3,
+            label_visibility="collapsed",
+        )
+
+        st.markdown('<div class="section-label" style="margin-top:1.25rem;">⚙️ Preferences</div>', unsafe_allow_html=True)
+
+        occasion = st.selectbox("Occasion", OCCASIONS)
+        season   = st.selectbox("Season",   SEASONS)
+        budget   = st.selectbox("Budget",   BUDGETS)
+
+        body_notes = st.text_input(
+            "Body type / fit preferences (optional)",
+            placeholder="e.g. petite, prefer loose fits, hide midsection…"
+        )
+        extra = st.text_area(
+            "Special requests (optional)",
+            placeholder="e.g. I love earthy tones, avoid synthetic fabric…",
+            height=70,
+        )
+
+        st.markdown("---")
+        generate = st.form_submit_button("✦  GENERATE OUTFIT LOOKS")
     st.session_state.selected_styles = chosen if chosen else ["Minimalist"]
 
-    st.markdown('<div class="section-label" style="margin-top:1.25rem;">⚙️ Preferences</div>', unsafe_allow_html=True)
-
-    occasion = st.selectbox("Occasion", OCCASIONS)
-    season   = st.selectbox("Season",   SEASONS)
-    budget   = st.selectbox("Budget",   BUDGETS)
-
-    body_notes = st.text_input(
-        "Body type / fit preferences (optional)",
-        placeholder="e.g. petite, prefer loose fits, hide midsection…"
-    )
-    extra = st.text_area(
-        "Special requests (optional)",
-        placeholder="e.g. I love earthy tones, avoid synthetic fabric…",
-        height=70,
-    )
-
-    st.markdown("---")
-    generate = st.button("✦  GENERATE OUTFIT LOOKS")
-
 # ════════════════════════════════════════════════════════════════════
 # RIGHT PANEL
 # ════════════════════════════════════════════════════════════════════
 with right:
 
     if generate:
-        if not st.session_state.user_photo_b64:
+        if not st.session_state.user_photo_hash:
             st.warning("Please upload a photo first.")
             st.stop()
 
-        styles_str = ", ".join(st.session_state.selected_styles)
-
-        system_prompt = """You are FITLAB's elite AI fashion stylist — part visionary creative director, part personal shopper. 
-You analyze the user's photo to understand body proportions, skin tone, current outfit, and personal aesthetic cues.
-You then craft 3 complete, wearable outfit concepts that flatter them specifically.
-Always respond in valid JSON only — no markdown, no preamble."""
-
-        user_prompt = f"""Analyze the person in this photo and create 3 distinct outfit concepts for them.
-
-Style preferences: {styles_str}
-Occasion: {occasion}
-Season: {season}
-Budget range: {budget}
-Body/fit notes: {body_notes if body_notes else 'Not specified'}
-Special requests: {extra if extra else 'None'}
-
-Respond ONLY with a JSON object in exactly this structure:
-{{
-  "person_analysis": {{
-    "skin_tone": "describe undertone briefly",
-    "body_silhouette": "describe shape/proportions briefly",
-    "current_style_cue": "what their current look suggests",
-    "style_persona": "2-3 word style archetype e.g. 'Quiet Luxe Minimalist'"
-  }},
-  "outfits": [
-    {{
-      "name": "Outfit name (evocative, 2-4 words)",
-      "occasion_fit": "Best for...",
-      "vibe": "One sentence mood/vibe",
-      "description": "2-3 sentences describing how this outfit looks on them specifically, referencing their features",
-      "pieces": [
-        {{"type": "Top", "item": "specific item with color/material", "why": "why it flatters them"}},
-        {{"type": "Bottom", "item": "specific item with color/material", "why": "why it works"}},
-        {{"type": "Shoes", "item": "specific footwear", "why": "completes the look"}},
-        {{"type": "Bag", "item": "bag/accessory", "why": "ties it together"}},
-        {{"type": "Accessory", "item": "jewelry/belt/hat etc", "why": "adds personality"}}
-      ],
-      "color_palette": ["#hex1", "#hex2", "#hex3", "#hex4"],
-      "palette_names": ["Color 1 name", "Color 2 name", "Color 3 name", "Color 4 name"],
-      "styling_tip": "One specific tip for wearing this outfit best",
-      "budget_breakdown": "Approximate total cost breakdown"
-    }}
-  ],
-  "universal_tips": [
-    "Personalized tip 1 based on their features",
-    "Personalized tip 2",
-    "Personalized tip 3"
-  ],
-  "signature_piece": "The one statement piece that would transform their wardrobe",
-  "avoid": "What styles/cuts to generally avoid and why"
-}}"""
-
-        with st.spinner("Analyzing your photo & crafting looks…"):
-            try:
-                client = anthropic.Anthropic()
-                response = client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=3000,
-                    system=system_prompt,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": st.session_state.user_photo_mime,
-                                    "data": st.session_state.user_photo_b64,
-                                }
-                            },
-                            {"type": "text", "text": user_prompt}
-                        ]
-                    }]
-                )
-
-                raw = response.content[0].text.strip()
-                raw = re.sub(r'^```json\s*', '', raw)
-                raw = re.sub(r'^```\s*', '', raw)
-                raw = re.sub(r'\s*```$', '', raw)
-                st.session_state.result = json.loads(raw)
-
-            except json.JSONDecodeError as e:
-                st.error(f"Parsing error: {e}")
-                st.stop()
-            except Exception as e:
-                st.error(f"Error: {e}")
-                st.stop()
+        prefs = Preferences(
+            styles=st.session_state.selected_styles,
+            occasion=occasion,
+            season=season,
+            budget=budget,
+            body_notes=body_notes,
+            extra=extra,
+        )
+        photo = Photo(
+            hash=st.session_state.user_photo_hash,
+            mime=st.session_state.user_photo_mime,
+            stats=st.session_state.user_photo_stats,
+            colours=st.session_state.user_photo_colours,
+        )
+        job = get_job_manager().submit(photo, prefs, owner=st.session_state.session_id)
+        st.session_state.job_id = job.id
+
+    # Outcome of a job that finished since the last run, shown once
+    for kind, text in st.session_state.pop("job_notes", None) or []:
+        getattr(st, kind)(text)
 
     # ── RENDER RESULTS ────────────────────────────────────────────────
-    if st.session_state.result:
-        data = st.session_state.result
-        pa   = data.get("person_analysis", {})
-
-        # Analysis Box
-        st.markdown(f"""
-        <div class="analysis-box">
-            <div class="analysis-title">✦ Style Profile Analysis</div>
-            <div class="analysis-text">
-                You carry a <strong style="color:#e8c9a0;">{pa.get('style_persona','')}</strong> energy — 
-                {pa.get('skin_tone','')} with {pa.get('body_silhouette','')}. 
-                Your current look signals <em>{pa.get('current_style_cue','')}</em>. 
-                These three looks are curated to elevate exactly that.
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    if st.session_state.job_id:
+        render_job(st.session_state.job_id)
+
+    elif st.session_state.result:
+        if st.session_state.last_usage:
+            st.caption(f"✦ Tokens: {st.session_state.last_usage} · "
+                       f"process cache hit rate {get_usage_meter().cache_hit_rate:.0%} · "
+                       f"{get_generation_flights().coalesced} duplicate runs coalesced")
+        trace = (SpanRef(st.session_state.last_trace_id, st.session_state.last_span_id)
+                 if st.session_state.last_span_id else None)
+        render_result(st.session_state.result, occasion, season, budget, trace)
+        if st.session_state.result_prefs:
+            render_edit_panel(st.session_state.result, st.session_state.result_prefs)
+        if DEBUG_PANEL:
+            render_debug_panel(st.session_state.last_trace_id)
 
-        # Info Strip
-        styles_disp = " · ".join(st.session_state.selected_styles)
-        st.markdown(f"""
-        <div class="info-strip">
-            <div class="info-cell"><div class="info-val">{len(data.get('outfits',[]))}</div><div class="info-lbl">Looks</div></div>
-            <div class="info-cell"><div class="info-val">{occasion}</div><div class="info-lbl">Occasion</div></div>
-            <div class="info-cell"><div class="info-val">{season}</div><div class="info-lbl">Season</div></div>
-            <div class="info-cell"><div class="info-val">{budget}</div><div class="info-lbl">Budget</div></div>
-        </div>
-        """, unsafe_allow_html=True)
-
-        # ── Outfits ────────────────────────────────────────────────
-        for i, outfit in enumerate(data.get("outfits", []), 1):
-            pieces  = outfit.get("pieces", [])
-            palette = outfit.get("color_palette", [])
-            pnames  = outfit.get("palette_names", [])
-
-            # Header
-            st.markdown(f"""
-            <div class="outfit-card">
-                <div style="display:flex; justify-content:space-between; align-items:flex-start;">
-                    <div>
-                        <div style="font-size:0.62rem; letter-spacing:0.15em; text-transform:uppercase; 
-                                    color:var(--muted); margin-bottom:0.2rem;">LOOK {i:02d}</div>
-                        <div class="outfit-name">{outfit.get('name','')}</div>
-                        <div class="outfit-occasion">{outfit.get('occasion_fit','')}</div>
-                    </div>
-                    <div style="text-align:right;">
-                        <div style="font-size:0.7rem; color:var(--muted); font-style:italic; 
-                                    font-family:'Cormorant Garamond',serif;">
-                            {outfit.get('vibe','')}
-                        </div>
-                    </div>
-                </div>
-                <div class="outfit-desc">{outfit.get('description','')}</div>
-            """, unsafe_allow_html=True)
-
-            # Pieces
-            st.markdown('<div class="piece-list">', unsafe_allow_html=True)
-            for piece in pieces:
-                st.markdown(f"""
-                <div class="piece-item">
-                    <div class="piece-dot"></div>
-                    <div class="piece-type">{piece.get('type','')}</div>
-                    <div style="flex:1;">{piece.get('item','')}</div>
-                    <div style="font-size:0.75rem; color:var(--muted); font-family:'Cormorant Garamond',serif; 
-                                font-style:italic; max-width:140px; text-align:right;">
-                        {piece.get('why','')}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-
-            # Palette
-            if palette:
-                chips = "".join([
-                    f'<div title="{pnames[j] if j < len(pnames) else ""}" class="color-chip" style="background:{c};"></div>'
-                    for j, c in enumerate(palette)
-                ])
-                pname_str = " · ".join(pnames) if pnames else ""
-                st.markdown(f"""
-                <div class="palette-row">
-                    <span style="font-size:0.65rem; letter-spacing:0.1em; text-transform:uppercase; 
-                                 color:var(--muted);">PALETTE</span>
-                    {chips}
-                    <span style="font-size:0.78rem; color:var(--slate); font-family:'Cormorant Garamond',serif;">
-                        {pname_str}
-                    </span>
-                </div>
-                """, unsafe_allow_html=True)
-
-            # Styling Tip + Budget
-            tip_txt    = outfit.get('styling_tip','')
-            budget_txt = outfit.get('budget_breakdown','')
-            st.markdown(f"""
-                <div style="margin-top:1rem; padding:0.85rem; background:var(--cream); border-radius:3px;
-                            display:flex; gap:1.5rem; flex-wrap:wrap;">
-                    <div style="flex:1; min-width:200px;">
-                        <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase; 
-                                    color:var(--rose); margin-bottom:0.25rem;">✦ Styling Tip</div>
-                        <div style="font-family:'Cormorant Garamond',serif; font-size:0.95rem; 
-                                    color:var(--slate);">{tip_txt}</div>
-                    </div>
-                    <div style="min-width:140px; text-align:right;">
-                        <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase; 
-                                    color:var(--muted); margin-bottom:0.25rem;">BUDGET</div>
-                        <div style="font-family:'Cormorant Garamond',serif; font-size:0.9rem; 
-                                    color:var(--slate);">{budget_txt}</div>
-                    </div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        # ── Universal Tips ─────────────────────────────────────────
-        tips = data.get("universal_tips", [])
-        if tips:
-            st.markdown("""
-            <div style="margin-top:1.5rem;">
-                <div class="section-label">✦ Personalized Style Tips</div>
-            """, unsafe_allow_html=True)
-            for idx, tip in enumerate(tips, 1):
-                st.markdown(f"""
-                <div class="tip-row">
-                    <div class="tip-num">0{idx}</div>
-                    <div>{tip}</div>
-                </div>""", unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-
-        # ── Signature Piece + Avoid ────────────────────────────────
-        sig = data.get("signature_piece", "")
-        avoid = data.get("avoid", "")
-        if sig or avoid:
-            c1, c2 = st.columns(2)
-            with c1:
-                st.markdown(f"""
-                <div class="outfit-card" style="border-left: 3px solid var(--gold);">
-                    <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase; 
-                                color:var(--gold); margin-bottom:0.5rem;">✦ Signature Statement Piece</div>
-                    <div style="font-family:'Cormorant Garamond',serif; font-size:1.05rem; 
-                                line-height:1.6; color:var(--ink);">{sig}</div>
-                </div>""", unsafe_allow_html=True)
-            with c2:
-                st.markdown(f"""
-                <div class="outfit-card" style="border-left: 3px solid var(--rose);">
-                    <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase; 
-                                color:var(--rose); margin-bottom:0.5rem;">✦ What to Avoid</div>
-                    <div style="font-family:'Cormorant Garamond',serif; font-size:1.05rem; 
-                                line-height:1.6; color:var(--ink);">{avoid}</div>
-                </div>""", unsafe_allow_html=True)
-
-    elif not generate:
+    else:
         st.markdown("""
         <div class="placeholder">
             <div class="placeholder-icon">👗</div>
@@ -0,0 +1,14 @@
+"""FITLAB core engine: photo in, typed lookbook out, no Streamlit required.
+
+Heavy dependencies (``anthropic``, Pillow) are imported on first use, so
+importing the package is cheap for CLIs and worker processes.
+"""
+
+from .engine import (Photo, generate_for_photo, generate_looks, prepare_photo, regenerate_look,
+                     regenerate_piece)
+from .results import Outfit, PersonAnalysis, Piece, Preferences, Result
+
+__all__ = [
+    "Outfit", "PersonAnalysis", "Photo", "Piece", "Preferences", "Result",
+    "generate_for_photo", "generate_looks", "prepare_photo", "regenerate_look", "regenerate_piece",
+]
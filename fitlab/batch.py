@@ -0,0 +1,271 @@
+"""Headless lookbook generation for a folder of photos via the Message Batches API.
+
+    python -m fitlab.batch photos/ --out lookbooks.jsonl \\
+        --styles "Minimalist,Old Money" --styles Streetwear \\
+        --occasion Work --occasion "Date Night" --season all
+
+Every photo is analysed once (batch 1), then every photo × preference
+combination gets an outfit request (batch 2). Results are appended to the
+output JSONL as each batch is collected. Progress is kept in a state file next
+to the output, so an interrupted run picks up its submitted batches instead of
+paying for them again. Point ``--base-url`` at ``python -m fitlab.stub_server``
+to exercise the whole flow locally.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+
+from .constants import STYLES, OCCASIONS, SEASONS, BUDGETS
+from .images import img_to_b64, preprocess_image
+from .palette import snap_outfit
+from .parsing import parse_result, salvage_looks, missing_parts
+from .prompts import build_analysis_request, build_outfit_request
+from .routing import MODEL_STANDARD
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+MAX_BATCH_REQUESTS = 10_000
+MAX_BATCH_MB       = 200      # the API caps a batch at 256 MB; analysis requests carry base64 photos
+
+def log(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+def _choices(values: list, allowed: list, name: str) -> list:
+    if not values:
+        return []
+    if values == ["all"]:
+        return list(allowed)
+    for v in values:
+        if v not in allowed:
+            raise SystemExit(f"Unknown {name} {v!r}; choose from: {', '.join(allowed)} or 'all'")
+    return values
+
+def preference_matrix(args) -> list:
+    style_sets = []
+    for combo in args.styles or ["Minimalist"]:
+        styles = [s.strip() for s in combo.split(",") if s.strip()]
+        _choices(styles, STYLES, "style")
+        if not 1 <= len(styles) <= 3:
+            raise SystemExit(f"Each --styles needs 1–3 styles, got {combo!r}")
+        style_sets.append(styles)
+
+    return [
+        {"styles": styles, "occasion": occasion, "season": season, "budget": budget,
+         "body_notes": args.body_notes, "extra": args.extra}
+        for styles, occasion, season, budget in itertools.product(
+            style_sets,
+            _choices(args.occasion, OCCASIONS, "occasion") or [OCCASIONS[0]],
+            _choices(args.season, SEASONS, "season") or ["All-Season"],
+            _choices(args.budget, BUDGETS, "budget") or [BUDGETS[1]],
+        )
+    ]
+
+def scan_photos(folder: str) -> list:
+    photos = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(PHOTO_EXTENSIONS):
+            continue
+        path = os.path.join(folder, name)
+        with open(path, "rb") as f:
+            data, mime, _ = preprocess_image(f.read())
+        photos.append({"path": path, "hash": hashlib.sha256(data).hexdigest(), "mime": mime, "data": data})
+    return photos
+
+def outfit_custom_id(photo_hash: str, prefs: dict, model: str) -> str:
+    blob = json.dumps([photo_hash, prefs, model], sort_keys=True, ensure_ascii=False)
+    return "o-" + hashlib.sha256(blob.encode("utf-8")).hexdigest()[:62]
+
+class BatchState:
+    # Persisted as JSON next to the output file:
+    #   analyses:  photo hash -> person_analysis
+    #   submitted: batch id -> {"kind": "analysis" | "outfit", "jobs": {custom_id: job}}
+    #   done:      custom ids whose results are already in the output
+
+    def __init__(self, path: str):
+        self.path = path
+        self.analyses, self.submitted, self.done = {}, {}, set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                raw = json.load(f)
+            self.analyses  = raw.get("analyses", {})
+            self.submitted = raw.get("submitted", {})
+            self.done      = set(raw.get("done", []))
+
+    def save(self) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"analyses": self.analyses, "submitted": self.submitted, "done": sorted(self.done)},
+                      f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+def chunked(requests: list, max_requests: int, max_bytes: int):
+    # Runs of requests within both the count cap and the serialized-size cap
+    chunk, size = [], 0
+    for request in requests:
+        n = len(json.dumps(request))
+        if chunk and (len(chunk) >= max_requests or size + n > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(request)
+        size += n
+    if chunk:
+        yield chunk
+
+def submit(client, state: BatchState, kind: str, jobs: dict, requests: list, chunk_size: int,
+           chunk_mb: float = MAX_BATCH_MB) -> None:
+    for chunk in chunked(requests, chunk_size, int(chunk_mb * 1024 * 1024)):
+        batch = client.messages.batches.create(requests=chunk)
+        state.submitted[batch.id] = {"kind": kind, "jobs": {r["custom_id"]: jobs[r["custom_id"]] for r in chunk}}
+        state.save()
+        log(f"Submitted {kind} batch {batch.id} ({len(chunk)} requests)")
+
+def wait_for(client, batch_id: str, poll_interval: float):
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            return batch
+        c = batch.request_counts
+        log(f"  {batch_id}: {c.processing} processing, {c.succeeded} succeeded, {c.errored} errored")
+        time.sleep(poll_interval)
+
+def collect(client, state: BatchState, out, poll_interval: float) -> None:
+    for batch_id in list(state.submitted):
+        entry = state.submitted[batch_id]
+        wait_for(client, batch_id, poll_interval)
+        n_ok = n_failed = 0
+
+        def fail(item, job, error: str) -> None:
+            # Left out of `done`, so the next run re-submits it
+            nonlocal n_failed
+            n_failed += 1
+            out.write(json.dumps({"custom_id": item.custom_id, "photo": job["photo"],
+                                  "prefs": job.get("prefs"), "error": error}, ensure_ascii=False) + "\n")
+
+        for item in client.messages.batches.results(batch_id):
+            job = entry["jobs"].get(item.custom_id)
+            if job is None or item.custom_id in state.done:
+                continue
+            if item.result.type != "succeeded":
+                fail(item, job, item.result.type)
+                continue
+            text = item.result.message.content[0].text
+            if entry["kind"] == "analysis":
+                try:
+                    state.analyses[job["photo_hash"]] = parse_result(text)
+                except json.JSONDecodeError:
+                    n_failed += 1
+                    continue
+            else:
+                # One unreadable result must not stop the rest of the batch being collected
+                try:
+                    try:
+                        looks = parse_result(text)
+                    except json.JSONDecodeError:
+                        looks = None
+                    if not isinstance(looks, dict):
+                        looks = salvage_looks(text)
+                    # Palettes normalised as in the app
+                    looks = {**looks, "outfits": [snap_outfit(o) for o in looks.get("outfits") or []]}
+                    n_missing, extras_missing = missing_parts(looks)
+                except Exception as e:
+                    fail(item, job, f"unreadable result: {type(e).__name__}: {e}"[:200])
+                    continue
+                out.write(json.dumps({
+                    "custom_id": item.custom_id,
+                    "photo": job["photo"],
+                    "prefs": job["prefs"],
+                    "result": {"person_analysis": state.analyses.get(job["photo_hash"], {}), **looks},
+                    "incomplete": bool(n_missing or extras_missing),
+                }, ensure_ascii=False) + "\n")
+                out.flush()
+            state.done.add(item.custom_id)
+            n_ok += 1
+        out.flush()
+        del state.submitted[batch_id]
+        state.save()
+        log(f"Collected {entry['kind']} batch {batch_id}: {n_ok} ok, {n_failed} failed")
+
+def run(args) -> None:
+    matrix = preference_matrix(args)
+    photos = scan_photos(args.photos)
+    if not photos:
+        raise SystemExit(f"No {'/'.join(PHOTO_EXTENSIONS)} photos found in {args.photos}")
+    log(f"{len(photos)} photos × {len(matrix)} preference sets")
+
+    import anthropic
+
+    state  = BatchState(args.state or f"{args.out}.state.json")
+    client = anthropic.Anthropic(base_url=args.base_url) if args.base_url else anthropic.Anthropic()
+
+    # Results written before a crash but after the last state save still count
+    if os.path.exists(args.out):
+        with open(args.out, encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if "result" in row:
+                    state.done.add(row["custom_id"])
+
+    with open(args.out, "a", encoding="utf-8") as out:
+        # Batches submitted by an interrupted run are collected, not re-sent
+        collect(client, state, out, args.poll_interval)
+
+        jobs, requests = {}, []
+        for p in photos:
+            if p["hash"] in state.analyses:
+                continue
+            custom_id = "a-" + p["hash"][:62]
+            jobs[custom_id] = {"photo": p["path"], "photo_hash": p["hash"]}
+            requests.append({"custom_id": custom_id,
+                             "params": build_analysis_request(p["mime"], img_to_b64(p["data"]), args.model)})
+        if requests:
+            submit(client, state, "analysis", jobs, requests, args.chunk_size, args.chunk_mb)
+            collect(client, state, out, args.poll_interval)
+
+        jobs, requests = {}, []
+        for p in photos:
+            analysis = state.analyses.get(p["hash"])
+            if analysis is None:
+                log(f"Skipping {p['path']}: no analysis")
+                continue
+            for prefs in matrix:
+                custom_id = outfit_custom_id(p["hash"], prefs, args.model)
+                if custom_id in state.done:
+                    continue
+                jobs[custom_id] = {"photo": p["path"], "photo_hash": p["hash"], "prefs": prefs}
+                requests.append({"custom_id": custom_id,
+                                 "params": build_outfit_request(analysis, prefs, args.model)})
+        if requests:
+            submit(client, state, "outfit", jobs, requests, args.chunk_size, args.chunk_mb)
+            collect(client, state, out, args.poll_interval)
+
+    n_looks = sum(1 for custom_id in state.done if custom_id.startswith("o-"))
+    log(f"Done — {n_looks} lookbooks in {args.out}")
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m fitlab.batch",
+        description="Generate lookbooks for a folder of photos via the Message Batches API.",
+    )
+    parser.add_argument("photos", help="folder of JPG/PNG/WEBP photos")
+    parser.add_argument("--out", default="lookbooks.jsonl", help="JSONL output (appended to)")
+    parser.add_argument("--state", help="resume state file (default: OUT.state.json)")
+    parser.add_argument("--styles", action="append",
+                        help="comma-separated set of 1–3 styles; repeat for more sets (default: Minimalist)")
+    parser.add_argument("--occasion", action="append", help="repeatable, or 'all'")
+    parser.add_argument("--season", action="append", help="repeatable, or 'all'")
+    parser.add_argument("--budget", action="append", help="repeatable, or 'all'")
+    parser.add_argument("--body-notes", default="")
+    parser.add_argument("--extra", default="")
+    parser.add_argument("--model", default=MODEL_STANDARD)
+    parser.add_argument("--chunk-size", type=int, default=MAX_BATCH_REQUESTS, help="requests per batch")
+    parser.add_argument("--chunk-mb", type=float, default=MAX_BATCH_MB, help="serialized megabytes per batch")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="seconds between status checks")
+    parser.add_argument("--base-url", help="API base URL, e.g. a local fitlab.stub_server")
+    run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Microbenchmarks for each stage of the generate path.
+
+    python -m fitlab.bench                      # run, compare with bench_baseline.json
+    python -m fitlab.bench --save               # run and store as the new baseline
+    python -m fitlab.bench -k parse -n 200      # only benchmarks matching "parse"
+
+Network stages run against an in-process ``StubServer`` with configurable
+latency and decode rate, so the numbers reflect this code, not the API. Each
+benchmark reports p50/p95/p99 in milliseconds. When a baseline exists, a
+benchmark whose p50 is slower by more than ``--tolerance`` counts as a
+regression, and the command exits 1. p95 gets twice the tolerance because a
+few outliers move it. Slowdowns under ``--min-delta-ms`` are ignored.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from .catalog import CatalogIndex, build_index, synthetic_products
+from .images import img_to_b64, preprocess_image
+from .palette import analyse_colours, snap_palette
+from .phash import BKTree, phash_of
+from .parsing import ResultStreamParser, parse_result, salvage_looks
+from .prompts import build_analysis_request, build_outfit_request
+from .render import result_html
+from .results import Preferences
+from .stub_server import SAMPLE_ANALYSIS, SAMPLE_EXTRAS, SAMPLE_LOOK, StubServer
+
+BENCHMARKS = {}
+
+def benchmark(name: str, network: bool = False, self_timed: bool = False):
+    # Registers a factory(ctx) -> zero-argument callable. A self_timed callable
+    # returns its own sample in seconds; otherwise its runtime is the sample.
+    def register(factory):
+        BENCHMARKS[name] = (factory, network, self_timed)
+        return factory
+    return register
+
+# ── Fixtures ──────────────────────────────────────────────────────────────────
+PHOTO_SIZES = {"phone": (3024, 4032), "webcam": (1280, 720)}
+RESULT_SIZES = (3, 6, 12)
+CATALOG_PRODUCTS = 100_000
+BENCH_PREFS  = Preferences(styles=["Minimalist", "Old Money"], occasion="Work", season="Winter",
+                           body_notes="petite", extra="earthy tones").as_dict()
+
+def synthetic_photo(size: tuple[int, int], fmt: str = "JPEG") -> bytes:
+    # Noise over a gradient compresses roughly like a real photo
+    from PIL import Image
+
+    w, h = size
+    noise = Image.effect_noise((w, h), 48)
+    ramp  = Image.linear_gradient("L").resize((w, h))
+    img   = Image.merge("RGB", (noise, ramp, Image.blend(noise, ramp, 0.5)))
+    buf = io.BytesIO()
+    img.save(buf, fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+def sample_result(n_looks: int) -> dict:
+    looks = [{**SAMPLE_LOOK, "name": f"{SAMPLE_LOOK['name']} {i + 1}"} for i in range(n_looks)]
+    return {"person_analysis": SAMPLE_ANALYSIS, "outfits": looks, **SAMPLE_EXTRAS}
+
+def sample_reply_text(n_looks: int) -> str:
+    data = sample_result(n_looks)
+    del data["person_analysis"]
+    return "```json\n" + json.dumps(data, indent=2, ensure_ascii=False) + "\n```"
+
+class Context:
+    def __init__(self, args):
+        self.args    = args
+        self._photos = {}
+        self._server = None
+        self._client = None
+        self._catalog = None
+
+    def photo(self, kind: str) -> dict:
+        if kind not in self._photos:
+            raw = synthetic_photo(PHOTO_SIZES[kind])
+            data, mime, _ = preprocess_image(raw)
+            self._photos[kind] = {"raw": raw, "data": data, "mime": mime, "b64": img_to_b64(data)}
+        return self._photos[kind]
+
+    def client(self):
+        # A scheduled client with no limits, so admission overhead is included
+        if self._client is None:
+            import anthropic
+
+            from .scheduler import ScheduledClient, Scheduler
+
+            self._server = StubServer(latency=self.args.latency, tokens_per_sec=self.args.tokens_per_sec)
+            self._server.start()
+            raw = anthropic.Anthropic(base_url=self._server.base_url, api_key="bench", max_retries=0)
+            self._client = ScheduledClient(raw, Scheduler(rpm=0, itpm=0, otpm=0))
+        return self._client
+
+    def catalog(self) -> CatalogIndex:
+        # Built once per run in a temporary directory
+        if self._catalog is None:
+            import tempfile
+
+            self._catalog_dir = tempfile.TemporaryDirectory()
+            build_index(synthetic_products(CATALOG_PRODUCTS), self._catalog_dir.name)
+            self._catalog = CatalogIndex(self._catalog_dir.name)
+        return self._catalog
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._server.stop()
+
+# ── Benchmarks ────────────────────────────────────────────────────────────────
+for _kind in PHOTO_SIZES:
+    @benchmark(f"image/preprocess {_kind}")
+    def _(ctx, kind=_kind):
+        raw = ctx.photo(kind)["raw"]
+        return lambda: preprocess_image(raw)
+
+for _kind in PHOTO_SIZES:
+    @benchmark(f"image/base64 {_kind}")
+    def _(ctx, kind=_kind):
+        data = ctx.photo(kind)["data"]
+        return lambda: img_to_b64(data)
+
+for _kind in PHOTO_SIZES:
+    @benchmark(f"image/colours {_kind}")
+    def _(ctx, kind=_kind):
+        data = ctx.photo(kind)["data"]
+        return lambda: analyse_colours(data)
+
+for _kind in PHOTO_SIZES:
+    @benchmark(f"image/phash {_kind}")
+    def _(ctx, kind=_kind):
+        data = ctx.photo(kind)["data"]
+        return lambda: phash_of(data)
+
+@benchmark("phash/lookup 10k")
+def _(ctx):
+    import random
+
+    rng  = random.Random(0)
+    tree = BKTree()
+    for i in range(10_000):
+        tree.add(rng.getrandbits(64), i)
+    probe = rng.getrandbits(64)
+    return lambda: tree.search(probe, 8)
+
+@benchmark("palette/snap")
+def _(ctx):
+    palette = ["#D8C7A8", "f4efe6", "#a7b", "rgb(166, 123, 91)", "navy", "#d8c7a9", "not a colour"]
+    return lambda: snap_palette(palette, [f"Colour {i}" for i in range(len(palette))])
+
+@benchmark("request/serialize analysis")
+def _(ctx):
+    photo = ctx.photo("phone")
+    return lambda: json.dumps(build_analysis_request(photo["mime"], photo["b64"])).encode("utf-8")
+
+@benchmark("request/serialize outfit")
+def _(ctx):
+    return lambda: json.dumps(build_outfit_request(SAMPLE_ANALYSIS, BENCH_PREFS)).encode("utf-8")
+
+for _n in RESULT_SIZES:
+    @benchmark(f"parse/json {_n} looks")
+    def _(ctx, n=_n):
+        text = sample_reply_text(n)
+        return lambda: parse_result(text)
+
+for _n in RESULT_SIZES:
+    @benchmark(f"parse/stream {_n} looks")
+    def _(ctx, n=_n):
+        # 16-character deltas, as the API streams them
+        text   = sample_reply_text(n)
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+
+        def run():
+            parser = ResultStreamParser()
+            for chunk in chunks:
+                for _ in parser.feed(chunk):
+                    pass
+        return run
+
+for _n in RESULT_SIZES:
+    @benchmark(f"parse/salvage {_n} looks")
+    def _(ctx, n=_n):
+        text = sample_reply_text(n)
+        text = text[: int(len(text) * 0.8)]
+        return lambda: salvage_looks(text)
+
+for _n in RESULT_SIZES:
+    @benchmark(f"render/html {_n} looks")
+    def _(ctx, n=_n):
+        data = sample_result(n)
+        return lambda: result_html(data, "Work", "Winter", "₹2K–5K")
+
+@benchmark("catalog/match 3 looks")
+def _(ctx):
+    catalog = ctx.catalog()
+    outfits = sample_result(3)["outfits"]
+    return lambda: catalog.match_outfits(outfits, "₹2K–5K")
+
+@benchmark("api/time-to-first-token", network=True, self_timed=True)
+def _(ctx):
+    client  = ctx.client()
+    request = build_outfit_request(SAMPLE_ANALYSIS, BENCH_PREFS)
+
+    def run():
+        start, first = time.perf_counter(), None
+        with client.messages.stream(**request) as stream:
+            for _ in stream.text_stream:
+                first = time.perf_counter() - start
+                break
+        if first is None:
+            raise RuntimeError("the stream ended without producing any text")
+        return first
+    return run
+
+@benchmark("api/outfit stream total", network=True)
+def _(ctx):
+    client  = ctx.client()
+    request = build_outfit_request(SAMPLE_ANALYSIS, BENCH_PREFS)
+
+    def run():
+        with client.messages.stream(**request) as stream:
+            stream.get_final_message()
+    return run
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+def percentiles(samples_ms: list) -> dict:
+    if len(samples_ms) < 2:
+        v = samples_ms[0] if samples_ms else 0.0
+        return {"p50": v, "p95": v, "p99": v}
+    q = statistics.quantiles(samples_ms, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+def run_benchmark(ctx: Context, name: str, iterations: int, warmup: int) -> dict:
+    factory, network, self_timed = BENCHMARKS[name]
+    fn = factory(ctx)
+    if network:
+        iterations = max(1, iterations // 10)
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        value = fn()
+        elapsed = time.perf_counter() - start
+        samples.append((value if self_timed else elapsed) * 1000)
+    return {"n": len(samples), **percentiles(samples)}
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for stat, allowed in (("p50", tolerance), ("p95", 2 * tolerance)):
+            if cur[stat] > base[stat] * (1 + allowed) and cur[stat] - base[stat] > min_delta_ms:
+                regressions.append(f"{name} {stat}: {base[stat]:.3f} → {cur[stat]:.3f} ms "
+                                   f"(+{(cur[stat] / base[stat] - 1) if base[stat] else 0:.0%})")
+    return regressions
+
+def environment(args) -> dict:
+    return {"python": platform.python_version(), "machine": platform.machine(),
+            "latency": args.latency, "tokens_per_sec": args.tokens_per_sec}
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m fitlab.bench", description=__doc__.splitlines()[0])
+    parser.add_argument("-k", "--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("-n", "--iterations", type=int, default=100, help="samples per benchmark (network: n/10)")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="stub decode rate (0 = instant)")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore slowdowns below this")
+    parser.add_argument("--json", help="also write this run's results here")
+    args = parser.parse_args(argv)
+
+    names = [n for n in BENCHMARKS if args.filter in n]
+    if not names:
+        raise SystemExit(f"No benchmark matches {args.filter!r}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+        baseline = stored.get("results", {})
+        if not args.save and stored.get("environment") != environment(args):
+            print(f"warning: baseline was recorded with {stored.get('environment')}", file=sys.stderr)
+
+    ctx = Context(args)
+    results = {}
+    width = max(len(n) for n in names)
+    print(f"{'benchmark':<{width}}  {'n':>4}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'vs base':>8}")
+    try:
+        for name in names:
+            r = results[name] = run_benchmark(ctx, name, args.iterations, args.warmup)
+            base = baseline.get(name)
+            delta = f"{r['p50'] / base['p50'] - 1:+.0%}" if base and base["p50"] else ""
+            print(f"{name:<{width}}  {r['n']:>4}  {r['p50']:>9.3f}  {r['p95']:>9.3f}  {r['p99']:>9.3f}  {delta:>8}")
+    finally:
+        ctx.close()
+
+    report = {"environment": environment(args), "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        # A filtered run only replaces the benchmarks it ran
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**report, "results": {**baseline, **results}}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print("\nRegressions:", *regressions, sep="\n  ")
+        sys.exit(1)
+    if baseline:
+        print("\nNo regressions against", args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Process-wide content-addressed store for photo bytes.
+
+Sessions keep only a photo's SHA-256; the bytes live here once per process,
+however many sessions (or reruns) refer to them. An in-memory LRU, bounded by
+total bytes, sits in front of an optional on-disk tier. The disk tier is
+written through on every put, and reads from it are memory-mapped, so they sit
+in the OS page cache rather than on the Python heap. Disk entries are evicted
+oldest-read first once the tier passes its size cap.
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from .cache import RESULT_CACHE_DIR
+
+BLOB_MEM_MB  = float(os.environ.get("FITLAB_BLOB_MEM_MB", 64))
+BLOB_DIR     = os.environ.get("FITLAB_BLOB_DIR") or (os.path.join(RESULT_CACHE_DIR, "blobs") if RESULT_CACHE_DIR else None)
+BLOB_DISK_MB = float(os.environ.get("FITLAB_BLOB_DISK_MB", 500))
+
+def blob_key(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class BlobStore:
+    def __init__(self, max_mem_bytes: int = int(BLOB_MEM_MB * 1024 * 1024), disk_dir: str | None = BLOB_DIR,
+                 max_disk_bytes: int = int(BLOB_DISK_MB * 1024 * 1024)):
+        self.max_mem_bytes  = max_mem_bytes
+        self.disk_dir       = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.mem_bytes = 0
+        self._mem  = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk       = None   # key -> size, least recently read first
+        self._disk_bytes = 0
+        self._disk_lock  = threading.Lock()
+        self.stats = {"puts": 0, "dedup": 0, "mem_hits": 0, "disk_hits": 0, "misses": 0, "evicted": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        with self._lock:
+            self.stats["puts"] += 1
+            if key in self._mem:
+                self.stats["dedup"] += 1
+                self._mem.move_to_end(key)
+                return key
+            self._mem[key] = bytes(data)
+            self.mem_bytes += len(data)
+            while self.mem_bytes > self.max_mem_bytes and len(self._mem) > 1:
+                _, old = self._mem.popitem(last=False)
+                self.mem_bytes -= len(old)
+                self.stats["evicted"] += 1
+        if self.disk_dir and not os.path.exists(self._path(key)):
+            self._disk_put(key, data)
+        return key
+
+    def get(self, key: str):
+        # bytes from memory, a read-only mmap (bytes-like) from disk, or None
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.stats["mem_hits"] += 1
+                return data
+        data = self._disk_get(key)
+        with self._lock:
+            self.stats["disk_hits" if data is not None else "misses"] += 1
+        return data
+
+    def has(self, key: str | None) -> bool:
+        if not key:
+            return False
+        with self._lock:
+            if key in self._mem:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._path(key))
+
+    def _disk_get(self, key: str):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(self._path(key))  # keep recently read blobs away from eviction after a restart
+        except (OSError, ValueError):  # ValueError: empty file
+            return None
+        with self._disk_lock:
+            if key in self._disk_index():
+                self._disk.move_to_end(key)
+        return data
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp  = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._disk_lock:
+            index = self._disk_index()
+            self._disk_bytes += len(data) - index.pop(key, 0)
+            index[key] = len(data)
+            while self._disk_bytes > self.max_disk_bytes and index:
+                old, size = index.popitem(last=False)
+                self._disk_bytes -= size
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+    def _disk_index(self) -> OrderedDict:
+        # Built from one scan of the directory, then kept up to date by puts
+        # and reads so eviction never has to list it again
+        if self._disk is None:
+            entries = []
+            for name in os.listdir(self.disk_dir):
+                if not name.endswith(".bin"):
+                    continue
+                try:
+                    info = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, name[:-len(".bin")], info.st_size))
+            self._disk       = OrderedDict((key, size) for _, key, size in sorted(entries))
+            self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "mem_items": len(self._mem), "mem_bytes": self.mem_bytes}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore()
+        return _store
@@ -0,0 +1,188 @@
+"""Content-addressed caches for person analyses and generated looks."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .constants import MODEL, PROMPT_VERSION
+
+RESULT_CACHE_SIZE   = int(os.environ.get("FITLAB_CACHE_SIZE", 256))
+RESULT_CACHE_DIR    = os.environ.get("FITLAB_CACHE_DIR") or None
+RESULT_CACHE_TTL    = float(os.environ.get("FITLAB_CACHE_TTL", 7 * 24 * 3600))
+RESULT_CACHE_MAX_MB = float(os.environ.get("FITLAB_CACHE_MAX_MB", 200))
+
+def _norm_text(text: str) -> str:
+    return " ".join((text or "").split()).casefold()
+
+def result_cache_key(photo_hash: str, prefs: dict, model: str = MODEL) -> str:
+    norm = {
+        "styles":     sorted(_norm_text(s) for s in prefs.get("styles", [])),
+        "occasion":   _norm_text(prefs.get("occasion", "")),
+        "season":     _norm_text(prefs.get("season", "")),
+        "budget":     _norm_text(prefs.get("budget", "")),
+        "body_notes": _norm_text(prefs.get("body_notes", "")),
+        "extra":      _norm_text(prefs.get("extra", "")),
+    }
+    blob = json.dumps([PROMPT_VERSION, model, photo_hash, norm], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    # In-memory LRU in front of an optional on-disk tier (one JSON file per key)
+    # with TTL and total-size eviction. Shared by every session in the process.
+    # An entry's TTL runs from when it was stored, whichever tier serves it.
+
+    def __init__(self, max_items: int = RESULT_CACHE_SIZE, disk_dir: str | None = RESULT_CACHE_DIR,
+                 ttl: float = RESULT_CACHE_TTL, max_disk_bytes: int = int(RESULT_CACHE_MAX_MB * 1024 * 1024)):
+        self.max_items      = max_items
+        self.disk_dir       = disk_dir
+        self.ttl            = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._mem  = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk       = None   # key -> (stored_at, size), least recently used first
+        self._disk_bytes = 0
+        self._disk_lock  = threading.Lock()
+        self.stats = {"mem_hits": 0, "disk_hits": 0, "misses": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.time() - stored_at <= self.ttl:
+                    self._mem.move_to_end(key)
+                    self.stats["mem_hits"] += 1
+                    return value
+                del self._mem[key]
+
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            stored_at, value = entry
+            self._mem_put(key, value, stored_at)
+        return value
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._mem_put(key, value)
+        if self.disk_dir:
+            self._disk_put(key, value)
+
+    def _mem_put(self, key: str, value, stored_at: float | None = None) -> None:
+        self._mem[key] = (time.time() if stored_at is None else stored_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def _disk_get(self, key: str):
+        # (stored_at, value), or None
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if time.time() - stored_at > self.ttl:
+                with self._disk_lock:
+                    self._disk_drop(key)
+                return None
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            # atime records the read for size eviction after a restart; mtime stays the store time
+            os.utime(path, (time.time(), stored_at))
+        except (OSError, json.JSONDecodeError):
+            return None
+        with self._disk_lock:
+            if key in self._disk_index():
+                self._disk.move_to_end(key)
+        return stored_at, value
+
+    def _disk_put(self, key: str, value) -> None:
+        path = self._path(key)
+        tmp  = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            info = os.stat(path)
+        except OSError:
+            return
+        with self._disk_lock:
+            index = self._disk_index()
+            _, size = index.pop(key, (0, 0))
+            index[key] = (info.st_mtime, info.st_size)
+            self._disk_bytes += info.st_size - size
+            self._disk_evict()
+
+    def _disk_index(self) -> OrderedDict:
+        # Built from one scan of the directory, then kept up to date by puts
+        # and reads so eviction never has to list it again
+        if self._disk is None:
+            entries, now = [], time.time()
+            for name in os.listdir(self.disk_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                if now - info.st_mtime > self.ttl:
+                    _remove(path)
+                    continue
+                entries.append((max(info.st_atime, info.st_mtime), name[:-len(".json")], info.st_mtime, info.st_size))
+            self._disk       = OrderedDict((key, (stored_at, size)) for _, key, stored_at, size in sorted(entries))
+            self._disk_bytes = sum(size for _, size in self._disk.values())
+        return self._disk
+
+    def _disk_drop(self, key: str) -> None:
+        _, size = self._disk_index().pop(key, (0, 0))
+        self._disk_bytes -= size
+        _remove(self._path(key))
+
+    def _disk_evict(self) -> None:
+        # Least recently used first, plus any expired entries that reach the front
+        now = time.time()
+        while self._disk and (self._disk_bytes > self.max_disk_bytes
+                              or now - next(iter(self._disk.values()))[0] > self.ttl):
+            self._disk_drop(next(iter(self._disk)))
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+_result_cache   = None
+_analysis_cache = None
+_caches_lock    = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    with _caches_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+def get_analysis_cache() -> ResultCache:
+    # Kept apart from results so a burst of preference tweaks can't evict analyses
+    global _analysis_cache
+    with _caches_lock:
+        if _analysis_cache is None:
+            _analysis_cache = ResultCache(
+                disk_dir=os.path.join(RESULT_CACHE_DIR, "analysis") if RESULT_CACHE_DIR else None
+            )
+        return _analysis_cache
+
+def analysis_cache_key(photo_hash: str, model: str = MODEL) -> str:
+    return hashlib.sha256(f"analysis:{PROMPT_VERSION}:{model}:{photo_hash}".encode()).hexdigest()
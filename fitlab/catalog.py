@@ -0,0 +1,335 @@
+"""Shoppable products for generated pieces, matched offline against a catalog export.
+
+    python -m fitlab.catalog build products.csv --out catalog/
+    python -m fitlab.catalog build --synthetic 1000000 --out /tmp/catalog   # fake data
+    python -m fitlab.catalog query catalog/ --type Shoes --budget "₹2K–5K" "tan leather loafers"
+
+The export is CSV or JSON Lines with ``sku``, ``title``, ``category`` and
+``price`` (rupees). It may also have ``brand``, ``colour``, ``description``
+and ``url``. The builder maps each category onto the piece types the model
+writes (Top, Bottom, Shoes, Bag, Accessory) and numbers products so each type
+is one contiguous block of ids. It then writes a BM25 inverted index as flat
+NumPy arrays. Each term's postings are sorted by product id and hold the
+term's precomputed BM25 weight, so a score is just a sum.
+
+Queries memory-map the arrays. All pieces of a result are scored in one
+batch. Each piece reads only the part of its terms' postings that falls in its
+type's block, so a Shoes piece never touches tops. All of those parts become
+one array, scored with a single ``np.bincount``. A budget band from ``BUDGETS``
+is split across the piece types, and products priced outside a piece's share
+are dropped (as are unpriced ones, whenever a budget is given).
+
+Set ``FITLAB_CATALOG`` to the index directory to show the top matches under
+each piece.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from .constants import BUDGET_RANGES
+
+CATALOG_DIR = os.environ.get("FITLAB_CATALOG") or None
+CATALOG_TOP = int(os.environ.get("FITLAB_CATALOG_TOP", 3))
+
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B  = 0.75
+MIN_MATCH = 0.5          # share of a piece's terms a product must contain
+TITLE_WEIGHT = 2         # title terms count this many times towards tf
+
+TYPES = ["Top", "Bottom", "Shoes", "Bag", "Accessory", "Other"]
+# A piece's share of the outfit budget
+PRICE_SHARE = {"Top": 0.3, "Bottom": 0.25, "Shoes": 0.25, "Bag": 0.2, "Accessory": 0.1}
+# Catalog categories and piece types the model sometimes writes, by the type
+# they fall under; anything else is "Other".
+TYPE_WORDS = {
+    "Top": "top tops shirt shirts tshirt t-shirt tee tees blouse blouses sweater sweaters jumper knitwear "
+           "hoodie hoodies sweatshirt cardigan jacket jackets blazer blazers coat coats outerwear kurta kurti "
+           "dress dresses jumpsuit vest waistcoat polo tank camisole",
+    "Bottom": "bottom bottoms trousers trouser pants jeans denim skirt skirts shorts chinos leggings joggers "
+              "palazzo culottes",
+    "Shoes": "shoes shoe footwear sneakers trainers boots boot loafers heels sandals flats mules oxfords "
+             "brogues pumps espadrilles",
+    "Bag": "bag bags handbag handbags tote totes backpack clutch purse satchel crossbody wallet",
+    "Accessory": "accessory accessories jewellery jewelry earrings necklace bracelet ring rings watch watches "
+                 "belt belts hat hats cap caps scarf scarves sunglasses eyewear tie ties socks gloves",
+}
+_TYPE_OF = {w: t for t, words in TYPE_WORDS.items() for w in words.split()}
+
+STOPWORDS = frozenset("a an and the of in on with for to by or at from as is it its this that".split())
+TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> list:
+    # Lower-cased words, digits kept, with plural "s" dropped so "loafers"
+    # finds "loafer"
+    out = []
+    for t in TOKEN.findall((text or "").lower()):
+        if t in STOPWORDS or len(t) < 2:
+            continue
+        if len(t) > 3 and t.endswith("s") and not t.endswith("ss"):
+            t = t[:-1]
+        out.append(t)
+    return out
+
+def piece_type(value: str) -> str:
+    # "Shoes", "Sneakers", "Women > Footwear > Boots" -> "Shoes"; unknown -> "Other"
+    if value in PRICE_SHARE:
+        return value
+    for word in reversed(re.findall(r"[a-z-]+", (value or "").lower())):
+        if word in _TYPE_OF:
+            return _TYPE_OF[word]
+    return "Other"
+
+def price_band(budget: str | None, type_: str) -> tuple[float, float]:
+    # The piece's share of the outfit budget, widened so a good match just
+    # outside it isn't lost. Unknown budgets and types aren't filtered.
+    if budget not in BUDGET_RANGES or type_ not in PRICE_SHARE:
+        return 0.0, math.inf
+    low, high = BUDGET_RANGES[budget]
+    share = PRICE_SHARE[type_]
+    return low * share * 0.5, (high * share * 1.5 if high else math.inf)
+
+# ── Build ─────────────────────────────────────────────────────────────────────
+def read_products(path: str):
+    if path.endswith((".jsonl", ".ndjson", ".json")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+
+def synthetic_products(n: int, seed: int = 0):
+    # Plausible fake products, for trying the index and timing it at scale
+    import random
+
+    rng = random.Random(seed)
+    colours = ("black white ivory oat camel tan navy olive charcoal grey beige rust burgundy sage cream "
+               "chocolate blush denim mustard emerald").split()
+    fabrics = "linen cotton wool silk leather suede denim knit satin cashmere canvas jersey".split()
+    fits    = "relaxed slim oversized tailored cropped high-waist wide-leg straight structured soft".split()
+    kinds   = {
+        "Top":       "shirt blouse blazer sweater cardigan tee kurta jacket coat hoodie".split(),
+        "Bottom":    "trousers jeans skirt shorts chinos joggers culottes".split(),
+        "Shoes":     "loafers sneakers boots heels sandals mules oxfords flats".split(),
+        "Bag":       "tote crossbody clutch backpack satchel".split(),
+        "Accessory": "earrings necklace belt watch scarf sunglasses hat bracelet".split(),
+    }
+    prices  = {"Top": (400, 9000), "Bottom": (400, 8000), "Shoes": (500, 12000), "Bag": (300, 15000),
+               "Accessory": (150, 6000)}
+    brands  = "Aarav Meher Kora Loom Sitara Vayu Noor Indigo Terra Sable".split()
+    for i in range(n):
+        type_ = rng.choice(list(kinds))
+        kind  = rng.choice(kinds[type_])
+        title = f"{rng.choice(colours).title()} {rng.choice(fabrics)} {rng.choice(fits)} {kind}"
+        lo, hi = prices[type_]
+        yield {"sku": f"SKU{i:07d}", "title": title, "category": kind, "brand": rng.choice(brands),
+               "price": round(math.exp(rng.uniform(math.log(lo), math.log(hi))), -1),
+               "url": f"https://shop.example/p/SKU{i:07d}"}
+
+def build_index(products, out_dir: str, log=None) -> dict:
+    import numpy as np
+
+    log = log or (lambda msg: None)
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.monotonic()
+
+    rows = []
+    for p in products:
+        try:
+            price = float(str(p.get("price") or "").replace(",", "").lstrip("₹") or "nan")
+        except ValueError:
+            price = math.nan
+        if not p.get("sku") or not p.get("title"):
+            continue
+        type_ = piece_type(p.get("category") or "")
+        if type_ == "Other":
+            type_ = piece_type(p["title"])
+        rows.append((TYPES.index(type_), price, p))
+    # Products of one type get consecutive ids
+    rows.sort(key=lambda r: r[0])
+    log(f"read {len(rows):,} products in {time.monotonic() - start:.1f}s")
+
+    vocab, term_ids, doc_ids, tfs = {}, [], [], []
+    lengths = np.zeros(len(rows), dtype=np.float32)
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    with open(os.path.join(out_dir, "products.jsonl"), "wb") as docs:
+        for doc, (_, price, p) in enumerate(rows):
+            text = " ".join(str(p.get(k) or "") for k in ("brand", "colour", "category", "description"))
+            counts = Counter(tokenize(text))
+            for t in tokenize(p["title"]):
+                counts[t] += TITLE_WEIGHT
+            for t, tf in counts.items():
+                term_ids.append(vocab.setdefault(t, len(vocab)))
+                doc_ids.append(doc)
+                tfs.append(tf)
+            lengths[doc] = sum(counts.values())
+            line = json.dumps({"sku": str(p["sku"]), "title": str(p["title"]), "price": price,
+                               "brand": str(p.get("brand") or ""), "url": str(p.get("url") or "")},
+                              ensure_ascii=False).encode("utf-8") + b"\n"
+            offsets[doc + 1] = offsets[doc] + len(line)
+            docs.write(line)
+    log(f"tokenized {len(term_ids):,} postings, {len(vocab):,} terms in {time.monotonic() - start:.1f}s")
+
+    term_ids = np.asarray(term_ids, dtype=np.int32)
+    doc_ids  = np.asarray(doc_ids, dtype=np.int32)
+    tfs      = np.asarray(tfs, dtype=np.float32)
+    # Postings grouped by term, product ids ascending within each term
+    order    = np.lexsort((doc_ids, term_ids))
+    term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+
+    n_docs = len(rows)
+    df     = np.bincount(term_ids, minlength=len(vocab)).astype(np.float32)
+    idf    = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avgdl  = float(lengths.mean()) if n_docs else 1.0
+    norm   = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / avgdl)
+    weights = (idf[term_ids] * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32)
+
+    types = np.asarray([r[0] for r in rows], dtype=np.int8)
+    np.save(os.path.join(out_dir, "term_ptr.npy"), np.concatenate([[0], np.cumsum(df)]).astype(np.int64))
+    np.save(os.path.join(out_dir, "doc_ids.npy"), doc_ids)
+    np.save(os.path.join(out_dir, "weights.npy"), weights)
+    np.save(os.path.join(out_dir, "prices.npy"), np.asarray([r[1] for r in rows], dtype=np.float32))
+    np.save(os.path.join(out_dir, "type_start.npy"),
+            np.searchsorted(types, np.arange(len(TYPES) + 1)).astype(np.int64))
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False, separators=(",", ":"))
+    meta = {"version": INDEX_VERSION, "products": n_docs, "terms": len(vocab), "postings": len(doc_ids),
+            "avgdl": avgdl, "types": TYPES, "built_s": round(time.monotonic() - start, 1)}
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    log(f"wrote {out_dir} in {meta['built_s']}s")
+    return meta
+
+# ── Query ─────────────────────────────────────────────────────────────────────
+class CatalogIndex:
+    def __init__(self, path: str):
+        import numpy as np
+
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path} was built by another version of fitlab.catalog; rebuild it")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.term_ptr   = load("term_ptr")
+        self.doc_ids    = load("doc_ids")
+        self.weights    = load("weights")
+        self.prices     = load("prices")
+        self.type_start = np.asarray(load("type_start"))
+        self.offsets    = load("offsets")
+        self._docs = open(os.path.join(path, "products.jsonl"), "rb")
+        self._lock = threading.Lock()
+
+    def _product(self, doc: int) -> dict:
+        with self._lock:
+            self._docs.seek(int(self.offsets[doc]))
+            return json.loads(self._docs.readline())
+
+    def match(self, queries: list, budget: str | None = None, k: int = CATALOG_TOP) -> list:
+        # queries: [(piece type, item text)]. Returns one list per query of up
+        # to k products, best first, each with its BM25 "score".
+        import numpy as np
+
+        segments, parts_idx, parts_w = [], [], []
+        size = 0
+        for type_, text in queries:
+            t = TYPES.index(piece_type(type_))
+            lo, hi = (int(self.type_start[t]), int(self.type_start[t + 1])) if t < len(TYPES) - 1 \
+                else (0, int(self.type_start[-1]))
+            terms = [self.vocab[w] for w in dict.fromkeys(tokenize(text)) if w in self.vocab]
+            for term in terms:
+                a, b = int(self.term_ptr[term]), int(self.term_ptr[term + 1])
+                docs = self.doc_ids[a:b]
+                i, j = np.searchsorted(docs, (lo, hi))
+                parts_idx.append(docs[i:j].astype(np.int64) + (size - lo))
+                parts_w.append(self.weights[a + i:a + j])
+            segments.append((size, lo, hi, len(terms), price_band(budget, piece_type(type_))))
+            size += hi - lo
+
+        if not parts_idx:
+            return [[] for _ in queries]
+        idx    = np.concatenate(parts_idx)
+        scores = np.bincount(idx, weights=np.concatenate(parts_w), minlength=size)
+        hits   = np.bincount(idx, minlength=size)
+
+        out = []
+        for offset, lo, hi, n_terms, (p_min, p_max) in segments:
+            seg_scores, seg_hits = scores[offset:offset + hi - lo], hits[offset:offset + hi - lo]
+            cand = np.flatnonzero(seg_hits >= max(1, math.ceil(n_terms * MIN_MATCH)))
+            if len(cand) and (p_min > 0 or p_max < math.inf):
+                price = self.prices[cand + lo]
+                cand  = cand[(price >= p_min) & (price <= p_max)]
+            if len(cand) > k:
+                cand = cand[np.argpartition(-seg_scores[cand], k)[:k]]
+            best = sorted(cand, key=lambda c: -seg_scores[c])
+            out.append([{**self._product(int(c) + lo), "score": round(float(seg_scores[c]), 3)} for c in best])
+        return out
+
+    def match_outfits(self, outfits: list, budget: str | None = None, k: int = CATALOG_TOP) -> list:
+        # Copies of the outfits with "products" added to each piece, all pieces
+        # matched in one batch
+        pieces = [(i, j, p) for i, o in enumerate(outfits) if isinstance(o, dict)
+                  for j, p in enumerate(o.get("pieces") or []) if isinstance(p, dict)]
+        found  = self.match([(p.get("type", ""), p.get("item", "")) for _, _, p in pieces], budget, k)
+        outfits = [{**o, "pieces": list(o.get("pieces") or [])} if isinstance(o, dict) else o for o in outfits]
+        for (i, j, p), products in zip(pieces, found):
+            outfits[i]["pieces"][j] = {**p, "products": products}
+        return outfits
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> CatalogIndex | None:
+    # None when no catalog is configured
+    global _catalog
+    if not CATALOG_DIR:
+        return None
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = CatalogIndex(CATALOG_DIR)
+        return _catalog
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build an index from a catalog export")
+    build.add_argument("export", nargs="?", help="CSV or JSONL export")
+    build.add_argument("--out", required=True, help="index directory")
+    build.add_argument("--synthetic", type=int, default=0, metavar="N", help="index N fake products instead")
+    query = sub.add_parser("query", help="match one piece against an index")
+    query.add_argument("index")
+    query.add_argument("item")
+    query.add_argument("--type", default="Other", help="piece type, e.g. Top or Shoes")
+    query.add_argument("--budget", choices=list(BUDGET_RANGES))
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    log = lambda msg: print(msg, file=sys.stderr, flush=True)
+    if args.command == "build":
+        if not (args.export or args.synthetic):
+            parser.error("give an export file or --synthetic N")
+        products = synthetic_products(args.synthetic) if args.synthetic else read_products(args.export)
+        build_index(products, args.out, log)
+        return
+
+    index = CatalogIndex(args.index)
+    start = time.perf_counter()
+    [products] = index.match([(args.type, args.item)], args.budget, args.k)
+    log(f"{len(products)} matches in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for p in products:
+        print(f"{p['score']:7.3f}  ₹{p['price']:>8,.0f}  {p['sku']}  {p['title']}")
+
+if __name__ == "__main__":
+    main()
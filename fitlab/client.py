@@ -0,0 +1,61 @@
+"""Process-wide pooled Anthropic clients behind the rate-limit scheduler.
+
+``anthropic`` is imported on first use.
+"""
+
+import os
+import threading
+
+from .scheduler import ScheduledClient, get_scheduler
+
+CLIENT_MAX_CONNECTIONS  = int(os.environ.get("FITLAB_MAX_CONNECTIONS", 50))
+CLIENT_MAX_KEEPALIVE    = int(os.environ.get("FITLAB_MAX_KEEPALIVE", 20))
+CLIENT_KEEPALIVE_EXPIRY = float(os.environ.get("FITLAB_KEEPALIVE_EXPIRY", 120))
+CLIENT_CONNECT_TIMEOUT  = float(os.environ.get("FITLAB_CONNECT_TIMEOUT", 5))
+CLIENT_READ_TIMEOUT     = float(os.environ.get("FITLAB_READ_TIMEOUT", 120))
+
+def _http_options() -> dict:
+    import anthropic
+
+    # The SDK only re-exports its default Limits instance, so build ours from its type
+    limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=CLIENT_MAX_KEEPALIVE,
+        keepalive_expiry=CLIENT_KEEPALIVE_EXPIRY,
+    )
+    timeout = anthropic.Timeout(CLIENT_READ_TIMEOUT, connect=CLIENT_CONNECT_TIMEOUT)
+    return {"limits": limits, "timeout": timeout}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> ScheduledClient:
+    # One client (and connection pool) per process, so every session reuses warm
+    # TLS connections instead of handshaking on each generation.
+    global _client
+    with _client_lock:
+        if _client is None:
+            import anthropic
+
+            opts = _http_options()
+            # Retries are the scheduler's job, so they respect the shared limits
+            raw = anthropic.Anthropic(
+                http_client=anthropic.DefaultHttpxClient(**opts),
+                timeout=opts["timeout"],
+                max_retries=0,
+            )
+            _client = ScheduledClient(raw, get_scheduler())
+        return _client
+
+def make_async_client() -> ScheduledClient:
+    # Async connection pools are bound to the event loop that opened them, and
+    # each fan-out runs in its own loop, so this client is per-generation.
+    import anthropic
+
+    opts = _http_options()
+    raw = anthropic.AsyncAnthropic(
+        http_client=anthropic.DefaultAsyncHttpxClient(**opts),
+        timeout=opts["timeout"],
+        max_retries=0,
+    )
+    return ScheduledClient(raw, get_scheduler(), is_async=True)
@@ -0,0 +1,18 @@
+"""Style vocabularies and model settings shared by the app and batch tools."""
+
+STYLES = [
+    "Streetwear", "Minimalist", "Business Casual", "Boho", "Y2K",
+    "Old Money", "Grunge", "Cottagecore", "Athleisure", "Avant-Garde",
+    "Coastal", "Dark Academia", "Preppy", "Maximalist", "Androgynous"
+]
+
+OCCASIONS = ["Everyday", "Work", "Date Night", "Party", "Outdoor", "Formal", "Festival", "Travel"]
+SEASONS   = ["Spring", "Summer", "Autumn", "Winter", "All-Season"]
+BUDGETS   = ["Under ₹2K", "₹2K–5K", "₹5K–10K", "₹10K–20K", "Luxury"]
+# Whole-outfit spend in rupees for each budget; None = no ceiling
+BUDGET_RANGES = dict(zip(BUDGETS, [(0, 2000), (2000, 5000), (5000, 10000), (10000, 20000), (20000, None)]))
+
+MODEL = "claude-sonnet-4-20250514"
+N_LOOKS = 3
+# Bump whenever the prompt or response schema changes so stale cache entries are ignored
+PROMPT_VERSION = 4
@@ -0,0 +1,445 @@
+"""The generation pipeline: vision analysis, outfit styling and response recovery.
+
+    from fitlab import generate_looks
+    result = generate_looks(open("me.jpg", "rb").read(), {"styles": ["Minimalist"], "occasion": "Work"})
+"""
+
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+from .blobs import get_blob_store
+from .cache import analysis_cache_key, get_analysis_cache, get_result_cache, result_cache_key
+from .client import get_client, make_async_client
+from .constants import N_LOOKS
+from .images import img_to_b64, preprocess_image
+from .palette import analyse_colours, snap_outfit
+from .phash import get_photo_index, phash_of
+from .parsing import ResultStreamParser, missing_parts, parse_result, salvage_looks, valid_look
+from .prompts import (build_analysis_request, build_extras_request, build_look_edit_request, build_look_request,
+                      build_outfit_request, build_piece_request)
+from .results import Preferences, Result
+from .routing import get_router, note_fallback, track_fallbacks
+from .scheduler import Cancelled, SchedulerBusy, check_cancelled, queue_feedback
+from .singleflight import get_analysis_flights, get_generation_flights
+from .telemetry import current_span, span
+from .usage import UsageMeter, get_usage_meter
+
+STREAM_RESULTS     = os.environ.get("FITLAB_STREAM", "1") != "0"
+FANOUT_LOOKS       = os.environ.get("FITLAB_FANOUT", "0") == "1"
+FANOUT_CONCURRENCY = int(os.environ.get("FITLAB_FANOUT_CONCURRENCY", 4))
+FANOUT_TIMEOUT     = float(os.environ.get("FITLAB_FANOUT_TIMEOUT", 60))
+
+CONTINUATION_MAX_TOKENS = 1200
+
+class PhotoExpired(LookupError):
+    pass
+
+@dataclass
+class Photo:
+    # A handle on a prepared photo; the bytes live in the shared blob store
+    hash: str
+    mime: str
+    stats: dict = field(default_factory=dict)
+    colours: dict = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        # What caches are keyed on: an earlier near-identical photo, if any
+        return self.stats.get("match") or self.hash
+
+    @property
+    def data(self):
+        data = get_blob_store().get(self.hash)
+        if data is None:
+            raise PhotoExpired("The photo is no longer in memory. Please upload it again.")
+        return data
+
+    @property
+    def b64(self) -> str:
+        # Encoded on demand: only an analysis request that misses the cache needs it
+        return img_to_b64(self.data)
+
+def continuation_request(request: dict, partial: str) -> dict:
+    # Prefills the truncated reply as the assistant turn so the model writes only
+    # the missing tail instead of regenerating everything.
+    return {
+        **request,
+        "max_tokens": CONTINUATION_MAX_TOKENS,
+        "messages": request["messages"] + [{"role": "assistant", "content": partial}],
+    }
+
+def continue_response(client, request: dict, partial: str, meter: UsageMeter | None = None) -> str:
+    partial = partial.rstrip()
+    response = client.messages.create(**continuation_request(request, partial))
+    if meter:
+        meter.add(response.usage)
+    return partial + response.content[0].text
+
+def routed_create(client, route: str, request: dict, prefs: dict | None = None) -> tuple:
+    # Sends the request on the route's model tier (falling back to the other
+    # tier if it's slow or fails) and returns (request as sent, response)
+    def send(model, tier_client):
+        sent = {**request, "model": model}
+        return sent, tier_client.messages.create(**sent)
+    return get_router().call(route, send, client, prefs)
+
+def finish_response(client, request: dict, response, meter: UsageMeter | None = None) -> str:
+    text = response.content[0].text
+    if response.stop_reason == "max_tokens":
+        text = continue_response(client, request, text, meter)
+    return text
+
+def fill_missing_looks(client, looks: dict, analysis: dict, prefs: dict,
+                       meter: UsageMeter | None = None) -> dict:
+    # Re-requests only the looks (and extras) that are still missing or invalid
+    # after parsing, one small request each.
+    outfits = [o for o in looks.get("outfits", []) if valid_look(o)][:N_LOOKS]
+    n_missing, extras_missing = missing_parts(looks)
+    styles = prefs["styles"]
+    for i in range(len(outfits), len(outfits) + n_missing):
+        request = build_look_request(analysis, prefs, styles[i % len(styles)], i + 1)
+        request, response = routed_create(client, "look", request, prefs)
+        if meter:
+            meter.add(response.usage)
+        outfit = parse_result(finish_response(client, request, response, meter))
+        if valid_look(outfit):
+            outfits.append(outfit)
+    looks = {**looks, "outfits": outfits}
+    if extras_missing:
+        request, response = routed_create(client, "extras", build_extras_request(analysis, prefs), prefs)
+        if meter:
+            meter.add(response.usage)
+        looks.update(parse_result(finish_response(client, request, response, meter)))
+    return looks
+
+def finish_looks(client, request: dict, response, analysis: dict, prefs: dict,
+                 meter: UsageMeter | None = None) -> dict:
+    text = finish_response(client, request, response, meter)
+    with span("parse", kind="looks", chars=len(text)) as s:
+        try:
+            looks = parse_result(text)
+            if not isinstance(looks, dict):
+                raise json.JSONDecodeError("expected a JSON object", text, 0)
+        except json.JSONDecodeError:
+            looks = salvage_looks(text)
+            s.set(salvaged=True)
+        s.set(n_looks=len(looks.get("outfits", [])))
+    if any(missing_parts(looks)):
+        looks = fill_missing_looks(client, looks, analysis, prefs, meter)
+    return looks
+
+def get_person_analysis(client, photo: Photo, meter: UsageMeter | None = None) -> dict:
+    cache = get_analysis_cache()
+    key   = analysis_cache_key(photo.key, get_router().model_for("analysis"))
+    analysis = cache.get(key)
+    if analysis is None:
+        def run() -> dict:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached, False
+            colours = photo.colours
+            with span("request.build", kind="analysis"):
+                request = build_analysis_request(photo.mime, photo.b64, colours=colours)
+            request, response = routed_create(client, "analysis", request)
+            if meter:
+                meter.add(response.usage)
+            text = finish_response(client, request, response, meter)
+            with span("parse", kind="analysis", chars=len(text)):
+                result = parse_result(text)
+            if colours:
+                result["colours"] = colours
+            # Only the primary model's analysis is cached under its key
+            fell_back = request["model"] != get_router().model_for("analysis")
+            if not fell_back:
+                cache.put(key, result)
+            return result, fell_back
+
+        # joined=True: the analysis was already running, usually started on upload
+        with span("analysis") as s:
+            (analysis, fell_back), joined = get_analysis_flights().do(key, run)
+            s.set(joined=joined)
+        if fell_back:
+            # Also when joined: a lookbook built on it mustn't be cached either
+            note_fallback("analysis")
+    if photo.stats.get("phash"):
+        get_photo_index().add(int(photo.stats["phash"], 16), photo.key, photo.colours.get("skin"))
+    return analysis
+
+def stream_looks(client, analysis: dict, prefs: dict, on_look=None, meter: UsageMeter | None = None) -> dict:
+    with span("request.build", kind="looks"):
+        request = build_outfit_request(analysis, prefs)
+
+    def send(model, tier_client):
+        sent   = {**request, "model": model}
+        parser = ResultStreamParser()
+        with tier_client.messages.stream(**sent) as stream:
+            # The scheduler's api.call span: time to first token after the
+            # connection opened, then time spent decoding the rest
+            call, opened, first = current_span(), time.monotonic(), None
+            for text in stream.text_stream:
+                # Leaving the block closes the connection, so a cancelled job
+                # stops paying for output nobody will read
+                check_cancelled()
+                if first is None:
+                    first = time.monotonic()
+                for kind, idx, obj in parser.feed(text):
+                    if kind == "outfit" and on_look:
+                        on_look(idx, obj)
+            response = stream.get_final_message()
+            if call is not None and first is not None:
+                call.set(ttft_ms=round((first - opened) * 1000 + call.attributes.get("open_ms", 0), 1),
+                         decode_ms=round((time.monotonic() - first) * 1000, 1))
+        return sent, response
+
+    # A fallback re-streams from scratch; its looks replace any already shown
+    request, response = get_router().call("looks", send, client, prefs)
+    if meter:
+        meter.add(response.usage)
+    return finish_looks(client, request, response, analysis, prefs, meter)
+
+def create_looks(client, analysis: dict, prefs: dict, meter: UsageMeter | None = None) -> dict:
+    with span("request.build", kind="looks"):
+        request = build_outfit_request(analysis, prefs)
+    request, response = routed_create(client, "looks", request, prefs)
+    if meter:
+        meter.add(response.usage)
+    return finish_looks(client, request, response, analysis, prefs, meter)
+
+async def generate_looks_fanout(analysis: dict, prefs: dict, on_look=None,
+                                meter: UsageMeter | None = None) -> tuple[dict, list]:
+    # One request per look (each slanted towards one of the chosen styles) plus
+    # one for the wardrobe-level extras, all in flight at once. A truncated reply
+    # is continued like finish_response does; one that fails or exceeds
+    # FANOUT_TIMEOUT is reported and left out without holding up the rest.
+    # Parts that are missing or don't parse are for fill_missing_looks.
+    import asyncio
+
+    import anthropic
+
+    styles  = prefs["styles"]
+    router  = get_router()
+    sem     = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    outfits = [None] * N_LOOKS
+    extras, failures = {}, []
+
+    async with make_async_client() as client:
+        async def send(model, tier_client, request):
+            sent = {**request, "model": model}
+            return sent, await asyncio.wait_for(tier_client.messages.create(**sent), FANOUT_TIMEOUT)
+
+        async def run(idx, route, request):
+            try:
+                async with sem:
+                    sent, response = await router.acall(
+                        route, lambda model, tier_client: send(model, tier_client, request), client, prefs)
+                    if meter:
+                        meter.add(response.usage)
+                    text = response.content[0].text
+                    if response.stop_reason == "max_tokens":
+                        text = text.rstrip()
+                        tail = await asyncio.wait_for(
+                            client.messages.create(**continuation_request(sent, text)), FANOUT_TIMEOUT)
+                        if meter:
+                            meter.add(tail.usage)
+                        text += tail.content[0].text
+            except (asyncio.TimeoutError, anthropic.APIError, SchedulerBusy) as e:
+                return idx, None, e
+            try:
+                return idx, parse_result(text), None
+            except json.JSONDecodeError:
+                return idx, None, None
+
+        tasks = [
+            run(i, "look", build_look_request(analysis, prefs, styles[i % len(styles)], i + 1))
+            for i in range(N_LOOKS)
+        ]
+        tasks.append(run(None, "extras", build_extras_request(analysis, prefs)))
+
+        for next_done in asyncio.as_completed(tasks):
+            idx, obj, err = await next_done
+            if err is not None:
+                failures.append((idx, err))
+            elif obj is None:
+                continue
+            elif idx is None:
+                extras = obj if isinstance(obj, dict) else {}
+            else:
+                outfits[idx] = obj
+                if on_look and valid_look(obj):
+                    on_look(idx, obj)
+
+    result = {"outfits": [o for o in outfits if o is not None], **extras}
+    return result, failures
+
+def prepare_photo(image_bytes: bytes) -> Photo:
+    with span("upload", bytes=len(image_bytes)) as s:
+        data, mime, stats = preprocess_image(image_bytes)
+        stats["sha256"] = get_blob_store().put(data)
+        with span("upload.colours"):
+            colours = analyse_colours(data)
+        with span("upload.phash") as p:
+            phash = phash_of(data)
+            match, bits = get_photo_index().lookup(phash, stats["sha256"], colours.get("skin"))
+            stats["phash"] = f"{phash:016x}"
+            if match and match != stats["sha256"]:
+                stats["match"], stats["match_bits"] = match, bits
+            p.set(match="miss" if match is None else "near" if "match" in stats else "exact", bits=bits)
+        s.set(image_size="{}x{}".format(*stats["size"]), image_tokens=stats["tokens"],
+              tokens_saved=stats["tokens_saved"])
+    return Photo(hash=stats["sha256"], mime=mime, stats=stats, colours=colours)
+
+def attach_products(data: dict, budget: str | None = None) -> dict:
+    # Catalog matches for every piece. Added on the way out rather than cached,
+    # so cached lookbooks are matched against the catalog that is loaded now.
+    from .catalog import get_catalog   # not at the top: keeps `python -m fitlab.catalog` clean
+
+    if not data.get("outfits"):
+        return data
+    with span("catalog") as s:
+        try:
+            catalog = get_catalog()
+        except (OSError, ValueError) as e:
+            s.set(error=type(e).__name__)
+            return data
+        if catalog is None:
+            return data
+        outfits = catalog.match_outfits(data["outfits"], budget)
+        s.set(pieces=sum(len(o.get("pieces") or []) for o in outfits if isinstance(o, dict)))
+    return {**data, "outfits": outfits}
+
+def generate_for_photo(photo: Photo, prefs, *, on_analysis=None, on_look=None, on_queue=None,
+                       stream: bool = STREAM_RESULTS, fanout: bool = FANOUT_LOOKS,
+                       meter: UsageMeter | None = None) -> Result:
+    # on_analysis(analysis_dict) and on_look(index, outfit_dict) fire as soon as
+    # each part is ready, so a UI can render progressively. on_queue(position,
+    # seconds_left) reports waits for rate-limit headroom; position 0 = admitted.
+    prefs = Preferences.coerce(prefs).as_dict()
+    size  = photo.stats.get("size")
+    router = get_router()
+    with span("generate", model=router.model_for("looks", prefs), fanout=fanout, stream=stream,
+              image_size="{}x{}".format(*size) if size else None, image_tokens=photo.stats.get("tokens")) as s:
+        cache = get_result_cache()
+        key   = result_cache_key(photo.key, prefs, router.signature(prefs))
+        cached = cache.get(key)
+        if cached is not None:
+            s.set(outcome="cached")
+            return Result.from_dict(attach_products(cached, prefs["budget"]), cached=True,
+                                    trace_id=s.trace_id, span_id=s.span_id)
+
+        meter = meter or UsageMeter()
+        # Model-written palettes are normalised before anyone sees them
+        show_look = (lambda idx, outfit: on_look(idx, snap_outfit(outfit))) if on_look else None
+
+        def run() -> tuple:
+            # Re-checked here: an identical flight may have finished between the
+            # lookup above and becoming the leader.
+            data = cache.get(key)
+            if data is not None:
+                return data, []
+            # An answer from a fallback tier is not what the key (named after the
+            # primary models) promises, so it is served but not cached
+            with track_fallbacks() as fell_back:
+                client = get_client()
+                analysis = get_person_analysis(client, photo, meter)
+                if on_analysis:
+                    on_analysis(analysis)
+
+                failures = []
+                if fanout:
+                    import asyncio
+
+                    looks, failures = asyncio.run(generate_looks_fanout(analysis, prefs, show_look, meter))
+                    if not looks.get("outfits") and failures:
+                        raise failures[0][1]
+                    # The same recovery as the single-request path; only parts that
+                    # are still missing afterwards are reported
+                    if any(missing_parts(looks)):
+                        looks = fill_missing_looks(client, looks, analysis, prefs, meter)
+                        n_missing, extras_missing = missing_parts(looks)
+                        failures = [(idx, e) for idx, e in failures
+                                    if (extras_missing if idx is None else n_missing)]
+                elif stream:
+                    looks = stream_looks(client, analysis, prefs, show_look, meter)
+                else:
+                    looks = create_looks(client, analysis, prefs, meter)
+
+            looks = {**looks, "outfits": [snap_outfit(o) for o in looks.get("outfits", [])]}
+            data  = {"person_analysis": analysis, **looks}
+            get_usage_meter().merge(meter)
+            if not failures and not fell_back:
+                cache.put(key, data)
+            return data, [f"Look {idx + 1:02d}" if idx is not None else "style tips" for idx, _ in failures]
+
+        # Identical generations already in flight (double submits, several tabs or
+        # users with the same photo and preferences) share one set of API calls.
+        # Callers that join get the final result but no progress callbacks.
+        try:
+            with queue_feedback(on_queue):
+                (data, failures), shared = get_generation_flights().do(key, run)
+        except Cancelled:
+            s.set(outcome="cancelled")
+            raise
+        s.set(outcome="coalesced" if shared else "fresh", failures=len(failures), requests=meter.requests,
+              **meter.totals)
+        return Result.from_dict(attach_products(data, prefs["budget"]), usage=dict(meter.totals),
+                                failures=failures, coalesced=shared, trace_id=s.trace_id, span_id=s.span_id)
+
+# ── Edits ─────────────────────────────────────────────────────────────────────
+# Re-roll one look or one piece of a finished lookbook (as from Result.to_dict())
+# and return the lookbook with the new part spliced in. Only the stored person
+# analysis and the outfit around the edit are sent, so no photo and no other
+# looks.
+def _edit(route: str, request: dict, prefs: dict, meter: UsageMeter) -> dict:
+    client = get_client()
+    request, response = routed_create(client, route, request, prefs)
+    meter.add(response.usage)
+    text = finish_response(client, request, response, meter)
+    with span("parse", kind=route, chars=len(text)):
+        return parse_result(text)
+
+def regenerate_look(data: dict, look_idx: int, prefs, constraint: str = "",
+                    meter: UsageMeter | None = None) -> Result:
+    prefs   = Preferences.coerce(prefs).as_dict()
+    meter   = meter or UsageMeter()
+    outfits = list(data.get("outfits") or [])
+    with span("regenerate", target="look", look=look_idx + 1) as s:
+        others = [o.get("name", "") for i, o in enumerate(outfits) if i != look_idx and isinstance(o, dict)]
+        with span("request.build", kind="look_edit"):
+            request = build_look_edit_request(data.get("person_analysis") or {}, prefs, outfits[look_idx],
+                                              others, look_idx + 1, constraint)
+        look = _edit("look", request, prefs, meter)
+        if not valid_look(look):
+            raise ValueError("The new look came back incomplete. Please try again.")
+        [outfits[look_idx]] = attach_products({"outfits": [snap_outfit(look)]}, prefs["budget"])["outfits"]
+        s.set(requests=meter.requests, **meter.totals)
+    get_usage_meter().merge(meter)
+    return Result.from_dict({**data, "outfits": outfits}, usage=dict(meter.totals),
+                            trace_id=s.trace_id, span_id=s.span_id)
+
+def regenerate_piece(data: dict, look_idx: int, piece_idx: int, prefs, constraint: str = "",
+                     meter: UsageMeter | None = None) -> Result:
+    prefs   = Preferences.coerce(prefs).as_dict()
+    meter   = meter or UsageMeter()
+    outfits = list(data.get("outfits") or [])
+    outfit  = outfits[look_idx]
+    pieces  = list(outfit.get("pieces") or [])
+    with span("regenerate", target="piece", look=look_idx + 1, piece=piece_idx + 1) as s:
+        with span("request.build", kind="piece"):
+            request = build_piece_request(data.get("person_analysis") or {}, prefs, outfit, piece_idx, constraint)
+        piece = _edit("piece", request, prefs, meter)
+        if not isinstance(piece, dict) or not piece.get("item"):
+            raise ValueError("The new piece came back incomplete. Please try again.")
+        piece = {**piece, "type": pieces[piece_idx].get("type") or piece.get("type", "")}
+        [matched] = attach_products({"outfits": [{"pieces": [piece]}]}, prefs["budget"])["outfits"]
+        pieces[piece_idx] = matched["pieces"][0]
+        outfits[look_idx] = {**outfit, "pieces": pieces}
+        s.set(requests=meter.requests, **meter.totals)
+    get_usage_meter().merge(meter)
+    return Result.from_dict({**data, "outfits": outfits}, usage=dict(meter.totals),
+                            trace_id=s.trace_id, span_id=s.span_id)
+
+def generate_looks(image_bytes: bytes, prefs, **kwargs) -> Result:
+    """Runs the whole pipeline for one photo: preprocess, analyse, style, parse."""
+    return generate_for_photo(prepare_photo(image_bytes), prefs, **kwargs)
@@ -0,0 +1,82 @@
+"""Photo preprocessing: orientation, downsizing, re-encoding and token estimates.
+
+Pillow is imported on first use so importing this module stays cheap.
+"""
+
+import base64
+import io
+import math
+import os
+
+from .telemetry import span
+
+def img_to_b64(image_bytes: bytes) -> str:
+    return base64.standard_b64encode(image_bytes).decode("utf-8")
+
+# Uploads are downsized and re-encoded before they reach the model: phone photos
+# are 5–12 MB, while the API bills (and downsamples) anything past ~1.15 MP.
+IMAGE_MAX_EDGE = int(os.environ.get("FITLAB_IMAGE_MAX_EDGE", 1024))
+IMAGE_FORMAT   = os.environ.get("FITLAB_IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY  = int(os.environ.get("FITLAB_IMAGE_QUALITY", 85))
+
+API_IMAGE_MAX_EDGE   = 1568
+API_IMAGE_MAX_PIXELS = 1_150_000
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    # Mirrors the API's own resize before applying its (w * h) / 750 estimate
+    scale = min(1.0, API_IMAGE_MAX_EDGE / max(width, height),
+                math.sqrt(API_IMAGE_MAX_PIXELS / (width * height)))
+    return math.ceil((width * scale) * (height * scale) / 750)
+
+def preprocess_image(image_bytes: bytes, max_edge: int = IMAGE_MAX_EDGE,
+                     fmt: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY) -> tuple[bytes, str, dict]:
+    from PIL import Image, ImageOps
+
+    with span("upload.decode", bytes=len(image_bytes)) as s:
+        img = Image.open(io.BytesIO(image_bytes))
+        orig_size = img.size
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        if img.mode not in ("RGB", "L"):
+            # JPEG has no alpha channel; flatten transparent PNGs onto white
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        s.set(image_size="{}x{}".format(*orig_size))
+
+    with span("upload.encode", format=fmt, image_size="{}x{}".format(*img.size)) as s:
+        out = io.BytesIO()
+        # Re-encoding from pixel data drops EXIF/ICC/XMP metadata
+        img.save(out, format=fmt, quality=quality, optimize=True)
+        data = out.getvalue()
+        s.set(bytes=len(data))
+
+    stats = {
+        "orig_bytes":  len(image_bytes),
+        "bytes":       len(data),
+        "orig_size":   orig_size,
+        "size":        img.size,
+        "orig_tokens": estimate_image_tokens(*orig_size),
+        "tokens":      estimate_image_tokens(*img.size),
+    }
+    stats["bytes_saved"]  = stats["orig_bytes"] - stats["bytes"]
+    stats["tokens_saved"] = stats["orig_tokens"] - stats["tokens"]
+    return data, f"image/{fmt.lower()}", stats
+
+PREVIEW_MAX_EDGE = 480
+
+def make_preview(image_bytes: bytes, max_edge: int = PREVIEW_MAX_EDGE) -> bytes:
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_bytes))
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=80)
+    return out.getvalue()
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(n) < 1024 or unit == "MB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
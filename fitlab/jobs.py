@@ -0,0 +1,203 @@
+"""Generation jobs that run off the caller's thread, with progress and cancellation.
+
+Calling generate_for_photo from a Streamlit script pins the script thread until
+the last look arrives, and a generation nobody is waiting for any more still
+runs to the end. Jobs run in a worker pool instead. Each has an id, a status
+and the progress so far (queue position, the analysis, each finished look),
+which the UI polls from a fragment. A session has at most one live job:
+submitting another cancels the one it supersedes. A job whose owner stops
+polling for ``FITLAB_JOB_ORPHAN_AFTER`` seconds (the tab was closed) is
+cancelled too. Cancelling closes a streamed response mid-way, so output nobody
+will read stops being generated, and requests still queued are never sent.
+
+    jobs = get_job_manager()
+    job  = jobs.submit(photo, prefs, owner=session_id)
+    ...
+    job  = jobs.poll(job.id, owner=session_id)   # also the owner's heartbeat
+    job.progress()["status"]
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .engine import Photo, generate_for_photo
+from .prefetch import get_prefetcher
+from .results import Preferences, Result
+from .scheduler import Cancelled, cancellable
+from .usage import UsageMeter
+
+JOB_WORKERS      = int(os.environ.get("FITLAB_JOB_WORKERS", 16))
+JOB_ORPHAN_AFTER = float(os.environ.get("FITLAB_JOB_ORPHAN_AFTER", 30))   # 0 = never
+JOB_KEEP         = float(os.environ.get("FITLAB_JOB_KEEP", 600))          # finished jobs stay pollable this long
+JOB_POLL_SECONDS = 0.5
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+@dataclass
+class Job:
+    id: str
+    owner: str
+    prefs: dict = field(default_factory=dict)
+    status: str = QUEUED
+    analysis: dict | None = None
+    looks: dict = field(default_factory=dict)   # index -> outfit, as they stream in
+    queue: tuple | None = None                  # (position, seconds left) while waiting for headroom
+    result: Result | None = None
+    error: Exception | None = None
+    reason: str = ""                            # why it was cancelled: superseded, disconnected, user
+    meter: UsageMeter = field(default_factory=UsageMeter)
+    created: float = field(default_factory=time.monotonic)
+    ended: float | None = None
+    seen: float = field(default_factory=time.monotonic)
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    future: object = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def update(self, **changes) -> None:
+        with self._lock:
+            for name, value in changes.items():
+                setattr(self, name, value)
+
+    def add_look(self, idx: int, outfit: dict) -> None:
+        with self._lock:
+            self.looks = {**self.looks, idx: outfit}
+
+    def progress(self) -> dict:
+        # A consistent copy for rendering while the worker keeps writing
+        with self._lock:
+            return {"id": self.id, "status": self.status, "analysis": self.analysis, "looks": dict(self.looks),
+                    "queue": self.queue, "reason": self.reason,
+                    "elapsed": (self.ended or time.monotonic()) - self.created}
+
+class JobManager:
+    # Thread-safe and shared by every session
+
+    def __init__(self, workers: int = JOB_WORKERS, orphan_after: float = JOB_ORPHAN_AFTER,
+                 keep: float = JOB_KEEP):
+        self.orphan_after = orphan_after
+        self.keep         = keep
+        self._pool   = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fitlab-job")
+        self._jobs   = {}   # id -> Job
+        self._owned  = {}   # owner -> id of its live job
+        self._lock   = threading.Lock()
+        self._reaper = None
+        self.stats   = dict.fromkeys(("submitted", DONE, FAILED, CANCELLED, "superseded", "disconnected"), 0)
+
+    def submit(self, photo: Photo, prefs, owner: str, **kwargs) -> Job:
+        # kwargs go to generate_for_photo (stream=, fanout=)
+        job = Job(id=uuid.uuid4().hex, owner=owner, prefs=Preferences.coerce(prefs).as_dict())
+        with self._lock:
+            previous = self._jobs.get(self._owned.get(owner))
+            self._jobs[job.id]  = job
+            self._owned[owner] = job.id
+            self.stats["submitted"] += 1
+            self._start_reaper()
+        if previous is not None:
+            self.cancel(previous.id, "superseded")
+        job.future = self._pool.submit(self._run, job, photo, job.prefs, kwargs)
+        return job
+
+    def poll(self, job_id: str, owner: str) -> Job | None:
+        # The owner's job, or None if it is unknown or expired; polling keeps it alive
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        job.update(seen=time.monotonic())
+        return job
+
+    def cancel(self, job_id: str, reason: str = "user") -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished or job.cancel_event.is_set():
+                return False
+            if reason in self.stats:
+                self.stats[reason] += 1
+        job.update(reason=reason)
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, CANCELLED)
+        return True
+
+    def cancel_owner(self, owner: str, reason: str = "superseded") -> bool:
+        with self._lock:
+            job_id = self._owned.get(owner)
+        return self.cancel(job_id, reason) if job_id else False
+
+    def _run(self, job: Job, photo: Photo, prefs, kwargs: dict) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.update(status=RUNNING)
+        try:
+            with cancellable(job.cancel_event):
+                result = generate_for_photo(
+                    photo, prefs, meter=job.meter,
+                    on_analysis=lambda analysis: job.update(analysis=analysis),
+                    on_look=job.add_look,
+                    on_queue=lambda position, seconds_left: job.update(
+                        queue=(position, seconds_left) if position else None),
+                    **kwargs)
+        except Cancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.update(error=e)
+            self._finish(job, FAILED)
+        else:
+            job.update(result=result)
+            self._finish(job, DONE)
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.update(status=status, queue=None, ended=time.monotonic())
+        with self._lock:
+            self.stats[status] += 1
+            if self._owned.get(job.owner) == job.id:
+                del self._owned[job.owner]
+
+    # Reaping: cancel orphaned jobs, forget old finished ones
+    def _start_reaper(self) -> None:
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_forever, name="fitlab-job-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        while True:
+            time.sleep(1.0)
+            self.reap()
+
+    def reap(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.finished:
+                if now - job.ended > self.keep:
+                    with self._lock:
+                        self._jobs.pop(job.id, None)
+            elif self.orphan_after and now - job.seen > self.orphan_after:
+                if self.cancel(job.id, "disconnected"):
+                    # The tab is gone, and with it any interest in its photo's analysis
+                    get_prefetcher().release(job.owner)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            live = sum(not job.finished for job in self._jobs.values())
+            return {**self.stats, "live": live, "kept": len(self._jobs) - live}
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
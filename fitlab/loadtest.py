@@ -0,0 +1,327 @@
+"""Multi-session load and soak harness for the Streamlit app.
+
+    python -m fitlab.loadtest --sessions 1,4,8,16 --duration 60
+    python -m fitlab.loadtest --sessions 8 --duration 900 --latency 1 --tokens-per-sec 80   # soak
+
+Each simulated session is a Streamlit ``AppTest`` driving the real script
+against an in-process ``StubServer``. A session uploads a photo, then keeps
+changing preferences and pressing Generate until the level's time is up.
+After ``--generations-per-user`` generations it is dropped and a fresh
+session takes its place, so memory freed (or not) by ended sessions shows up
+in the RSS curve.
+
+For every concurrency level the harness reports generations per second and
+rerun latency (p50/p95/p99) for uploads, generations and plain reruns with a
+result on screen. It also reports process RSS, RSS per live session and the
+bytes each session keeps in ``st.session_state``. RSS is sampled every second,
+and the growth over the second half of each level is reported, to spot leaks
+in long soak runs. Errors the app shows (an exception, an error or warning, a
+Generate with no result, a rerun past ``--timeout``) are counted apart from
+failures of the harness itself, which say nothing about the app.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from .bench import percentiles, synthetic_photo
+from .constants import BUDGETS, OCCASIONS, SEASONS, STYLES
+from .jobs import JOB_POLL_SECONDS
+from .stub_server import StubServer
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fashion_visualizer.py")
+
+def patch_apptest_for_threads() -> None:
+    # AppTest is built for one test at a time. Each run installs a mock Runtime
+    # as the global singleton and clears it when done, and patches the global
+    # config for the run's length, so concurrent sessions would trample each
+    # other's runtime and settings. Here each session thread keeps the mock
+    # runtime its own run installed, and the script thread a run starts
+    # inherits it; the one config option AppTest patches is set for the whole
+    # process instead. Each run also compiles the script afresh, and
+    # concurrent compiles trip CPython's AST recursion guard, so sessions
+    # share one script cache and compile through it one at a time.
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    current = threading.local()
+
+    class PerThread(type):
+        @property
+        def _instance(cls):
+            return getattr(current, "runtime", None)
+
+        @_instance.setter
+        def _instance(cls, runtime):
+            current.runtime = runtime
+
+    def instance(cls):
+        runtime = getattr(current, "runtime", None)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    app_test.Runtime = PerThread("SessionRuntime", (Runtime,), {})
+    Runtime.instance = classmethod(instance)
+    Runtime.exists   = classmethod(lambda cls: getattr(current, "runtime", None) is not None)
+
+    runner   = local_script_runner.LocalScriptRunner
+    init     = runner.__init__
+    run_body = runner._run_script_thread
+
+    def owned_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        self._runtime = getattr(current, "runtime", None)
+
+    def owned_run(self):
+        current.runtime = self._runtime
+        run_body(self)
+
+    runner.__init__           = owned_init
+    runner._run_script_thread = owned_run
+
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+    shared_cache = ScriptCache()
+    compile_lock = threading.Lock()
+    get_bytecode = shared_cache.get_bytecode
+
+    def locked_get_bytecode(script_path):
+        with compile_lock:
+            return get_bytecode(script_path)
+
+    shared_cache.get_bytecode = locked_get_bytecode
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared_cache
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        # Peak, not current, RSS; good enough off Linux. KiB on Linux, bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def session_state_bytes(state) -> int:
+    total = 0
+    for key in state:
+        value = state[key]
+        if isinstance(value, (bytes, str)):
+            total += len(value)
+        elif isinstance(value, (dict, list)):
+            total += len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+    return total
+
+class Level:
+    # Counters for one concurrency level, shared by its session threads
+    def __init__(self, sessions: int):
+        self.sessions    = sessions
+        self.latency_ms  = {"upload": [], "generate": [], "rerun": []}
+        self.errors      = []
+        self.harness     = []   # AppTest failures that are not the app's
+        self.state_bytes = []
+        self.generations = 0
+        self.users       = 0
+        self.peak_rss    = 0
+        self._lock       = threading.Lock()
+
+    def record(self, kind: str, ms: float) -> None:
+        with self._lock:
+            self.latency_ms[kind].append(ms)
+            if kind == "generate":
+                self.generations += 1
+
+    def error(self, msg: str) -> None:
+        with self._lock:
+            self.errors.append(msg)
+
+    def harness_error(self, msg: str) -> None:
+        with self._lock:
+            self.harness.append(msg)
+
+def timed_run(at) -> float:
+    start = time.perf_counter()
+    at.run()
+    return (time.perf_counter() - start) * 1000
+
+def timed_generate(at) -> float:
+    # Generate only submits a job; the page polls it until the result is in
+    start = time.perf_counter()
+    at.run()
+    while at.session_state.job_id:
+        time.sleep(JOB_POLL_SECONDS)
+        at.run()
+    return (time.perf_counter() - start) * 1000
+
+def run_user(args, level: Level, photo: bytes, rng: random.Random, deadline: float) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(args.app, default_timeout=args.timeout)
+    at.run()
+    if not at.exception:
+        at.file_uploader[0].set_value((f"user-{rng.random():.8f}.jpg", photo, "image/jpeg"))
+        level.record("upload", timed_run(at))
+    if at.exception:
+        # Without a page to drive, the session's widgets are not there to look up
+        level.error(str(at.exception[0].value)[:200])
+        return
+
+    for _ in range(args.generations_per_user):
+        if time.monotonic() >= deadline:
+            break
+        # Preferences sit in a form: edits are sent with the submit, not rerun on their own
+        at.multiselect[0].set_value(rng.sample(STYLES, rng.randint(1, 3)))
+        at.selectbox[0].set_value(rng.choice(OCCASIONS))
+        at.selectbox[1].set_value(rng.choice(SEASONS))
+        at.selectbox[2].set_value(rng.choice(BUDGETS))
+        at.button[0].click()
+        ms = timed_generate(at)
+        problems = [e.value for e in at.exception] + [e.value for e in at.error] + [w.value for w in at.warning]
+        if problems or not at.session_state.result:
+            level.error(str(problems[0] if problems else "no result")[:200])
+        else:
+            level.record("generate", ms)
+        time.sleep(rng.uniform(0, args.think_time))
+        # Any interaction outside the form reruns the script with the result on screen
+        level.record("rerun", timed_run(at))
+
+    with level._lock:
+        level.state_bytes.append(session_state_bytes(at.session_state))
+        level.peak_rss = max(level.peak_rss, rss_bytes())
+        level.users += 1
+
+def run_session(args, level: Level, photos: list, seed: int, deadline: float) -> None:
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        try:
+            run_user(args, level, rng.choice(photos), rng, deadline)
+        except Exception as e:
+            # The app's own exceptions are shown on the page, not raised; what
+            # escapes AppTest is the harness failing, bar a rerun that timed out
+            msg = f"{type(e).__name__}: {e}"[:200]
+            if isinstance(e, RuntimeError) and "timed out" in str(e):
+                level.error(msg)
+            else:
+                level.harness_error(msg)
+            time.sleep(0.5)
+
+def run_level(args, sessions: int, photos: list, samples: list) -> dict:
+    level    = Level(sessions)
+    gc.collect()
+    rss0     = rss_bytes()
+    start    = time.monotonic()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=run_session, args=(args, level, photos, args.seed + i, deadline), daemon=True)
+               for i in range(sessions)]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        rss = rss_bytes()
+        level.peak_rss = max(level.peak_rss, rss)
+        samples.append({"t": round(time.monotonic() - start, 1), "sessions": sessions, "rss": rss})
+        time.sleep(1)
+    elapsed = time.monotonic() - start
+    gc.collect()
+    rss1 = rss_bytes()
+
+    level_samples = [s for s in samples if s["sessions"] == sessions]
+    half = level_samples[len(level_samples) // 2:]
+    growth = ((half[-1]["rss"] - half[0]["rss"]) / max(1e-9, half[-1]["t"] - half[0]["t"]) * 60
+              if len(half) >= 2 else 0.0)
+    return {
+        "sessions":        sessions,
+        "users":           level.users,
+        "generations":     level.generations,
+        "errors":          len(level.errors),
+        "first_errors":    level.errors[:3],
+        "harness_errors":  len(level.harness),
+        "first_harness_errors": level.harness[:3],
+        "throughput":      level.generations / elapsed,
+        "latency_ms":      {kind: percentiles(ms) for kind, ms in level.latency_ms.items() if ms},
+        "rss_start_mb":    rss0 / 2**20,
+        "rss_peak_mb":     max(level.peak_rss, rss1) / 2**20,
+        "rss_end_mb":      rss1 / 2**20,
+        "rss_per_session_mb": max(0, max(level.peak_rss, rss1) - rss0) / 2**20 / sessions,
+        "state_kb":        (sum(level.state_bytes) / len(level.state_bytes) / 1024) if level.state_bytes else 0.0,
+        "rss_growth_mb_per_min": growth / 2**20,
+    }
+
+def print_level(r: dict) -> None:
+    none = {"p50": 0, "p95": 0, "p99": 0}
+    g = r["latency_ms"].get("generate", none)
+    u = r["latency_ms"].get("upload", none)
+    t = r["latency_ms"].get("rerun", none)
+    print(f"{r['sessions']:>8}  {r['generations']:>5}  {r['throughput']:>7.2f}  "
+          f"{g['p50']:>8.0f}  {g['p95']:>8.0f}  {g['p99']:>8.0f}  {u['p50']:>7.0f}  "
+          f"{t['p50']:>7.0f}  {t['p95']:>7.0f}  "
+          f"{r['rss_peak_mb']:>7.0f}  {r['rss_per_session_mb']:>7.1f}  {r['state_kb']:>7.0f}  "
+          f"{r['rss_growth_mb_per_min']:>+7.1f}  {r['errors']:>4}  {r['harness_errors']:>4}")
+    for msg in r["first_errors"]:
+        print(f"          error: {msg}")
+    for msg in r["first_harness_errors"]:
+        print(f"        harness: {msg}")
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m fitlab.loadtest", description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per level")
+    parser.add_argument("--generations-per-user", type=int, default=5, help="before a session is replaced")
+    parser.add_argument("--think-time", type=float, default=0.5, help="max seconds between generations")
+    parser.add_argument("--photos", type=int, default=8, help="distinct synthetic photos to upload")
+    parser.add_argument("--photo-size", default="1512x2016")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=400, help="stub decode rate (0 = instant)")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="keep the client-side rate limits (default: lifted, to load the app itself)")
+    parser.add_argument("--timeout", type=float, default=120, help="AppTest timeout per rerun")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app", default=APP_PATH)
+    parser.add_argument("--json", help="write per-level results and RSS samples here")
+    args = parser.parse_args(argv)
+
+    patch_apptest_for_threads()
+    server = StubServer(latency=args.latency, tokens_per_sec=args.tokens_per_sec)
+    os.environ["ANTHROPIC_BASE_URL"] = server.start()
+    os.environ.setdefault("ANTHROPIC_API_KEY", "loadtest")
+    if not args.rate_limits:
+        from .scheduler import get_scheduler
+
+        for bucket in get_scheduler().buckets.values():
+            bucket.set_limit(0)
+
+    w, h = (int(v) for v in args.photo_size.split("x"))
+    print(f"Generating {args.photos} synthetic {w}x{h} photos…", file=sys.stderr)
+    photos = [synthetic_photo((w, h)) for _ in range(args.photos)]
+
+    print(f"{'sessions':>8}  {'gens':>5}  {'gen/s':>7}  {'gen p50':>8}  {'gen p95':>8}  {'gen p99':>8}  "
+          f"{'up p50':>7}  {'rr p50':>7}  {'rr p95':>7}  {'RSS MB':>7}  {'MB/sess':>7}  {'state KB':>7}  "
+          f"{'MB/min':>7}  {'errs':>4}  {'harn':>4}")
+    results, samples = [], []
+    try:
+        for sessions in (int(n) for n in args.sessions.split(",")):
+            r = run_level(args, sessions, photos, samples)
+            results.append(r)
+            print_level(r)
+    finally:
+        server.stop()
+    print(f"\n{server.requests} stub requests; latencies in ms: gen = Generate, up = photo upload, "
+          f"rr = plain rerun with a result on screen; errs = app errors, harn = harness failures")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"levels": results, "rss_samples": samples}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Local colour analysis of the photo, and clean-up of model-written palettes.
+
+    colours = analyse_colours(jpeg_bytes)
+    # {"skin": "#c69a7b", "undertone": "warm", "depth": "medium", "skin_share": 0.18,
+    #  "dominant": ["#2b2a2e", "#d9d4cc", ...], "shares": [0.41, 0.22, ...]}
+
+The photo is decoded at a reduced size (JPEG draft mode) to a few thousand
+pixels. Skin is found with the usual YCbCr box and summarised by its median in
+CIELAB: the hue angle gives the undertone and L* gives the depth. The remaining
+pixels are clustered with k-means in CIELAB for the dominant colours. NumPy
+and Pillow are imported on first use.
+"""
+
+import io
+import math
+import re
+from functools import lru_cache
+
+ANALYSIS_EDGE = 96      # longest edge of the pixel grid that gets analysed
+N_CLUSTERS    = 5
+KMEANS_ITERS  = 8
+MIN_SHARE     = 0.03    # dominant colours covering less of the photo are dropped
+MIN_SKIN      = 0.01    # below this share of skin pixels, no skin reading
+SAME_COLOUR   = 3.0     # ΔE*ab under which two palette colours count as one
+
+# Undertone from the skin's CIELAB hue angle (degrees): yellower skin reads
+# warm, pinker skin cool. Depth from L*.
+WARM_HUE = 60.0
+COOL_HUE = 50.0
+DEPTHS   = ((72, "fair"), (62, "light"), (50, "medium"), (38, "tan"), (0, "deep"))
+
+_D65    = (0.95047, 1.0, 1.08883)
+_TO_XYZ = ((0.4124, 0.3576, 0.1805), (0.2126, 0.7152, 0.0722), (0.0193, 0.1192, 0.9505))
+HEX6    = re.compile(r"^#?([0-9a-fA-F]{6})$")
+HEX3    = re.compile(r"^#?([0-9a-fA-F]{3})$")
+
+def _pixels(image_bytes: bytes, edge: int = ANALYSIS_EDGE):
+    import numpy as np
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("RGB", (edge * 2, edge * 2))   # JPEG: decode at 1/2–1/8 scale
+    img = img.convert("RGB")
+    img.thumbnail((edge, edge), Image.Resampling.BILINEAR)
+    return np.asarray(img, dtype=np.float32).reshape(-1, 3) / 255.0
+
+def rgb_to_lab(rgb):
+    # sRGB in 0..1, shape (..., 3) -> CIELAB (D65)
+    import numpy as np
+
+    lin = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = lin @ np.asarray(_TO_XYZ, dtype=np.float32).T / np.asarray(_D65, dtype=np.float32)
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], -1)
+
+def lab_to_rgb(lab):
+    import numpy as np
+
+    fy = (lab[..., 0] + 16) / 116
+    f  = np.stack([fy + lab[..., 1] / 500, fy, fy - lab[..., 2] / 200], -1)
+    xyz = np.where(f > 6 / 29, f ** 3, 3 * (6 / 29) ** 2 * (f - 4 / 29)) * np.asarray(_D65, dtype=np.float32)
+    lin = xyz @ np.linalg.inv(np.asarray(_TO_XYZ, dtype=np.float32)).T
+    lin = np.clip(lin, 0, 1)
+    return np.where(lin <= 0.0031308, lin * 12.92, 1.055 * lin ** (1 / 2.4) - 0.055)
+
+def _hex(rgb) -> str:
+    r, g, b = (int(round(float(c) * 255)) for c in rgb)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def skin_mask(rgb):
+    # The classic YCbCr skin box, which holds across skin tones far better than
+    # RGB rules; very dark and blown-out pixels are left out.
+    r, g, b = rgb[:, 0] * 255, rgb[:, 1] * 255, rgb[:, 2] * 255
+    y  = 0.299 * r + 0.587 * g + 0.114 * b
+    cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    return (cr >= 133) & (cr <= 173) & (cb >= 77) & (cb <= 127) & (y > 40) & (y < 245)
+
+def kmeans(points, k: int, iters: int = KMEANS_ITERS, seed: int = 0):
+    # k-means++ seeding then Lloyd steps; returns (centres, counts) by count
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    k = min(k, len(points))
+    centres = [points[rng.integers(len(points))]]
+    d2 = ((points - centres[0]) ** 2).sum(1)
+    for _ in range(1, k):
+        if d2.sum() <= 0:
+            break
+        # Inverse-CDF draw: same distribution as rng.choice(p=...), far cheaper
+        idx = min(int(np.searchsorted(np.cumsum(d2), rng.random() * d2.sum())), len(points) - 1)
+        centres.append(points[idx])
+        d2 = np.minimum(d2, ((points - centres[-1]) ** 2).sum(1))
+    centres = np.stack(centres)
+
+    def assign(centres):
+        # |p - c|² without the (n, k, 3) intermediate
+        d = (centres ** 2).sum(1)[None, :] - 2 * points @ centres.T
+        return d.argmin(1)
+
+    for _ in range(iters):
+        labels = assign(centres)
+        counts = np.bincount(labels, minlength=len(centres))
+        sums = np.stack([np.bincount(labels, weights=points[:, j], minlength=len(centres)) for j in range(3)], 1)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centres).astype(points.dtype)
+        done = np.abs(moved - centres).max() < 0.5
+        centres = moved
+        if done:
+            break
+    counts = np.bincount(assign(centres), minlength=len(centres))
+    order = counts.argsort()[::-1]
+    return centres[order], counts[order]
+
+def analyse_colours(image_bytes: bytes, n_colours: int = N_CLUSTERS) -> dict:
+    import numpy as np
+
+    rgb  = _pixels(image_bytes)
+    lab  = rgb_to_lab(rgb)
+    skin = skin_mask(rgb)
+    out  = {"skin_share": round(float(skin.mean()), 3)}
+
+    if skin.mean() >= MIN_SKIN:
+        median = np.median(lab[skin], axis=0)
+        hue = float(np.degrees(np.arctan2(median[2], median[1])))
+        out["skin"]      = _hex(lab_to_rgb(median))
+        out["undertone"] = "warm" if hue >= WARM_HUE else "cool" if hue <= COOL_HUE else "neutral"
+        out["depth"]     = next(name for floor, name in DEPTHS if median[0] >= floor)
+
+    rest = lab[~skin] if (~skin).sum() >= n_colours else lab
+    # Seeded from the pixels so the same photo always gives the same palette
+    centres, counts = kmeans(rest, n_colours, seed=int(rest.sum() * 1000) % 2**32)
+    shares = counts / counts.sum()
+    keep = shares >= MIN_SHARE
+    out["dominant"] = [_hex(c) for c in lab_to_rgb(centres[keep])]
+    out["shares"]   = [round(float(s), 3) for s in shares[keep]]
+    return out
+
+def describe_colours(colours: dict) -> str:
+    # One line for prompts, e.g. "skin #c69a7b (warm undertone, medium depth);
+    # colours already in the photo #2b2a2e, #d9d4cc"
+    parts = []
+    if colours.get("skin"):
+        parts.append(f"skin {colours['skin']} ({colours['undertone']} undertone, {colours['depth']} depth)")
+    if colours.get("dominant"):
+        parts.append("colours already in the photo " + ", ".join(colours["dominant"]))
+    return "; ".join(parts)
+
+# ── Model-written palettes ────────────────────────────────────────────────────
+def normalise_hex(value) -> str | None:
+    # "#ABC", "abc123", "rgb(12, 34, 56)" or a CSS name -> "#rrggbb"; None if
+    # it isn't a colour at all
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if m := HEX6.match(value):
+        return "#" + m.group(1).lower()
+    if m := HEX3.match(value):
+        return "#" + "".join(c * 2 for c in m.group(1).lower())
+    from PIL import ImageColor
+
+    try:
+        rgb = ImageColor.getrgb(value)
+    except ValueError:
+        return None
+    return "#{:02x}{:02x}{:02x}".format(*rgb[:3])
+
+@lru_cache(maxsize=1024)
+def _lab(hex_: str) -> tuple:
+    # Scalar twin of rgb_to_lab for single palette colours
+    def lin(c):
+        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+    rgb = [lin(int(hex_[i:i + 2], 16) / 255) for i in (1, 3, 5)]
+    f = []
+    for row, white in zip(_TO_XYZ, _D65):
+        t = sum(m * c for m, c in zip(row, rgb)) / white
+        f.append(t ** (1 / 3) if t > (6 / 29) ** 3 else t / (3 * (6 / 29) ** 2) + 4 / 29)
+    return 116 * f[1] - 16, 500 * (f[0] - f[1]), 200 * (f[1] - f[2])
+
+def delta_e(a: str, b: str) -> float:
+    return math.dist(_lab(a), _lab(b))
+
+def snap_palette(palette, names=None) -> tuple[list, list]:
+    # Keeps the colours that parse, in canonical #rrggbb form, drops repeats the
+    # eye can't tell apart and keeps each name next to its colour.
+    names = list(names or [])
+    colours, kept_names = [], []
+    for i, value in enumerate(palette or []):
+        hex_ = normalise_hex(value)
+        if hex_ is None or any(hex_ == c or delta_e(hex_, c) < SAME_COLOUR for c in colours):
+            continue
+        colours.append(hex_)
+        if i < len(names):
+            kept_names.append(str(names[i]))
+    return colours, kept_names
+
+def snap_outfit(outfit: dict) -> dict:
+    if not isinstance(outfit, dict) or "color_palette" not in outfit:
+        return outfit
+    palette, names = snap_palette(outfit.get("color_palette"), outfit.get("palette_names"))
+    return {**outfit, "color_palette": palette, "palette_names": names}
@@ -0,0 +1,120 @@
+"""Tolerant parsing of model replies, including incremental and truncated JSON."""
+
+import json
+import re
+
+from .constants import N_LOOKS
+
+def parse_result(raw: str) -> dict:
+    raw = raw.strip()
+    raw = re.sub(r'^```json\s*', '', raw)
+    raw = re.sub(r'^```\s*', '', raw)
+    raw = re.sub(r'\s*```$', '', raw)
+    return json.loads(raw)
+
+class ResultStreamParser:
+    # Incremental scanner over the streamed JSON text. It tracks string/escape
+    # state and container nesting, and yields each object the UI can render as
+    # soon as its closing brace arrives:
+    #   ("person_analysis", None, {...})  and  ("outfit", index, {...})
+
+    def __init__(self):
+        self.pos       = 0
+        self.started   = False   # skips any ``` fence before the first "{"
+        self.closed    = False   # the top-level object has ended; the rest is ignored
+        self.in_str    = False
+        self.escape    = False
+        self.str_start = 0
+        self.last_str  = None
+        self.stack     = []      # [container_char, key, start_offset, n_items]
+        self.text      = ""
+
+    def feed(self, chunk: str) -> list:
+        events = []
+        self.text += chunk
+        text = self.text
+        while self.pos < len(text) and not self.closed:
+            ch = text[self.pos]
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    continue
+                self.pos += 1
+                continue
+
+            if self.in_str:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_str = False
+                    self.last_str = text[self.str_start:self.pos]
+            elif ch == '"':
+                self.in_str, self.str_start = True, self.pos + 1
+            elif ch == ":":
+                if self.stack:
+                    self.stack[-1][1] = self.last_str
+            elif ch in "{[":
+                if self.stack and self.stack[-1][0] == "[":
+                    self.stack[-1][3] += 1
+                self.stack.append([ch, None, self.pos, 0])
+            elif ch in "}]":
+                _, _, start, _ = self.stack.pop()
+                event = self._event(text, start) if ch == "}" else None
+                if event:
+                    events.append(event)
+                # Anything after the top-level object (a fence, prose, a stray
+                # brace) is not part of the reply
+                self.closed = not self.stack
+            self.pos += 1
+        return events
+
+    def _event(self, text: str, start: int):
+        # The object just closed is a value of the top-level object (depth 1)
+        # or an element of the top-level "outfits" array (depth 2).
+        if len(self.stack) == 1 and self.stack[0][1] == "person_analysis":
+            kind, idx = "person_analysis", None
+        elif (len(self.stack) == 2 and self.stack[1][0] == "[" and self.stack[0][1] == "outfits"):
+            kind, idx = "outfit", self.stack[1][3] - 1
+        else:
+            return None
+        try:
+            return kind, idx, json.loads(text[start:self.pos + 1])
+        except json.JSONDecodeError:
+            return None
+
+EXTRAS_KEYS = ("universal_tips", "signature_piece", "avoid")
+
+def valid_look(outfit) -> bool:
+    return (isinstance(outfit, dict) and bool(outfit.get("name"))
+            and isinstance(outfit.get("pieces"), list) and bool(outfit["pieces"]))
+
+def salvage_looks(raw: str) -> dict:
+    # Recovers whatever is complete from a truncated or malformed outfit
+    # response: every closed outfits[] element plus any top-level extras that
+    # survived. Missing parts are left for fill_missing_looks() to request.
+    # Fed a line at a time so a scan that trips on the text keeps what it had.
+    parser, outfits = ResultStreamParser(), []
+    for line in raw.splitlines(keepends=True):
+        try:
+            events = parser.feed(line)
+        except (IndexError, ValueError):
+            break
+        outfits += [obj for kind, _, obj in events if kind == "outfit"]
+    looks = {"outfits": outfits}
+    for key in EXTRAS_KEYS:
+        m = re.search(rf'"{key}"\s*:\s*("(?:[^"\\]|\\.)*"|\[[^\[\]]*\])', raw)
+        if m:
+            try:
+                looks[key] = json.loads(m.group(1))
+            except json.JSONDecodeError:
+                pass
+    return looks
+
+def missing_parts(looks: dict) -> tuple[int, bool]:
+    # -> (number of looks still needed, whether the extras need re-requesting)
+    n_valid = sum(1 for o in looks.get("outfits", []) if valid_look(o))
+    extras_missing = not (isinstance(looks.get("universal_tips"), list)
+                          and looks.get("signature_piece") and looks.get("avoid"))
+    return max(0, N_LOOKS - n_valid), extras_missing
@@ -0,0 +1,210 @@
+"""Perceptual hashes of photos, and an index that finds near-duplicates.
+
+Re-uploads of the same photo rarely match byte for byte. A crop, a screenshot or
+a messenger's re-compression all change the bytes. The 64-bit DCT hash (pHash)
+computed here barely moves under such edits, so photos whose hashes differ in at
+most ``FITLAB_NEAR_DUP_BITS`` bits count as one photo. They then share the
+person analysis and the cached results. A BK-tree answers Hamming-radius
+queries without scanning every photo seen. The measured skin colour has to
+agree too, unless the hashes are identical. That keeps two different people in
+similar poses from being merged.
+
+    index = get_photo_index()
+    match, distance = index.lookup(phash_of(jpeg_bytes), skin="#c69a7b")
+"""
+
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .cache import RESULT_CACHE_DIR
+from .palette import delta_e
+
+NEAR_DUP_BITS  = int(os.environ.get("FITLAB_NEAR_DUP_BITS", 8))      # 0 = identical hashes only
+NEAR_DUP_SIZE  = int(os.environ.get("FITLAB_NEAR_DUP_SIZE", 10000))
+NEAR_DUP_FILE  = os.environ.get("FITLAB_NEAR_DUP_FILE") or (
+    os.path.join(RESULT_CACHE_DIR, "phash.jsonl") if RESULT_CACHE_DIR else None)
+SAME_SKIN      = 12.0    # ΔE*ab; skin readings further apart are different people
+
+HASH_EDGE   = 32         # the DCT runs over a 32x32 greyscale thumbnail...
+HASH_BLOCK  = 8          # ...and its 8x8 lowest frequencies make the hash
+TRIM_LEVEL  = 12         # border pixels within this of the corner colour are cropped off
+
+def _trim(img):
+    # Screenshots and re-shares often add flat bars around the photo
+    from PIL import Image, ImageChops
+
+    background = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, background).point(lambda v: 255 if v > TRIM_LEVEL else 0)
+    box  = diff.getbbox()
+    return img.crop(box) if box else img
+
+def _dct_matrix(n: int):
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+    m[0] /= np.sqrt(2)
+    return m
+
+def phash_of(image_bytes: bytes) -> int:
+    import numpy as np
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("L", (HASH_EDGE * 4, HASH_EDGE * 4))
+    img = _trim(img.convert("L"))
+    img = img.resize((HASH_EDGE, HASH_EDGE), Image.Resampling.LANCZOS)
+    m   = _dct_matrix(HASH_EDGE)
+    dct = m @ np.asarray(img, dtype=np.float64) @ m.T
+    low = dct[:HASH_BLOCK, :HASH_BLOCK].ravel()
+    # The DC term (overall brightness) is left out of the median
+    bits = low > np.median(low[1:])
+    return int(sum(1 << i for i, b in enumerate(bits) if b))
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class BKTree:
+    # Metric tree over 64-bit hashes: each child edge is labelled with its
+    # distance from the parent, so a radius query skips any subtree whose edge
+    # label lies outside [d - radius, d + radius].
+
+    def __init__(self):
+        self.root = None   # [hash, value, {distance: child}]
+
+    def add(self, h: int, value) -> None:
+        if self.root is None:
+            self.root = [h, value, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[1] = value
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, value, {}]
+                return
+            node = child
+
+    def search(self, h: int, radius: int) -> list:
+        # [(distance, hash, value)] within radius, nearest first
+        found, stack = [], [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= radius:
+                found.append((d, node[0], node[1]))
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        return sorted(found, key=lambda f: f[0])
+
+class PhotoIndex:
+    # Hashes of photos that have been analysed, each with the photo hash its
+    # analysis is cached under. Thread-safe and shared by every session.
+
+    def __init__(self, max_bits: int = NEAR_DUP_BITS, max_items: int = NEAR_DUP_SIZE,
+                 path: str | None = NEAR_DUP_FILE):
+        self.max_bits  = max_bits
+        self.max_items = max_items
+        self.path      = path
+        self._entries  = OrderedDict()   # phash -> (photo hash, skin hex or None)
+        self._tree     = BKTree()
+        self._lock     = threading.Lock()
+        self.stats     = {"lookups": 0, "exact": 0, "near": 0, "misses": 0, "rejected_skin": 0}
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        lines = 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        row = json.loads(line)
+                        self._entries[int(row["phash"], 16)] = (row["photo"], row.get("skin"))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError:
+            return
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+        self._rebuild()
+        if lines > 2 * len(self._entries):
+            self._compact()
+
+    def _compact(self) -> None:
+        # The file is append-only while running; rewrite it without stale lines
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for h, (photo, skin) in self._entries.items():
+                    f.write(json.dumps({"phash": f"{h:016x}", "photo": photo, "skin": skin}) + "\n")
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def _rebuild(self) -> None:
+        self._tree = BKTree()
+        for h, value in self._entries.items():
+            self._tree.add(h, value)
+
+    def lookup(self, phash: int, photo_hash: str = "", skin: str | None = None) -> tuple[str | None, int | None]:
+        # (photo hash to reuse, Hamming distance), or (None, None)
+        with self._lock:
+            self.stats["lookups"] += 1
+            for distance, h, (match, match_skin) in self._tree.search(phash, self.max_bits):
+                if match == photo_hash:
+                    self.stats["exact"] += 1
+                    return match, 0
+                # Identical hashes are evidence enough; skin readings wobble with JPEG quality
+                if distance and skin and match_skin and delta_e(skin, match_skin) > SAME_SKIN:
+                    self.stats["rejected_skin"] += 1
+                    continue
+                self.stats["near"] += 1
+                self._entries.move_to_end(h)
+                return match, distance
+            self.stats["misses"] += 1
+            return None, None
+
+    def add(self, phash: int, photo_hash: str, skin: str | None = None) -> None:
+        with self._lock:
+            if self._entries.get(phash) == (photo_hash, skin):
+                self._entries.move_to_end(phash)
+                return
+            self._entries[phash] = (photo_hash, skin)
+            self._tree.add(phash, (photo_hash, skin))
+            # BK-trees can't delete; rebuild once a tenth over the cap
+            if len(self._entries) > self.max_items * 1.1:
+                while len(self._entries) > self.max_items:
+                    self._entries.popitem(last=False)
+                self._rebuild()
+        if self.path:
+            line = json.dumps({"phash": f"{phash:016x}", "photo": photo_hash, "skin": skin}) + "\n"
+            try:
+                with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hits = self.stats["exact"] + self.stats["near"]
+            return {**self.stats, "photos": len(self._entries),
+                    "hit_rate": round(hits / self.stats["lookups"], 3) if self.stats["lookups"] else None}
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_photo_index() -> PhotoIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PhotoIndex()
+        return _index
@@ -0,0 +1,138 @@
+"""Speculative photo analysis, started in the background as soon as a photo is uploaded.
+
+The analysis depends only on the photo, so it can run while the user is still
+choosing styles and an occasion. Generate then finds it cached, or joins it
+through the analysis single-flight, and only the preference-dependent work is
+left to do. Each job belongs to the sessions that uploaded its photo. A session
+that uploads a different photo, or clears its upload, gives up its interest,
+and a job nobody wants any more is cancelled. A job still queued never starts,
+and one waiting for rate-limit headroom gives its reservation back. A request
+that is already sent is left to finish, and its analysis is still cached.
+
+    get_prefetcher().start(photo, owner=session_id)
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .cache import analysis_cache_key, get_analysis_cache
+from .client import get_client
+from .engine import Photo, get_person_analysis
+from .routing import get_router
+from .scheduler import Cancelled, cancellable, check_cancelled
+from .telemetry import span
+from .usage import UsageMeter, get_usage_meter
+
+PREFETCH         = os.environ.get("FITLAB_PREFETCH", "1") != "0"
+PREFETCH_WORKERS = int(os.environ.get("FITLAB_PREFETCH_WORKERS", 4))
+
+@dataclass
+class _Job:
+    owners: set
+    cancel: threading.Event = field(default_factory=threading.Event)
+    future: object = None
+
+class Prefetcher:
+    # One job per analysis cache key, shared by every session that uploaded a
+    # photo with that key. Thread-safe and shared by every session.
+
+    def __init__(self, workers: int = PREFETCH_WORKERS):
+        self._pool  = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fitlab-prefetch")
+        self._jobs  = {}   # analysis key -> _Job
+        self._owned = {}   # owner -> analysis key it last asked for
+        self._lock  = threading.Lock()
+        self.stats  = {"started": 0, "joined": 0, "skipped": 0, "done": 0, "cancelled": 0, "failed": 0}
+
+    def start(self, photo: Photo, owner: str) -> bool:
+        # True when an analysis for this photo is running or queued for owner
+        key = analysis_cache_key(photo.key, get_router().model_for("analysis"))
+        with self._lock:
+            previous = self._owned.get(owner)
+            if previous == key:
+                return key in self._jobs
+            if previous:
+                self._release(owner, previous)
+            self._owned[owner] = key
+            job = self._jobs.get(key)
+            if job is not None:
+                job.owners.add(owner)
+                self.stats["joined"] += 1
+                return True
+        if get_analysis_cache().get(key) is not None:
+            with self._lock:
+                self.stats["skipped"] += 1
+                if self._owned.get(owner) == key:
+                    del self._owned[owner]
+            return False
+        with self._lock:
+            if self._owned.get(owner) != key:
+                return False   # superseded while checking the cache
+            job = self._jobs.get(key)
+            if job is not None:
+                job.owners.add(owner)
+                return True
+            job = self._jobs[key] = _Job(owners={owner})
+            self.stats["started"] += 1
+            job.future = self._pool.submit(self._run, photo, key, job)
+        return True
+
+    def release(self, owner: str) -> None:
+        # owner no longer needs its photo analysed (upload cleared, session ended)
+        with self._lock:
+            key = self._owned.pop(owner, None)
+            if key:
+                self._release(owner, key)
+
+    def _release(self, owner: str, key: str) -> None:
+        job = self._jobs.get(key)
+        if job is None:
+            return
+        job.owners.discard(owner)
+        if not job.owners:
+            del self._jobs[key]
+            job.cancel.set()
+            if job.future.cancel():
+                self.stats["cancelled"] += 1
+
+    def _run(self, photo: Photo, key: str, job: _Job) -> None:
+        meter = UsageMeter()
+        with span("prefetch", photo=photo.key[:12]) as s, cancellable(job.cancel):
+            try:
+                check_cancelled()
+                if get_analysis_cache().get(key) is not None:
+                    outcome = "cached"
+                else:
+                    get_person_analysis(get_client(), photo, meter)
+                    outcome = "done"
+            except Cancelled:
+                outcome = "cancelled"
+            except Exception as e:
+                # Generate will try again and surface the error itself
+                outcome = "failed"
+                s.set(error=type(e).__name__)
+            s.set(outcome=outcome, requests=meter.requests, **meter.totals)
+        get_usage_meter().merge(meter)
+        with self._lock:
+            self.stats["done" if outcome == "cached" else outcome] += 1
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+            # Only owners of a job still in flight are remembered
+            for owner in job.owners:
+                if self._owned.get(owner) == key:
+                    del self._owned[owner]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._jobs), "owners": len(self._owned)}
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher() -> Prefetcher:
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
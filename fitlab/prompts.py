@@ -0,0 +1,195 @@
+"""System prompts, JSON schemas and Messages API request builders."""
+
+import os
+import textwrap
+
+from .constants import MODEL, N_LOOKS
+from .palette import describe_colours
+
+# Generation runs in two stages: a vision stage reads the photo once and is
+# cached per photo, then a text-only stage builds outfits from that analysis.
+# Changing occasion/season/budget therefore never re-sends the image.
+ANALYSIS_SYSTEM_PROMPT = """You are FITLAB's elite AI fashion stylist — part visionary creative director, part personal shopper. 
+You analyze the user's photo to understand body proportions, skin tone, current outfit, and personal aesthetic cues.
+Always respond in valid JSON only — no markdown, no preamble."""
+
+ANALYSIS_PROMPT = """Analyze the person in this photo.
+
+Respond ONLY with a JSON object in exactly this structure:
+{
+  "skin_tone": "undertone and depth in a few words",
+  "body_silhouette": "describe shape/proportions briefly",
+  "current_style_cue": "what their current look suggests",
+  "style_persona": "2-3 word style archetype e.g. 'Quiet Luxe Minimalist'"
+}"""
+
+OUTFIT_SYSTEM_PROMPT = """You are FITLAB's elite AI fashion stylist — part visionary creative director, part personal shopper. 
+You are given a stylist's analysis of the user's body proportions, skin tone, current outfit, and personal aesthetic cues.
+You craft 3 complete, wearable outfit concepts that flatter them specifically.
+Always respond in valid JSON only — no markdown, no preamble."""
+
+LOOK_SCHEMA = """{
+  "name": "Outfit name (evocative, 2-4 words)",
+  "occasion_fit": "Best for...",
+  "vibe": "One sentence mood/vibe",
+  "description": "2-3 sentences describing how this outfit looks on them specifically, referencing their features",
+  "pieces": [
+    {"type": "Top", "item": "specific item with color/material", "why": "why it flatters them"},
+    {"type": "Bottom", "item": "specific item with color/material", "why": "why it works"},
+    {"type": "Shoes", "item": "specific footwear", "why": "completes the look"},
+    {"type": "Bag", "item": "bag/accessory", "why": "ties it together"},
+    {"type": "Accessory", "item": "jewelry/belt/hat etc", "why": "adds personality"}
+  ],
+  "color_palette": ["#rrggbb", "#rrggbb", "#rrggbb", "#rrggbb"],
+  "palette_names": ["Color 1 name", "Color 2 name", "Color 3 name", "Color 4 name"],
+  "styling_tip": "One specific tip for wearing this outfit best",
+  "budget_breakdown": "Approximate total cost breakdown"
+}"""
+
+EXTRAS_FIELDS = """"universal_tips": [
+  "Personalized tip 1 based on their features",
+  "Personalized tip 2",
+  "Personalized tip 3"
+],
+"signature_piece": "The one statement piece that would transform their wardrobe",
+"avoid": "What styles/cuts to generally avoid and why\""""
+
+OUTFIT_SCHEMA = f"""Respond ONLY with a JSON object in exactly this structure:
+{{
+  "outfits": [
+{textwrap.indent(LOOK_SCHEMA, "    ")}
+  ],
+{textwrap.indent(EXTRAS_FIELDS, "  ")}
+}}"""
+
+def describe_person(analysis: dict, prefs: dict) -> str:
+    measured = describe_colours(analysis.get("colours") or {})
+    measured = f"\n- Measured from the photo: {measured}; build palettes that suit it" if measured else ""
+    return f"""Person analysis:
+- Skin tone: {analysis.get('skin_tone', '')}{measured}
+- Body silhouette: {analysis.get('body_silhouette', '')}
+- Current style cue: {analysis.get('current_style_cue', '')}
+- Style persona: {analysis.get('style_persona', '')}
+
+Style preferences: {", ".join(prefs["styles"])}
+Occasion: {prefs["occasion"]}
+Season: {prefs["season"]}
+Budget range: {prefs["budget"]}
+Body/fit notes: {prefs["body_notes"] if prefs["body_notes"] else 'Not specified'}
+Special requests: {prefs["extra"] if prefs["extra"] else 'None'}"""
+
+PROMPT_CACHING = os.environ.get("FITLAB_PROMPT_CACHE", "1") != "0"
+
+# Requests are laid out stable-prefix-first — system prompt, schema
+# instructions, then the photo — with a cache breakpoint on the last stable
+# block, so the provider can reuse that prefix and only the preferences that
+# follow it are billed as fresh input.
+def _cached(block: dict) -> dict:
+    return {**block, "cache_control": {"type": "ephemeral"}} if PROMPT_CACHING else block
+
+def build_analysis_request(mime: str, image_b64: str, model: str = MODEL, colours: dict | None = None) -> dict:
+    # Colours measured locally go after the cached image, as a hint the model
+    # can confirm in a few words instead of describing the skin from scratch
+    measured = describe_colours(colours or {})
+    return {
+        "model": model,
+        "max_tokens": 400,
+        "system": ANALYSIS_SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": ANALYSIS_PROMPT},
+                _cached({
+                    "type": "image",
+                    "source": {"type": "base64", "media_type": mime, "data": image_b64},
+                }),
+                *([{"type": "text", "text": f"Measured from the photo's pixels: {measured}. "
+                                            "Base skin_tone on this unless the lighting clearly distorts it."}]
+                  if measured else []),
+            ]
+        }]
+    }
+
+def _outfit_request(task: str, schema: str, analysis: dict, prefs: dict,
+                    max_tokens: int, model: str, extra: str = "") -> dict:
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": OUTFIT_SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": [
+                _cached({"type": "text", "text": f"{task}\n\n{schema}"}),
+                {"type": "text", "text": f"{extra}{describe_person(analysis, prefs)}"},
+            ]
+        }]
+    }
+
+def build_outfit_request(analysis: dict, prefs: dict, model: str = MODEL) -> dict:
+    return _outfit_request(
+        "Create 3 distinct outfit concepts for the person described in the next message block.",
+        OUTFIT_SCHEMA, analysis, prefs, 3000, model,
+    )
+
+def build_look_request(analysis: dict, prefs: dict, slant: str, look_no: int, model: str = MODEL) -> dict:
+    return _outfit_request(
+        "Create one outfit concept for the person described in the next message block.",
+        f"Respond ONLY with a JSON object in exactly this structure:\n{LOOK_SCHEMA}",
+        analysis, prefs, 1000, model,
+        extra=f"This is look {look_no} of {N_LOOKS}. Lean it towards the {slant} style; "
+              f"the other looks cover the remaining preferences.\n\n",
+    )
+
+# Edits re-roll one look or one piece of an existing lookbook. They send only
+# the analysis, the outfit around the edit and the user's note, with a small
+# max_tokens, so an edit costs a fraction of a full run.
+PIECE_SCHEMA = '{"type": "same type as the piece replaced", "item": "specific item with color/material", ' \
+               '"why": "why it works for them and with the rest of the outfit"}'
+PIECE_MAX_TOKENS = 250
+LOOK_EDIT_MAX_TOKENS = 900
+
+def _context(*lines: str) -> str:
+    return "\n".join(line for line in lines if line) + "\n\n"
+
+def _note(constraint: str) -> str:
+    return f"The user asked: {constraint.strip()}" if constraint and constraint.strip() else ""
+
+def build_look_edit_request(analysis: dict, prefs: dict, outfit: dict, others: list, look_no: int,
+                            constraint: str = "", model: str = MODEL) -> dict:
+    # others: names of the lookbook's other looks, so the new one stays distinct
+    return _outfit_request(
+        "Replace one outfit concept for the person described in the next message block.",
+        f"Respond ONLY with a JSON object in exactly this structure:\n{LOOK_SCHEMA}",
+        analysis, prefs, LOOK_EDIT_MAX_TOKENS, model,
+        extra=_context(
+            f'This replaces look {look_no}, "{outfit.get("name", "")}", which the user wants changed.',
+            f"It must differ from the other looks: {', '.join(others)}." if others else "",
+            _note(constraint),
+        ),
+    )
+
+def build_piece_request(analysis: dict, prefs: dict, outfit: dict, piece_idx: int, constraint: str = "",
+                        model: str = MODEL) -> dict:
+    pieces  = [p for p in outfit.get("pieces") or [] if isinstance(p, dict)]
+    old     = pieces[piece_idx]
+    palette = outfit.get("palette_names") or outfit.get("color_palette") or []
+    return _outfit_request(
+        "Suggest one replacement piece for an outfit worn by the person described in the next message block.",
+        f"Respond ONLY with a JSON object in exactly this structure:\n{PIECE_SCHEMA}",
+        analysis, prefs, PIECE_MAX_TOKENS, model,
+        extra=_context(
+            f'Outfit "{outfit.get("name", "")}" ({outfit.get("vibe", "")}). It keeps these pieces:',
+            *(f"- {p.get('type', '')}: {p.get('item', '')}" for i, p in enumerate(pieces) if i != piece_idx),
+            f"Palette: {', '.join(map(str, palette))}" if palette else "",
+            f"Replace the {old.get('type') or 'piece'}: {old.get('item', '')}. "
+            "Suggest something different that works with the pieces kept.",
+            _note(constraint),
+        ),
+    )
+
+def build_extras_request(analysis: dict, prefs: dict, model: str = MODEL) -> dict:
+    return _outfit_request(
+        "Give wardrobe-level advice for the person described in the next message block.",
+        f"Respond ONLY with a JSON object in exactly this structure:\n{{\n{textwrap.indent(EXTRAS_FIELDS, '  ')}\n}}",
+        analysis, prefs, 600, model,
+    )
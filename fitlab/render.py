@@ -0,0 +1,205 @@
+"""HTML for the results page, built from precompiled templates."""
+
+import html
+import math
+import re
+import textwrap
+from string import Template
+
+# Each card is compiled once into a single HTML string and emitted as one
+# element (one frontend delta) instead of a st.markdown call per piece/tip.
+# Model output is escaped and flattened to one line: a blank line would end
+# Markdown's raw-HTML block and leak the rest of the card as text.
+SAFE_URL  = re.compile(r"^https?://", re.IGNORECASE)
+HEX_COLOR = re.compile(r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{4}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$")
+
+def _e(value) -> str:
+    return html.escape(" ".join(str(value if value is not None else "").split()))
+
+def _template(text: str) -> Template:
+    return Template(textwrap.dedent(text).strip())
+
+ANALYSIS_TMPL = _template("""
+    <div class="analysis-box">
+        <div class="analysis-title">✦ Style Profile Analysis</div>
+        <div class="analysis-text">
+            You carry a <strong style="color:#e8c9a0;">$style_persona</strong> energy —
+            $skin_tone with $body_silhouette.
+            Your current look signals <em>$current_style_cue</em>.
+            These three looks are curated to elevate exactly that.
+        </div>
+    </div>
+""")
+
+INFO_STRIP_TMPL = _template("""
+    <div class="info-strip">
+        <div class="info-cell"><div class="info-val">$n_looks</div><div class="info-lbl">Looks</div></div>
+        <div class="info-cell"><div class="info-val">$occasion</div><div class="info-lbl">Occasion</div></div>
+        <div class="info-cell"><div class="info-val">$season</div><div class="info-lbl">Season</div></div>
+        <div class="info-cell"><div class="info-val">$budget</div><div class="info-lbl">Budget</div></div>
+    </div>
+""")
+
+PIECE_TMPL = _template("""
+    <div class="piece-item">
+        <div class="piece-dot"></div>
+        <div class="piece-type">$type</div>
+        <div style="flex:1;">$item</div>
+        <div style="font-size:0.75rem; color:var(--muted); font-family:'Cormorant Garamond',serif;
+                    font-style:italic; max-width:140px; text-align:right;">$why</div>
+    </div>
+""")
+
+PRODUCT_TMPL = _template("""
+    <span>$title <span style="color:var(--ink);">₹$price</span></span>
+""")
+
+PRODUCT_LINK_TMPL = _template("""
+    <span><a href="$url" target="_blank" rel="noopener">$title</a> <span style="color:var(--ink);">₹$price</span></span>
+""")
+
+PALETTE_TMPL = _template("""
+    <div class="palette-row">
+        <span style="font-size:0.65rem; letter-spacing:0.1em; text-transform:uppercase;
+                     color:var(--muted);">PALETTE</span>
+        $chips
+        <span style="font-size:0.78rem; color:var(--slate); font-family:'Cormorant Garamond',serif;">$names</span>
+    </div>
+""")
+
+OUTFIT_TMPL = _template("""
+    <div class="outfit-card">
+        <div style="display:flex; justify-content:space-between; align-items:flex-start;">
+            <div>
+                <div style="font-size:0.62rem; letter-spacing:0.15em; text-transform:uppercase;
+                            color:var(--muted); margin-bottom:0.2rem;">LOOK $look_no</div>
+                <div class="outfit-name">$name</div>
+                <div class="outfit-occasion">$occasion_fit</div>
+            </div>
+            <div style="text-align:right;">
+                <div style="font-size:0.7rem; color:var(--muted); font-style:italic;
+                            font-family:'Cormorant Garamond',serif;">$vibe</div>
+            </div>
+        </div>
+        <div class="outfit-desc">$description</div>
+        <div class="piece-list">$pieces</div>
+        $palette
+        <div style="margin-top:1rem; padding:0.85rem; background:var(--cream); border-radius:3px;
+                    display:flex; gap:1.5rem; flex-wrap:wrap;">
+            <div style="flex:1; min-width:200px;">
+                <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase;
+                            color:var(--rose); margin-bottom:0.25rem;">✦ Styling Tip</div>
+                <div style="font-family:'Cormorant Garamond',serif; font-size:0.95rem;
+                            color:var(--slate);">$styling_tip</div>
+            </div>
+            <div style="min-width:140px; text-align:right;">
+                <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase;
+                            color:var(--muted); margin-bottom:0.25rem;">BUDGET</div>
+                <div style="font-family:'Cormorant Garamond',serif; font-size:0.9rem;
+                            color:var(--slate);">$budget_breakdown</div>
+            </div>
+        </div>
+    </div>
+""")
+
+TIP_TMPL = _template("""
+    <div class="tip-row">
+        <div class="tip-num">$num</div>
+        <div>$tip</div>
+    </div>
+""")
+
+TIPS_TMPL = _template("""
+    <div style="margin-top:1.5rem;">
+        <div class="section-label">✦ Personalized Style Tips</div>
+        $tips
+    </div>
+""")
+
+SIGNATURE_TMPL = _template("""
+    <div style="display:grid; grid-template-columns:1fr 1fr; gap:1rem; margin-top:1rem;">
+        <div class="outfit-card" style="border-left: 3px solid var(--gold);">
+            <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase;
+                        color:var(--gold); margin-bottom:0.5rem;">✦ Signature Statement Piece</div>
+            <div style="font-family:'Cormorant Garamond',serif; font-size:1.05rem;
+                        line-height:1.6; color:var(--ink);">$sig</div>
+        </div>
+        <div class="outfit-card" style="border-left: 3px solid var(--rose);">
+            <div style="font-size:0.62rem; letter-spacing:0.12em; text-transform:uppercase;
+                        color:var(--rose); margin-bottom:0.5rem;">✦ What to Avoid</div>
+            <div style="font-family:'Cormorant Garamond',serif; font-size:1.05rem;
+                        line-height:1.6; color:var(--ink);">$avoid</div>
+        </div>
+    </div>
+""")
+
+def analysis_html(pa: dict) -> str:
+    return ANALYSIS_TMPL.substitute(
+        {k: _e(pa.get(k)) for k in ("style_persona", "skin_tone", "body_silhouette", "current_style_cue")}
+    )
+
+def info_strip_html(n_looks: int, occasion: str, season: str, budget: str) -> str:
+    return INFO_STRIP_TMPL.substitute(
+        n_looks=_e(n_looks), occasion=_e(occasion), season=_e(season), budget=_e(budget),
+    )
+
+def products_html(products: list) -> str:
+    # Catalog matches under a piece (see fitlab.catalog); only http(s) links
+    items = []
+    for p in products or []:
+        price  = p.get("price")
+        fields = {"title": _e(p.get("title")),
+                  "price": f"{price:,.0f}" if isinstance(price, (int, float)) and math.isfinite(price) else "—"}
+        url = str(p.get("url") or "")
+        items.append(PRODUCT_LINK_TMPL.substitute(fields, url=_e(url)) if SAFE_URL.match(url)
+                     else PRODUCT_TMPL.substitute(fields))
+    return f'<div class="piece-products">{"".join(items)}</div>' if items else ""
+
+def outfit_html(i: int, outfit: dict) -> str:
+    pieces = "".join(
+        PIECE_TMPL.substitute(type=_e(p.get("type")), item=_e(p.get("item")), why=_e(p.get("why")))
+        + products_html(p.get("products"))
+        for p in outfit.get("pieces", []) if isinstance(p, dict)
+    )
+    palette = outfit.get("color_palette", [])
+    pnames  = outfit.get("palette_names", [])
+    palette_block = ""
+    if palette:
+        # Only well-formed hex values reach the style attribute
+        chips = "".join(
+            f'<div title="{_e(pnames[j] if j < len(pnames) else "")}" class="color-chip" style="background:{c};"></div>'
+            for j, c in enumerate(palette) if isinstance(c, str) and HEX_COLOR.match(c)
+        )
+        palette_block = PALETTE_TMPL.substitute(chips=chips, names=_e(" · ".join(map(str, pnames))))
+    return OUTFIT_TMPL.substitute(
+        look_no=f"{i:02d}",
+        name=_e(outfit.get("name")),
+        occasion_fit=_e(outfit.get("occasion_fit")),
+        vibe=_e(outfit.get("vibe")),
+        description=_e(outfit.get("description")),
+        pieces=pieces,
+        palette=palette_block,
+        styling_tip=_e(outfit.get("styling_tip")),
+        budget_breakdown=_e(outfit.get("budget_breakdown")),
+    )
+
+def tips_html(tips: list) -> str:
+    if not tips:
+        return ""
+    rows = "".join(TIP_TMPL.substitute(num=f"0{idx}", tip=_e(tip)) for idx, tip in enumerate(tips, 1))
+    return TIPS_TMPL.substitute(tips=rows)
+
+def signature_html(sig: str, avoid: str) -> str:
+    if not (sig or avoid):
+        return ""
+    return SIGNATURE_TMPL.substitute(sig=_e(sig), avoid=_e(avoid))
+
+def result_html(data: dict, occasion: str, season: str, budget: str) -> str:
+    outfits = data.get("outfits", [])
+    return "".join([
+        analysis_html(data.get("person_analysis", {})),
+        info_strip_html(len(outfits), occasion, season, budget),
+        *(outfit_html(i, outfit) for i, outfit in enumerate(outfits, 1)),
+        tips_html(data.get("universal_tips", [])),
+        signature_html(data.get("signature_piece", ""), data.get("avoid", "")),
+    ])
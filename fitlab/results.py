@@ -0,0 +1,111 @@
+"""Typed views over the preferences and the generated lookbook JSON."""
+
+from dataclasses import asdict, dataclass, field
+
+@dataclass
+class Preferences:
+    styles: list = field(default_factory=lambda: ["Minimalist"])
+    occasion: str = "Everyday"
+    season: str = "All-Season"
+    budget: str = "₹2K–5K"
+    body_notes: str = ""
+    extra: str = ""
+
+    @classmethod
+    def coerce(cls, prefs) -> "Preferences":
+        if isinstance(prefs, cls):
+            return prefs
+        coerced = cls(**{k: v for k, v in prefs.items() if k in cls.__dataclass_fields__})
+        if not coerced.styles:
+            # Looks are slanted one style each, so there must be at least one
+            coerced.styles = cls().styles
+        return coerced
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+@dataclass
+class PersonAnalysis:
+    skin_tone: str = ""
+    body_silhouette: str = ""
+    current_style_cue: str = ""
+    style_persona: str = ""
+    # Measured locally from the photo (see fitlab.palette), not by the model
+    colours: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PersonAnalysis":
+        text = {k: str(data.get(k) or "") for k in cls.__dataclass_fields__ if k != "colours"}
+        return cls(**text, colours=dict(data.get("colours") or {}))
+
+@dataclass
+class Piece:
+    type: str = ""
+    item: str = ""
+    why: str = ""
+    # Catalog matches (see fitlab.catalog), added after generation
+    products: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Piece":
+        text = {k: str(data.get(k) or "") for k in cls.__dataclass_fields__ if k != "products"}
+        return cls(**text, products=[dict(p) for p in data.get("products") or [] if isinstance(p, dict)])
+
+@dataclass
+class Outfit:
+    name: str = ""
+    occasion_fit: str = ""
+    vibe: str = ""
+    description: str = ""
+    pieces: list = field(default_factory=list)
+    color_palette: list = field(default_factory=list)
+    palette_names: list = field(default_factory=list)
+    styling_tip: str = ""
+    budget_breakdown: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Outfit":
+        return cls(
+            name=str(data.get("name") or ""),
+            occasion_fit=str(data.get("occasion_fit") or ""),
+            vibe=str(data.get("vibe") or ""),
+            description=str(data.get("description") or ""),
+            pieces=[Piece.from_dict(p) for p in data.get("pieces") or [] if isinstance(p, dict)],
+            color_palette=[str(c) for c in data.get("color_palette") or []],
+            palette_names=[str(n) for n in data.get("palette_names") or []],
+            styling_tip=str(data.get("styling_tip") or ""),
+            budget_breakdown=str(data.get("budget_breakdown") or ""),
+        )
+
+@dataclass
+class Result:
+    person_analysis: PersonAnalysis = field(default_factory=PersonAnalysis)
+    outfits: list = field(default_factory=list)
+    universal_tips: list = field(default_factory=list)
+    signature_piece: str = ""
+    avoid: str = ""
+    # Run metadata, not part of the lookbook itself
+    cached: bool = False
+    coalesced: bool = False
+    usage: dict = field(default_factory=dict)
+    failures: list = field(default_factory=list)
+    trace_id: str = ""
+    span_id: str = ""   # the generate or regenerate span, for work that joins its trace later
+
+    @classmethod
+    def from_dict(cls, data: dict, **meta) -> "Result":
+        return cls(
+            person_analysis=PersonAnalysis.from_dict(data.get("person_analysis") or {}),
+            outfits=[Outfit.from_dict(o) for o in data.get("outfits") or [] if isinstance(o, dict)],
+            universal_tips=[str(t) for t in data.get("universal_tips") or []],
+            signature_piece=str(data.get("signature_piece") or ""),
+            avoid=str(data.get("avoid") or ""),
+            **meta,
+        )
+
+    def to_dict(self) -> dict:
+        # The lookbook in the model's JSON schema, as stored in caches and rendered
+        data = asdict(self)
+        for key in ("cached", "coalesced", "usage", "failures", "trace_id", "span_id"):
+            data.pop(key)
+        return data
@@ -0,0 +1,257 @@
+"""Model routing: which model tier serves each call, with SLO-based fallback.
+
+Every API call names a route:
+
+    analysis   vision analysis of the photo
+    looks      the three outfits in one request
+    look       one outfit (fan-out, gap filling and re-rolling a look)
+    piece      one replacement piece
+    extras     wardrobe-level tips
+
+Every route uses the standard tier unless its ``FITLAB_ROUTE_*`` variable
+opts it into the fast one. Each route has a primary tier and, unless fallback
+is off, the other tier as fallback. The primary gets its tier's latency SLO as
+a timeout. That is the whole response for a plain request, and the gap before
+the first or next chunk for a stream. Rate limits and overloads on the primary
+are retried by the scheduler as usual, so its retry-after pauses and refunds
+still apply. If the primary runs over its SLO, or still errors once retries are
+exhausted, the same request goes to the fallback tier with the usual retries
+and no SLO. Outfits for occasions listed in ``FITLAB_FAST_OCCASIONS`` use the
+fast tier.
+
+Per-tier latency, error, fallback and cost stats are kept for tuning.
+"""
+
+import contextvars
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .constants import MODEL
+from .scheduler import SchedulerBusy
+from .telemetry import span
+
+MODEL_FAST     = os.environ.get("FITLAB_MODEL_FAST", "claude-3-5-haiku-20241022")
+MODEL_STANDARD = os.environ.get("FITLAB_MODEL", MODEL)
+SLO_FAST       = float(os.environ.get("FITLAB_SLO_FAST", 20))
+SLO_STANDARD   = float(os.environ.get("FITLAB_SLO_STANDARD", 0))
+ROUTE_ANALYSIS = os.environ.get("FITLAB_ROUTE_ANALYSIS", "standard")
+ROUTE_LOOKS    = os.environ.get("FITLAB_ROUTE_LOOKS", "standard")
+ROUTE_PIECES   = os.environ.get("FITLAB_ROUTE_PIECES", "standard")
+ROUTE_EXTRAS   = os.environ.get("FITLAB_ROUTE_EXTRAS", "standard")
+FAST_OCCASIONS = [o.strip() for o in os.environ.get("FITLAB_FAST_OCCASIONS", "").split(",") if o.strip()]
+FALLBACK       = os.environ.get("FITLAB_FALLBACK", "1") != "0"
+
+# USD per million tokens (input, output), matched on model-name prefix. Cache
+# writes bill at 1.25x input and cache reads at 0.1x.
+PRICES = {
+    "claude-3-5-haiku":  (0.80, 4.00),
+    "claude-haiku-4":    (1.00, 5.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "claude-sonnet-4":   (3.00, 15.00),
+    "claude-opus-4":     (15.00, 75.00),
+}
+
+LATENCY_WINDOW = 500
+
+def price_per_mtok(model: str) -> tuple[float, float]:
+    for prefix, price in PRICES.items():
+        if model.startswith(prefix):
+            return price
+    return 0.0, 0.0
+
+def usage_cost(model: str, usage) -> float:
+    if usage is None:
+        return 0.0
+    p_in, p_out = price_per_mtok(model)
+    n = lambda field: getattr(usage, field, None) or 0
+    return (n("input_tokens") * p_in + n("cache_creation_input_tokens") * p_in * 1.25
+            + n("cache_read_input_tokens") * p_in * 0.1 + n("output_tokens") * p_out) / 1e6
+
+class Tier:
+    def __init__(self, name: str, model: str, slo: float = 0.0):
+        self.name  = name
+        self.model = model
+        self.slo   = slo
+
+class TierStats:
+    def __init__(self):
+        self.calls     = 0
+        self.ok        = 0
+        self.errors    = 0
+        self.timeouts  = 0
+        self.fell_back = 0   # failures handed to the other tier
+        self.served_as_fallback = 0
+        self.cost_usd  = 0.0
+        self.tokens    = {"input": 0, "output": 0}
+        self.latency_s = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> dict:
+        ms = [1000 * s for s in self.latency_s]
+        p50 = p95 = ms[0] if ms else None
+        if len(ms) >= 2:
+            q = statistics.quantiles(ms, n=100, method="inclusive")
+            p50, p95 = q[49], q[94]
+        return {
+            "calls": self.calls, "ok": self.ok, "errors": self.errors, "timeouts": self.timeouts,
+            "fell_back": self.fell_back, "served_as_fallback": self.served_as_fallback,
+            "p50_ms": round(p50, 1) if ms else None, "p95_ms": round(p95, 1) if ms else None,
+            "input_tokens": self.tokens["input"], "output_tokens": self.tokens["output"],
+            "cost_usd": round(self.cost_usd, 6),
+            "cost_per_call_usd": round(self.cost_usd / self.ok, 6) if self.ok else None,
+        }
+
+def is_timeout(error: Exception) -> bool:
+    # The SDK wraps timeouts when opening a request; mid-stream read timeouts
+    # come straight from httpx, and fan-out calls run under asyncio.wait_for.
+    import anthropic
+
+    timeouts = (anthropic.APITimeoutError, TimeoutError)
+    try:
+        import httpx
+
+        timeouts += (httpx.TimeoutException,)
+    except ImportError:   # an SDK build that doesn't sit on httpx
+        pass
+    return isinstance(error, timeouts)
+
+_fallbacks = contextvars.ContextVar("fitlab_fallbacks", default=None)
+
+@contextmanager
+def track_fallbacks():
+    # Collects the routes a fallback tier answered within the block, including
+    # asyncio tasks started from it. Inner blocks report to the enclosing one.
+    outer, routes = _fallbacks.get(), []
+    token = _fallbacks.set(routes)
+    try:
+        yield routes
+    finally:
+        _fallbacks.reset(token)
+        if outer is not None:
+            outer.extend(routes)
+
+def note_fallback(route: str) -> None:
+    routes = _fallbacks.get()
+    if routes is not None:
+        routes.append(route)
+
+class Router:
+    def __init__(self, fast: Tier, standard: Tier, routes: dict, fast_occasions=(), fallback: bool = True):
+        self.tiers  = {"fast": fast, "standard": standard}
+        self.routes = routes
+        self.fast_occasions = set(fast_occasions)
+        self.fallback = fallback
+        self.stats  = {name: TierStats() for name in self.tiers}
+        self._lock  = threading.Lock()
+
+    def plan(self, route: str, prefs: dict | None = None) -> list:
+        # Tiers to try, in order
+        primary = self.routes.get(route, "standard")
+        if route in ("looks", "look") and prefs and prefs.get("occasion") in self.fast_occasions:
+            primary = "fast"
+        tiers = [self.tiers[primary]]
+        if self.fallback:
+            tiers.append(self.tiers["standard" if primary == "fast" else "fast"])
+        return tiers
+
+    def model_for(self, route: str, prefs: dict | None = None) -> str:
+        return self.plan(route, prefs)[0].model
+
+    def signature(self, prefs: dict | None = None) -> str:
+        # Part of the result cache key: changing a route's model is a new result
+        return "|".join(self.model_for(route, prefs) for route in ("analysis", "looks", "look", "extras"))
+
+    def _options(self, tier: Tier, last: bool) -> dict:
+        # A primary that runs over its SLO falls back at once instead of retrying
+        if last or not tier.slo:
+            return {}
+        return {"timeout": tier.slo, "retry_timeouts": False}
+
+    def _record(self, tier: Tier, seconds: float, response=None, error: Exception | None = None,
+                fallback: bool = False) -> None:
+        with self._lock:
+            st = self.stats[tier.name]
+            st.calls += 1
+            if error is not None:
+                st.errors += 1
+                st.timeouts += is_timeout(error)
+                return
+            st.ok += 1
+            st.served_as_fallback += fallback
+            st.latency_s.append(seconds)
+            usage = getattr(response, "usage", None)
+            st.tokens["input"]  += getattr(usage, "input_tokens", None) or 0
+            st.tokens["output"] += getattr(usage, "output_tokens", None) or 0
+            st.cost_usd += usage_cost(tier.model, usage)
+
+    def call(self, route: str, send, client, prefs: dict | None = None):
+        # send(model, client) performs the request and returns (request_sent,
+        # response). Returns the same pair from whichever tier answered.
+        tiers = self.plan(route, prefs)
+        for i, tier in enumerate(tiers):
+            last  = i == len(tiers) - 1
+            opts  = self._options(tier, last)
+            start = time.monotonic()
+            with span("route", route=route, tier=tier.name, model=tier.model, fallback=i > 0) as s:
+                try:
+                    sent, response = send(tier.model, client.with_options(**opts) if opts else client)
+                except SchedulerBusy:
+                    raise
+                except Exception as e:
+                    self._record(tier, time.monotonic() - start, error=e)
+                    if last:
+                        raise
+                    s.set(outcome="timeout" if is_timeout(e) else "error")
+                    with self._lock:
+                        self.stats[tier.name].fell_back += 1
+                    continue
+                self._record(tier, time.monotonic() - start, response, fallback=i > 0)
+                s.set(outcome="ok", cost_usd=round(usage_cost(tier.model, response.usage), 6))
+                if i > 0:
+                    note_fallback(route)
+                return sent, response
+
+    async def acall(self, route: str, send, client, prefs: dict | None = None):
+        tiers = self.plan(route, prefs)
+        for i, tier in enumerate(tiers):
+            last  = i == len(tiers) - 1
+            opts  = self._options(tier, last)
+            start = time.monotonic()
+            with span("route", route=route, tier=tier.name, model=tier.model, fallback=i > 0) as s:
+                try:
+                    sent, response = await send(tier.model, client.with_options(**opts) if opts else client)
+                except SchedulerBusy:
+                    raise
+                except Exception as e:
+                    self._record(tier, time.monotonic() - start, error=e)
+                    if last:
+                        raise
+                    s.set(outcome="timeout" if is_timeout(e) else "error")
+                    with self._lock:
+                        self.stats[tier.name].fell_back += 1
+                    continue
+                self._record(tier, time.monotonic() - start, response, fallback=i > 0)
+                s.set(outcome="ok", cost_usd=round(usage_cost(tier.model, response.usage), 6))
+                if i > 0:
+                    note_fallback(route)
+                return sent, response
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: {"model": self.tiers[name].model, "slo_s": self.tiers[name].slo, **st.snapshot()}
+                    for name, st in self.stats.items()}
+
+_router = Router(
+    Tier("fast", MODEL_FAST, SLO_FAST),
+    Tier("standard", MODEL_STANDARD, SLO_STANDARD),
+    {"analysis": ROUTE_ANALYSIS, "looks": ROUTE_LOOKS, "look": ROUTE_LOOKS, "piece": ROUTE_PIECES,
+     "extras": ROUTE_EXTRAS},
+    FAST_OCCASIONS,
+    FALLBACK,
+)
+
+def get_router() -> Router:
+    return _router
@@ -0,0 +1,528 @@
+"""Client-side admission control in front of ``messages.create`` / ``messages.stream``.
+
+Every request is costed before it is sent: estimated prompt and image tokens
+as input, its ``max_tokens`` as the output budget. It is then admitted through
+requests-, input-token- and output-token-per-minute buckets. Requests that
+don't fit wait in a bounded FIFO queue, with their position reported to the
+caller. Retriable errors (429, 5xx/529, dropped connections) are retried with
+jittered exponential backoff that honours ``retry-after``. The buckets
+recalibrate from the API's ``anthropic-ratelimit-*`` headers, and a 429 pauses
+admission for everyone until its retry-after has passed.
+"""
+
+import base64
+import contextvars
+import email.utils
+import io
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from .images import API_IMAGE_MAX_EDGE, estimate_image_tokens
+from .telemetry import span
+
+RATE_LIMIT_RPM   = float(os.environ.get("FITLAB_RPM", 50))
+RATE_LIMIT_ITPM  = float(os.environ.get("FITLAB_ITPM", 30_000))
+RATE_LIMIT_OTPM  = float(os.environ.get("FITLAB_OTPM", 8_000))
+QUEUE_MAX        = int(os.environ.get("FITLAB_QUEUE_MAX", 32))
+QUEUE_MAX_WAIT   = float(os.environ.get("FITLAB_QUEUE_MAX_WAIT", 90))
+MAX_RETRIES      = int(os.environ.get("FITLAB_MAX_RETRIES", 3))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY  = 30.0
+
+BUCKETS = ("requests", "input-tokens", "output-tokens")
+
+class SchedulerBusy(RuntimeError):
+    pass
+
+# ── Cost estimation ───────────────────────────────────────────────────────────
+def _text_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+def _image_tokens(source: dict) -> int:
+    # Only the header is parsed; an unreadable image is costed at the API maximum
+    try:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(base64.b64decode(source["data"]))) as img:
+            return estimate_image_tokens(*img.size)
+    except Exception:
+        return estimate_image_tokens(API_IMAGE_MAX_EDGE, API_IMAGE_MAX_EDGE)
+
+def _content_tokens(content) -> int:
+    if isinstance(content, str):
+        return _text_tokens(content)
+    total = 0
+    for block in content or []:
+        if block.get("type") == "image" and block.get("source", {}).get("type") == "base64":
+            total += _image_tokens(block["source"])
+        else:
+            total += _text_tokens(block.get("text") or "")
+    return total
+
+def estimate_request_tokens(request: dict) -> tuple[int, int]:
+    # (input tokens, output budget) for one messages.create request
+    n_in = _content_tokens(request.get("system") or "")
+    for message in request.get("messages", []):
+        n_in += 4 + _content_tokens(message["content"])
+    return n_in, int(request.get("max_tokens", 0))
+
+def request_cost(request: dict) -> dict:
+    n_in, n_out = estimate_request_tokens(request)
+    return {"requests": 1, "input-tokens": n_in, "output-tokens": n_out}
+
+def _stream_usage(stream, completed: bool) -> tuple:
+    # (message snapshot, usage) of a stream, either None before message_start.
+    # Output tokens are only reported at the end, so for a stream cut short
+    # they are estimated from the text received.
+    try:
+        snapshot = stream.current_message_snapshot
+    except AssertionError:
+        return None, None
+    usage = getattr(snapshot, "usage", None)
+    if usage is not None and not completed:
+        received = sum(_text_tokens(getattr(block, "text", None) or "") for block in snapshot.content or [])
+        if received > (usage.output_tokens or 0):
+            usage = usage.model_copy(update={"output_tokens": received})
+    return snapshot, usage
+
+# ── Retry policy ──────────────────────────────────────────────────────────────
+def is_retriable(error: Exception) -> bool:
+    import anthropic
+
+    if isinstance(error, anthropic.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        should_retry = error.response.headers.get("x-should-retry")
+        if should_retry in ("true", "false"):
+            return should_retry == "true"
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+def is_open_timeout(error: Exception) -> bool:
+    import anthropic
+
+    return isinstance(error, anthropic.APITimeoutError)
+
+def retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers  = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter keeps a burst of clients that failed together from retrying together
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+# ── Token buckets ─────────────────────────────────────────────────────────────
+class TokenBucket:
+    # Continuous refill up to one minute's allowance. Reservations may drive the
+    # level negative; the deficit is how long later requests must wait. A limit
+    # of 0 means unlimited until the API reports one.
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate     = self.capacity / 60
+        self.level    = self.capacity
+        self.updated  = time.monotonic()
+
+    def set_limit(self, per_minute: float) -> None:
+        was_unlimited = not self.capacity
+        self.capacity = float(per_minute)
+        self.rate     = self.capacity / 60
+        self.level    = self.capacity if was_unlimited else min(self.level, self.capacity)
+
+    def _refill(self, now: float) -> None:
+        self.level   = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (min(n, self.capacity) - self.level) / self.rate)
+
+    def take(self, n: float, now: float) -> None:
+        if self.capacity:
+            self._refill(now)
+            self.level -= min(n, self.capacity)
+
+    def give(self, n: float, now: float) -> None:
+        # Negative n charges more (the estimate was too low)
+        if self.capacity:
+            self._refill(now)
+            self.level = min(self.capacity, self.level + n)
+
+# ── Scheduler ─────────────────────────────────────────────────────────────────
+_on_wait = contextvars.ContextVar("fitlab_on_wait", default=None)
+
+@contextmanager
+def queue_feedback(callback):
+    # callback(position, seconds_left) while this context's requests are queued,
+    # then callback(0, 0.0) once admitted.
+    token = _on_wait.set(callback)
+    try:
+        yield
+    finally:
+        _on_wait.reset(token)
+
+class Cancelled(BaseException):
+    # Raised in work whose result nobody wants any more. A BaseException, like
+    # asyncio.CancelledError, so retry and fallback handlers let it through and
+    # single-flight waiters take the work over instead of failing with it.
+    pass
+
+_cancel = contextvars.ContextVar("fitlab_cancel", default=None)
+
+@contextmanager
+def cancellable(event: threading.Event):
+    # Requests made in this context raise Cancelled once event is set, while
+    # queued for admission or before each attempt is sent.
+    token = _cancel.set(event)
+    try:
+        yield
+    finally:
+        _cancel.reset(token)
+
+def check_cancelled() -> None:
+    event = _cancel.get()
+    if event is not None and event.is_set():
+        raise Cancelled()
+
+class Scheduler:
+    def __init__(self, rpm: float = RATE_LIMIT_RPM, itpm: float = RATE_LIMIT_ITPM,
+                 otpm: float = RATE_LIMIT_OTPM, max_queue: int = QUEUE_MAX,
+                 max_wait: float = QUEUE_MAX_WAIT, max_retries: int = MAX_RETRIES):
+        self.buckets = {
+            "requests":      TokenBucket(rpm),
+            "input-tokens":  TokenBucket(itpm),
+            "output-tokens": TokenBucket(otpm),
+        }
+        self.max_queue    = max_queue
+        self.max_wait     = max_wait
+        self.max_retries  = max_retries
+        self.paused_until = 0.0
+        self.waiting      = []
+        self.stats = dict.fromkeys(("admitted", "queued", "rejected", "retried", "rate_limited"), 0)
+        self._tickets = itertools.count()
+        self._lock    = threading.Lock()
+
+    # Admission
+    def reserve(self, cost: dict, not_before: float = 0.0) -> tuple[int, float]:
+        # Takes the request's cost from every bucket and returns (ticket, deadline);
+        # the caller waits until the deadline, or SchedulerBusy if it's too far off.
+        with self._lock:
+            now   = time.monotonic()
+            delay = max([self.buckets[k].wait_time(cost[k], now) for k in BUCKETS]
+                        + [self.paused_until - now, not_before - now])
+            if delay > 0 and (len(self.waiting) >= self.max_queue or delay > self.max_wait):
+                self.stats["rejected"] += 1
+                raise SchedulerBusy(
+                    f"The stylist is busy right now ({len(self.waiting)} requests queued, "
+                    f"~{delay:.0f}s wait). Please try again in a minute."
+                )
+            for k in BUCKETS:
+                self.buckets[k].take(cost[k], now)
+            ticket = next(self._tickets)
+            self.stats["admitted"] += 1
+            if delay > 0:
+                self.waiting.append(ticket)
+                self.stats["queued"] += 1
+            return ticket, now + delay
+
+    def _position(self, ticket: int) -> int:
+        with self._lock:
+            return self.waiting.index(ticket) + 1 if ticket in self.waiting else 0
+
+    def _remaining(self, deadline: float) -> float:
+        # A 429 seen by anyone meanwhile pushes every queued request back
+        return max(deadline, self.paused_until) - time.monotonic()
+
+    def _admitted(self, ticket: int, on_wait, waited: bool) -> None:
+        with self._lock:
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+        if on_wait and waited:
+            on_wait(0, 0.0)
+
+    def wait(self, ticket: int, deadline: float) -> None:
+        on_wait = _on_wait.get()
+        cancel  = _cancel.get()
+        waited  = False
+        try:
+            check_cancelled()
+            while (remaining := self._remaining(deadline)) > 0:
+                waited = True
+                if on_wait:
+                    on_wait(self._position(ticket), remaining)
+                if cancel is not None:
+                    cancel.wait(min(1.0, remaining))
+                    check_cancelled()
+                else:
+                    time.sleep(min(1.0, remaining))
+        finally:
+            self._admitted(ticket, on_wait, waited)
+
+    async def await_turn(self, ticket: int, deadline: float) -> None:
+        import asyncio
+
+        on_wait = _on_wait.get()
+        waited  = False
+        try:
+            check_cancelled()
+            while (remaining := self._remaining(deadline)) > 0:
+                waited = True
+                if on_wait:
+                    on_wait(self._position(ticket), remaining)
+                await asyncio.sleep(min(1.0, remaining))
+                check_cancelled()
+        finally:
+            self._admitted(ticket, on_wait, waited)
+
+    def take_turn(self, cost: dict, not_before: float = 0.0) -> None:
+        # reserve() then wait(); a request interrupted while queued (Cancelled,
+        # a stopped script run, asyncio cancellation) was never sent, so its
+        # tokens go back
+        ticket, deadline = self.reserve(cost, not_before)
+        try:
+            self.wait(ticket, deadline)
+        except BaseException:
+            self.refund(cost)
+            raise
+
+    async def atake_turn(self, cost: dict, not_before: float = 0.0) -> None:
+        ticket, deadline = self.reserve(cost, not_before)
+        try:
+            await self.await_turn(ticket, deadline)
+        except BaseException:
+            self.refund(cost)
+            raise
+
+    # Feedback from responses
+    def observe(self, headers) -> None:
+        if not headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for name, bucket in self.buckets.items():
+                limit     = headers.get(f"anthropic-ratelimit-{name}-limit")
+                remaining = headers.get(f"anthropic-ratelimit-{name}-remaining")
+                try:
+                    if limit:
+                        bucket.set_limit(float(limit))
+                    if remaining is not None and bucket.capacity:
+                        bucket._refill(now)
+                        bucket.level = min(bucket.level, float(remaining))
+                except ValueError:
+                    continue
+
+    def settle(self, cost: dict, usage) -> None:
+        # Swap the estimate for what the request really used. Cache reads don't
+        # count towards input-token limits; unused max_tokens go back.
+        if usage is None:
+            return
+        used_in = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+        with self._lock:
+            now = time.monotonic()
+            self.buckets["input-tokens"].give(cost["input-tokens"] - used_in, now)
+            self.buckets["output-tokens"].give(cost["output-tokens"] - (getattr(usage, "output_tokens", 0) or 0), now)
+
+    def refund(self, cost: dict) -> None:
+        # A rejected request still counts against RPM, but spent no tokens
+        with self._lock:
+            now = time.monotonic()
+            self.buckets["input-tokens"].give(cost["input-tokens"], now)
+            self.buckets["output-tokens"].give(cost["output-tokens"], now)
+
+    def retry_delay(self, error: Exception, attempt: int, cost: dict,
+                    max_retries: int | None = None, retry_timeouts: bool = True) -> float | None:
+        # Seconds to wait before retrying, or None to give up and re-raise.
+        # Whichever it is, the failed request's tokens go back and its headers
+        # (limits, a 429's retry-after pause) are taken in first.
+        self.refund(cost)
+        response = getattr(error, "response", None)
+        self.observe(getattr(response, "headers", None))
+        hint = retry_after(error)
+        with self._lock:
+            if getattr(error, "status_code", None) == 429:
+                self.stats["rate_limited"] += 1
+                if hint:
+                    self.paused_until = max(self.paused_until, time.monotonic() + hint)
+        if attempt >= (self.max_retries if max_retries is None else max_retries) or not is_retriable(error):
+            return None
+        if not retry_timeouts and is_open_timeout(error):
+            return None
+        with self._lock:
+            self.stats["retried"] += 1
+        if hint is not None:
+            return hint if hint <= self.max_wait else None
+        return backoff_delay(attempt)
+
+    # Calls
+    def _span(self, request: dict, cost: dict):
+        return span("api.call", model=request.get("model"), max_tokens=request.get("max_tokens"),
+                    est_input_tokens=cost["input-tokens"])
+
+    @staticmethod
+    def _tag(s, attempt: int, queued: float, response) -> None:
+        s.set(attempts=attempt + 1, queue_ms=round(queued * 1000, 1),
+              stop_reason=getattr(response, "stop_reason", None))
+        s.set_usage(getattr(response, "usage", None))
+
+    def call(self, create, request: dict, max_retries: int | None = None,
+             retry_timeouts: bool = True):
+        cost, retry_at, queued = request_cost(request), 0.0, 0.0
+        with self._span(request, cost) as s:
+            for attempt in itertools.count():
+                start = time.monotonic()
+                self.take_turn(cost, retry_at)
+                queued += time.monotonic() - start
+                try:
+                    raw = create(**request)
+                except Exception as e:
+                    s.set(attempts=attempt + 1, last_error=type(e).__name__)
+                    delay = self.retry_delay(e, attempt, cost, max_retries, retry_timeouts)
+                    if delay is None:
+                        raise
+                    retry_at = time.monotonic() + delay
+                    continue
+                self.observe(raw.headers)
+                response = raw.parse()
+                self.settle(cost, response.usage)
+                self._tag(s, attempt, queued, response)
+                return response
+
+    async def acall(self, create, request: dict, max_retries: int | None = None,
+                    retry_timeouts: bool = True):
+        cost, retry_at, queued = request_cost(request), 0.0, 0.0
+        with self._span(request, cost) as s:
+            for attempt in itertools.count():
+                start = time.monotonic()
+                await self.atake_turn(cost, retry_at)
+                queued += time.monotonic() - start
+                try:
+                    raw = await create(**request)
+                except Exception as e:
+                    s.set(attempts=attempt + 1, last_error=type(e).__name__)
+                    delay = self.retry_delay(e, attempt, cost, max_retries, retry_timeouts)
+                    if delay is None:
+                        raise
+                    retry_at = time.monotonic() + delay
+                    continue
+                self.observe(raw.headers)
+                response = await raw.parse()
+                self.settle(cost, response.usage)
+                self._tag(s, attempt, queued, response)
+                return response
+
+    @contextmanager
+    def stream(self, open_stream, request: dict, max_retries: int | None = None,
+               retry_timeouts: bool = True):
+        # Only opening the stream is retried; once tokens flow, errors propagate
+        cost, retry_at, queued = request_cost(request), 0.0, 0.0
+        with self._span(request, cost) as s:
+            for attempt in itertools.count():
+                start = time.monotonic()
+                self.take_turn(cost, retry_at)
+                queued += time.monotonic() - start
+                stack, opening = ExitStack(), time.monotonic()
+                try:
+                    stream = stack.enter_context(open_stream(**request))
+                except Exception as e:
+                    s.set(attempts=attempt + 1, last_error=type(e).__name__)
+                    delay = self.retry_delay(e, attempt, cost, max_retries, retry_timeouts)
+                    if delay is None:
+                        raise
+                    retry_at = time.monotonic() + delay
+                    continue
+                break
+            s.set(attempts=attempt + 1, queue_ms=round(queued * 1000, 1),
+                  open_ms=round((time.monotonic() - opening) * 1000, 1))
+            self.observe(stream.response.headers)
+            completed = False
+            try:
+                with stack:
+                    yield stream
+                completed = True
+            finally:
+                # Also when the caller stopped reading (cancelled, dropped
+                # connection, SLO timeout): settle for what was used so far,
+                # or give everything back if the response never started
+                snapshot, usage = _stream_usage(stream, completed)
+                if usage is None:
+                    self.refund(cost)
+                else:
+                    self.settle(cost, usage)
+                self._tag(s, attempt, queued, snapshot)
+
+class _ScheduledMessages:
+    def __init__(self, messages, scheduler: Scheduler, max_retries: int | None = None,
+                 retry_timeouts: bool = True):
+        self._messages       = messages
+        self._scheduler      = scheduler
+        self._max_retries    = max_retries
+        self._retry_timeouts = retry_timeouts
+
+    def create(self, **request):
+        return self._scheduler.call(self._messages.with_raw_response.create, request, self._max_retries,
+                                    self._retry_timeouts)
+
+    def stream(self, **request):
+        return self._scheduler.stream(self._messages.stream, request, self._max_retries, self._retry_timeouts)
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+class _AsyncScheduledMessages(_ScheduledMessages):
+    async def create(self, **request):
+        return await self._scheduler.acall(self._messages.with_raw_response.create, request, self._max_retries,
+                                           self._retry_timeouts)
+
+class ScheduledClient:
+    # Stands in for an Anthropic / AsyncAnthropic client; messages.create and
+    # messages.stream go through the scheduler, everything else passes through.
+
+    def __init__(self, client, scheduler: Scheduler, is_async: bool = False, max_retries: int | None = None,
+                 retry_timeouts: bool = True):
+        self._client    = client
+        self._scheduler = scheduler
+        self._is_async  = is_async
+        self.messages = (_AsyncScheduledMessages if is_async else _ScheduledMessages)(
+            client.messages, scheduler, max_retries, retry_timeouts)
+
+    def with_options(self, *, max_retries: int | None = None, retry_timeouts: bool = True,
+                     **options) -> "ScheduledClient":
+        # Same connection pool and scheduler; max_retries and retry_timeouts
+        # apply to the scheduler's retries, everything else (e.g. timeout) to
+        # the SDK client.
+        client = self._client.with_options(**options) if options else self._client
+        return ScheduledClient(client, self._scheduler, self._is_async, max_retries, retry_timeouts)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def __aenter__(self) -> "ScheduledClient":
+        await self._client.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._client.__aexit__(*exc)
+
+_scheduler = Scheduler()
+
+def get_scheduler() -> Scheduler:
+    return _scheduler
@@ -0,0 +1,83 @@
+"""In-process single-flight: concurrent identical calls share one execution."""
+
+import threading
+from concurrent.futures import Future
+
+from .scheduler import check_cancelled
+
+_ABANDONED = object()
+
+class SingleFlight:
+    # The first caller for a key runs fn; callers arriving while it is in flight
+    # block on the same future and receive its result (or its exception).
+
+    def __init__(self):
+        self._calls = {}
+        self._lock  = threading.Lock()
+        self.leaders   = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn) -> tuple:
+        # Returns (value, shared); shared is True when another caller did the work.
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = Future()
+                    self.leaders += 1
+                else:
+                    self.coalesced += 1
+            if leader:
+                break
+            value = self._wait(future)
+            if value is not _ABANDONED:
+                return value, True
+            # The leader was interrupted (e.g. its Streamlit run was stopped or
+            # rerun) rather than failing; one of the waiters takes over.
+            with self._lock:
+                self.coalesced -= 1
+
+        try:
+            value = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.set_result(_ABANDONED)
+            raise
+        else:
+            future.set_result(value)
+            return value, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    @staticmethod
+    def _wait(future: Future):
+        # A waiter whose own work is cancelled (see scheduler.cancellable)
+        # stops waiting; the leader carries on for anyone else
+        while True:
+            try:
+                return future.result(timeout=0.25)
+            except TimeoutError:
+                check_cancelled()
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+_generations = SingleFlight()
+_analyses    = SingleFlight()
+
+def get_generation_flights() -> SingleFlight:
+    return _generations
+
+def get_analysis_flights() -> SingleFlight:
+    # Photo analyses, so Generate joins one already started on upload
+    return _analyses
@@ -0,0 +1,336 @@
+"""Local stand-in for the Anthropic Messages and Message Batches endpoints.
+
+Point a client at it with ``ANTHROPIC_BASE_URL`` (or ``--base-url``) to run the
+batch CLI, benchmarks or load tests without network access or API spend:
+
+    python -m fitlab.stub_server --port 8765 --latency 0.5 --tokens-per-sec 80
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_ANALYSIS = {
+    "skin_tone": "warm olive undertone",
+    "body_silhouette": "balanced shoulders and hips with a defined waist",
+    "current_style_cue": "relaxed, neutral everyday basics",
+    "style_persona": "Quiet Luxe Minimalist",
+}
+
+SAMPLE_LOOK = {
+    "name": "Soft Tailored Ease",
+    "occasion_fit": "Best for the office and after-work plans",
+    "vibe": "Calm, polished and effortless",
+    "description": "A relaxed blazer and wide trousers balance the silhouette while warm neutrals echo the skin tone.",
+    "pieces": [
+        {"type": "Top", "item": "Oat linen relaxed blazer", "why": "softens the shoulder line"},
+        {"type": "Bottom", "item": "Ivory high-waist wide-leg trousers", "why": "lengthens the leg"},
+        {"type": "Shoes", "item": "Tan leather loafers", "why": "completes the look"},
+        {"type": "Bag", "item": "Structured camel tote", "why": "ties it together"},
+        {"type": "Accessory", "item": "Thin gold hoop earrings", "why": "adds warmth near the face"},
+    ],
+    "color_palette": ["#d8c7a8", "#f4efe6", "#a67b5b", "#c9a84c"],
+    "palette_names": ["Oat", "Ivory", "Tan", "Gold"],
+    "styling_tip": "Push the blazer sleeves up once to show the wrist.",
+    "budget_breakdown": "Blazer ₹2K, trousers ₹1.5K, loafers ₹1.5K, tote ₹1K",
+}
+
+SAMPLE_PIECE = {"type": "Shoes", "item": "Stone suede block-heel mules", "why": "softer than loafers, same warmth"}
+
+SAMPLE_EXTRAS = {
+    "universal_tips": [
+        "Warm neutrals and gold hardware flatter the olive undertone.",
+        "High waistlines keep the proportions balanced.",
+        "Repeat one colour from top to shoes to lengthen the frame.",
+    ],
+    "signature_piece": "A camel wrap coat in a soft wool blend",
+    "avoid": "Stark icy pastels, which wash out the warm undertone.",
+}
+
+def sample_reply(params: dict) -> str:
+    # Routes on the prompt text so each request type gets a well-formed reply
+    blob = json.dumps(params.get("messages", []))
+    if "Analyze the person in this photo" in blob:
+        return json.dumps(SAMPLE_ANALYSIS)
+    if "This is look " in blob:
+        m = re.search(r"This is look (\d+)", blob)
+        return json.dumps({**SAMPLE_LOOK, "name": f"{SAMPLE_LOOK['name']} {m.group(1)}"})
+    if "This replaces look " in blob:
+        m = re.search(r"This replaces look (\d+)", blob)
+        return json.dumps({**SAMPLE_LOOK, "name": f"Reworked {SAMPLE_LOOK['name']} {m.group(1)}"})
+    if "one replacement piece" in blob:
+        return json.dumps(SAMPLE_PIECE)
+    if "wardrobe-level advice" in blob:
+        return json.dumps(SAMPLE_EXTRAS)
+    outfits = [{**SAMPLE_LOOK, "name": f"{SAMPLE_LOOK['name']} {i}"} for i in range(1, 4)]
+    return json.dumps({"outfits": outfits, **SAMPLE_EXTRAS})
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def estimate_input_tokens(params: dict) -> int:
+    # Images are billed by size, not by their base64 length; assume a ~1 MP photo
+    n = 0
+    for message in params.get("messages", []):
+        content = message["content"]
+        for block in [{"type": "text", "text": content}] if isinstance(content, str) else content:
+            n += 1400 if block.get("type") == "image" else estimate_tokens(block.get("text") or "")
+    return n
+
+def _message(params: dict, text: str) -> dict:
+    return {
+        "id": f"msg_stub_{time.monotonic_ns()}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "stub"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": estimate_input_tokens(params),
+            "output_tokens": estimate_tokens(text),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        },
+    }
+
+class StubServer:
+    # latency: seconds before the first token; tokens_per_sec: output decode
+    # rate (0 = instant); batch_delay: seconds before a batch reports "ended";
+    # rpm: messages per rolling minute before answering 429 (0 = no limit);
+    # model_latency: extra seconds before the first token, per model;
+    # overloaded: models that answer 529, to exercise fallbacks.
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 tokens_per_sec: float = 0.0, batch_delay: float = 0.0, rpm: int = 0,
+                 reply=sample_reply, model_latency: dict | None = None, overloaded=()):
+        self.latency        = latency
+        self.model_latency  = dict(model_latency or {})
+        self.overloaded     = set(overloaded)
+        self.tokens_per_sec = tokens_per_sec
+        self.batch_delay    = batch_delay
+        self.rpm            = rpm
+        self.reply          = reply
+        self.batches        = {}
+        self.requests       = 0
+        self.rate_limited   = 0
+        self._recent        = []
+        self._ids           = itertools.count(1)
+        self._lock          = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "StubServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _admit(self) -> tuple[dict, float]:
+        # (rate-limit headers, seconds to wait if over the limit else 0)
+        if not self.rpm:
+            return {}, 0.0
+        with self._lock:
+            now = time.time()
+            self._recent = [t for t in self._recent if now - t < 60]
+            wait = 0.0
+            if len(self._recent) >= self.rpm:
+                wait = 60 - (now - self._recent[0])
+                self.rate_limited += 1
+            else:
+                self._recent.append(now)
+            headers = {
+                "anthropic-ratelimit-requests-limit": str(self.rpm),
+                "anthropic-ratelimit-requests-remaining": str(self.rpm - len(self._recent)),
+            }
+        return headers, wait
+
+    def _first_token_delay(self, params: dict) -> float:
+        return self.latency + self.model_latency.get(params.get("model"), 0.0)
+
+    def _decode_delay(self, n_tokens: int) -> float:
+        return n_tokens / self.tokens_per_sec if self.tokens_per_sec else 0.0
+
+    def _batch_view(self, batch: dict) -> dict:
+        ended = time.time() - batch["created"] >= self.batch_delay or batch["canceled"]
+        n = len(batch["results"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else n,
+                "succeeded": n if ended and not batch["canceled"] else 0,
+                "errored": 0,
+                "canceled": n if batch["canceled"] else 0,
+                "expired": 0,
+            },
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created"])),
+            "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created"] + 86400)),
+            "ended_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, payload, status: int = 200, headers: dict | None = None) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> dict:
+                length = int(self.headers.get("content-length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_POST(self):
+                with server._lock:
+                    server.requests += 1
+                path = self.path.split("?")[0]
+                if path == "/v1/messages":
+                    params = self._body()
+                    headers, wait = server._admit()
+                    if wait:
+                        return self._json({"type": "error", "error": {"type": "rate_limit_error",
+                                                                      "message": "Number of requests has exceeded your rate limit"}},
+                                          429, {**headers, "retry-after": str(max(1, round(wait)))})
+                    if params.get("model") in server.overloaded:
+                        return self._json({"type": "error", "error": {"type": "overloaded_error",
+                                                                      "message": "Overloaded"}}, 529, headers)
+                    if params.get("stream"):
+                        return self._stream(params, headers)
+                    text = server.reply(params)
+                    time.sleep(server._first_token_delay(params) + server._decode_delay(estimate_tokens(text)))
+                    return self._json(_message(params, text), headers=headers)
+                if path == "/v1/messages/batches":
+                    requests = self._body().get("requests", [])
+                    batch_id = f"msgbatch_stub_{next(server._ids):06d}"
+                    results = [
+                        {"custom_id": r["custom_id"],
+                         "result": {"type": "succeeded", "message": _message(r["params"], server.reply(r["params"]))}}
+                        for r in requests
+                    ]
+                    batch = {"id": batch_id, "created": time.time(), "results": results, "canceled": False}
+                    with server._lock:
+                        server.batches[batch_id] = batch
+                    return self._json(server._batch_view(batch))
+                m = re.fullmatch(r"/v1/messages/batches/([\w-]+)/cancel", path)
+                if m and m.group(1) in server.batches:
+                    batch = server.batches[m.group(1)]
+                    batch["canceled"] = True
+                    return self._json(server._batch_view(batch))
+                self._json({"type": "error", "error": {"type": "not_found_error", "message": path}}, 404)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                m = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+                if not m or m.group(1) not in server.batches:
+                    return self._json({"type": "error", "error": {"type": "not_found_error", "message": path}}, 404)
+                batch = server.batches[m.group(1)]
+                if not m.group(2):
+                    return self._json(server._batch_view(batch))
+                body = "".join(json.dumps(r) + "\n" for r in batch["results"]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", "application/binary")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, params: dict, headers: dict) -> None:
+                text = server.reply(params)
+                msg = _message(params, "")
+                msg["stop_reason"] = None
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("connection", "close")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+
+                def event(kind: str, data: dict) -> None:
+                    self.wfile.write(f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                try:
+                    time.sleep(server._first_token_delay(params))
+                    event("message_start", {"type": "message_start", "message": msg})
+                    event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                  "content_block": {"type": "text", "text": ""}})
+                    step = 16  # ~4 tokens per delta
+                    for i in range(0, len(text), step):
+                        chunk = text[i:i + step]
+                        time.sleep(server._decode_delay(estimate_tokens(chunk)))
+                        event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                      "delta": {"type": "text_delta", "text": chunk}})
+                    event("content_block_stop", {"type": "content_block_stop", "index": 0})
+                    event("message_delta", {"type": "message_delta",
+                                            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                            "usage": {"output_tokens": estimate_tokens(text)}})
+                    event("message_stop", {"type": "message_stop"})
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client stopped reading early, e.g. after the first token
+
+        return Handler
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="output decode rate (0 = instant)")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="seconds before a batch ends")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0 = no limit)")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="extra first-token latency for one model (repeatable)")
+    parser.add_argument("--overloaded", action="append", default=[], metavar="MODEL",
+                        help="answer 529 for this model (repeatable)")
+    args = parser.parse_args(argv)
+
+    model_latency = {}
+    for spec in args.model_latency:
+        model, _, seconds = spec.rpartition("=")
+        model_latency[model] = float(seconds)
+    server = StubServer(args.host, args.port, args.latency, args.tokens_per_sec, args.batch_delay, args.rpm,
+                        model_latency=model_latency, overloaded=args.overloaded)
+    print(f"Stub Anthropic API on {server.base_url} — set ANTHROPIC_BASE_URL to use it")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
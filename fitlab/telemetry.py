@@ -0,0 +1,228 @@
+"""Per-stage spans and Prometheus-style metrics for the generate path.
+
+    with span("parse", kind="looks") as s:
+        ...
+        s.set(n_looks=3)
+
+Spans nest through a context variable, so the hierarchy follows the call stack
+and asyncio tasks. Work that happens elsewhere (a later rerun showing a job's
+result) joins a finished trace by naming its parent:
+
+    with span("render", parent=SpanRef(trace_id, span_id)):
+        ...
+
+Finished spans feed counters and histograms and are kept in a small in-memory
+ring (for the debug panel). Two local exports are available:
+
+    FITLAB_TRACE_FILE=spans.jsonl    one OTLP/JSON-shaped span per line
+    FITLAB_METRICS_FILE=fitlab.prom  Prometheus text format, rewritten after
+                                     each top-level span (for a textfile collector)
+
+``FITLAB_DEBUG_PANEL=1`` shows the last generation's spans and the current
+metrics in the app.
+"""
+
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+TRACE_FILE   = os.environ.get("FITLAB_TRACE_FILE") or None
+METRICS_FILE = os.environ.get("FITLAB_METRICS_FILE") or None
+TRACE_KEEP   = int(os.environ.get("FITLAB_TRACE_KEEP", 2000))
+DEBUG_PANEL  = os.environ.get("FITLAB_DEBUG_PANEL", "0") == "1"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_FIELDS = {
+    "input_tokens":                "input",
+    "output_tokens":               "output",
+    "cache_read_input_tokens":     "cache_read",
+    "cache_creation_input_tokens": "cache_creation",
+}
+
+@dataclass(frozen=True)
+class SpanRef:
+    # A span to parent on, from another thread or rerun
+    trace_id: str
+    span_id: str
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "_t0")
+
+    def __init__(self, name: str, parent: "Span | SpanRef | None", attributes: dict):
+        self.name       = name
+        self.trace_id   = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id    = secrets.token_hex(8)
+        self.parent_id  = parent.span_id if parent else None
+        self.start_ns   = time.time_ns()
+        self.end_ns     = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self._t0        = time.perf_counter_ns()
+
+    def set(self, **attributes) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def set_usage(self, usage) -> None:
+        for field in TOKEN_FIELDS:
+            value = getattr(usage, field, None)
+            if value is not None:
+                self.attributes[field] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else self.start_ns + time.perf_counter_ns() - self._t0
+        return (end - self.start_ns) / 1e6
+
+    def to_otel(self) -> dict:
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        return {
+            "traceId":           self.trace_id,
+            "spanId":            self.span_id,
+            "parentSpanId":      self.parent_id or "",
+            "name":              self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano":   str(self.end_ns),
+            "attributes":        [{"key": k, "value": value(v)} for k, v in self.attributes.items()],
+            "status":            {"code": 2 if "error" in self.attributes else 1},
+        }
+
+_current = contextvars.ContextVar("fitlab_span", default=None)
+
+def current_span() -> Span | None:
+    return _current.get()
+
+@contextmanager
+def span(name: str, parent: Span | SpanRef | None = None, **attributes):
+    s = Span(name, parent or _current.get(), attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=type(e).__name__)
+        raise
+    finally:
+        s.end_ns = s.start_ns + time.perf_counter_ns() - s._t0
+        _current.reset(token)
+        get_tracer().record(s)
+
+def _labels(**labels) -> str:
+    def esc(v) -> str:
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+class Tracer:
+    def __init__(self, keep: int = TRACE_KEEP, trace_file: str | None = TRACE_FILE,
+                 metrics_file: str | None = METRICS_FILE):
+        self.recent       = deque(maxlen=keep)
+        self.trace_file   = trace_file
+        self.metrics_file = metrics_file
+        # (span name, model) -> [per-bucket counts..., +Inf count], sum
+        self.durations = defaultdict(lambda: [[0] * (len(DURATION_BUCKETS) + 1), 0.0])
+        self.counters  = defaultdict(float)
+        self._lock     = threading.Lock()
+        self._io_lock  = threading.Lock()
+
+    def record(self, s: Span) -> None:
+        seconds = s.duration_ms / 1000
+        model   = s.attributes.get("model", "")
+        with self._lock:
+            self.recent.append(s)
+            buckets, _ = hist = self.durations[(s.name, model)]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            hist[1] += seconds
+            if s.name == "api.call":
+                stop = s.attributes.get("stop_reason") or s.attributes.get("error", "unknown")
+                self.counters[("fitlab_api_requests_total", _labels(model=model, stop_reason=stop))] += 1
+                for field, kind in TOKEN_FIELDS.items():
+                    if field in s.attributes:
+                        self.counters[("fitlab_tokens_total", _labels(model=model, type=kind))] += s.attributes[field]
+            if s.name == "route":
+                labels = _labels(route=s.attributes.get("route", ""), tier=s.attributes.get("tier", ""),
+                                 outcome=s.attributes.get("outcome") or s.attributes.get("error", "unknown"))
+                self.counters[("fitlab_route_calls_total", labels)] += 1
+                if "cost_usd" in s.attributes:
+                    self.counters[("fitlab_cost_usd_total", _labels(model=model))] += s.attributes["cost_usd"]
+            if s.name == "upload.phash" and "match" in s.attributes:
+                self.counters[("fitlab_photo_matches_total", _labels(match=s.attributes["match"]))] += 1
+            if s.name in ("generate", "prefetch"):
+                outcome = s.attributes.get("outcome") or ("error" if "error" in s.attributes else "unknown")
+                metric  = "fitlab_generations_total" if s.name == "generate" else "fitlab_prefetches_total"
+                self.counters[(metric, _labels(outcome=outcome))] += 1
+
+        if self.trace_file:
+            line = json.dumps(s.to_otel(), ensure_ascii=False) + "\n"
+            with self._io_lock, open(self.trace_file, "a", encoding="utf-8") as f:
+                f.write(line)
+        if self.metrics_file and s.parent_id is None:
+            text = self.prometheus_text()
+            with self._io_lock:
+                tmp = f"{self.metrics_file}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp, self.metrics_file)
+
+    def trace(self, trace_id: str) -> list:
+        with self._lock:
+            return sorted((s for s in self.recent if s.trace_id == trace_id), key=lambda s: s.start_ns)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP fitlab_stage_duration_seconds Time spent per generate-path stage.",
+            "# TYPE fitlab_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (name, model), (buckets, total) in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, n in zip((*DURATION_BUCKETS, "+Inf"), buckets):
+                    cumulative += n
+                    lines.append(f"fitlab_stage_duration_seconds_bucket{_labels(stage=name, model=model, le=bound)} {cumulative}")
+                lines.append(f"fitlab_stage_duration_seconds_sum{_labels(stage=name, model=model)} {total:.6f}")
+                lines.append(f"fitlab_stage_duration_seconds_count{_labels(stage=name, model=model)} {cumulative}")
+            by_metric = defaultdict(list)
+            for (metric, labels), value in sorted(self.counters.items()):
+                by_metric[metric].append(f"{metric}{labels} {value:g}")
+        helps = {
+            "fitlab_api_requests_total":  "Messages API calls by model and stop reason.",
+            "fitlab_tokens_total":        "Tokens reported in response.usage, by model and type.",
+            "fitlab_generations_total":   "Generations by outcome (fresh, cached, coalesced, cancelled).",
+            "fitlab_route_calls_total":   "Routed calls by route, model tier and outcome (ok, timeout, error).",
+            "fitlab_cost_usd_total":      "Estimated spend in USD, by model.",
+            "fitlab_photo_matches_total": "Uploads by match against earlier photos (exact, near, miss).",
+            "fitlab_prefetches_total":    "Background analyses started on upload, by outcome (done, cached, cancelled, failed).",
+        }
+        for metric, samples in by_metric.items():
+            lines += [f"# HELP {metric} {helps.get(metric, metric)}", f"# TYPE {metric} counter", *samples]
+        return "\n".join(lines) + "\n"
+
+def trace_rows(spans: list) -> list:
+    # One row per span, children indented under their parent, for display
+    depth = {}
+    rows  = []
+    for s in spans:
+        depth[s.span_id] = depth.get(s.parent_id, -1) + 1
+        rows.append({"span": "  " * depth[s.span_id] + s.name, "ms": round(s.duration_ms, 1),
+                     **s.attributes})
+    return rows
+
+_tracer = Tracer()
+
+def get_tracer() -> Tracer:
+    return _tracer
@@ -0,0 +1,46 @@
+"""Token-usage accounting across requests, including prompt-cache reads/writes."""
+
+import threading
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+class UsageMeter:
+    # Sums response.usage across the requests of one generation (or, for the
+    # process-wide meter, across every generation) to expose prompt-cache hit rates.
+
+    def __init__(self):
+        self.totals = dict.fromkeys(USAGE_FIELDS, 0)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage) -> None:
+        if usage is None:
+            return
+        with self._lock:
+            self.requests += 1
+            for field in USAGE_FIELDS:
+                self.totals[field] += getattr(usage, field, None) or 0
+
+    def merge(self, other: "UsageMeter") -> None:
+        with self._lock:
+            self.requests += other.requests
+            for field in USAGE_FIELDS:
+                self.totals[field] += other.totals[field]
+
+    @property
+    def cache_hit_rate(self) -> float:
+        # Share of prompt tokens served from the provider cache
+        t = self.totals
+        prompt = t["input_tokens"] + t["cache_read_input_tokens"] + t["cache_creation_input_tokens"]
+        return t["cache_read_input_tokens"] / prompt if prompt else 0.0
+
+    def summary(self) -> str:
+        t = self.totals
+        return (f"{t['input_tokens']:,} in · {t['output_tokens']:,} out · "
+                f"cache read {t['cache_read_input_tokens']:,} / write {t['cache_creation_input_tokens']:,} "
+                f"({self.cache_hit_rate:.0%} hit)")
+
+_process_meter = UsageMeter()
+
+def get_usage_meter() -> UsageMeter:
+    return _process_meter
@@ -0,0 +1,34 @@
+import json
+
+from fitlab.parsing import ResultStreamParser, salvage_looks
+
+LOOK = '{"name": "Weekend", "pieces": [{"type": "Top", "item": "linen shirt"}]}'
+REPLY = '{"person_analysis": {"skin_tone": "warm"}, "outfits": [' + LOOK + "]}"
+
+def test_stream_parser_yields_each_object_as_it_closes():
+    parser = ResultStreamParser()
+    events = []
+    for i in range(0, len(REPLY), 7):
+        events += parser.feed(REPLY[i:i + 7])
+    assert [(kind, idx) for kind, idx, _ in events] == [("person_analysis", None), ("outfit", 0)]
+
+def test_stream_parser_ignores_trailing_junk():
+    for tail in ("}", "]}", "\n```", "\nHope this helps! {styled} [done]", '\n{"outfits": [' + LOOK + "]}"):
+        events = ResultStreamParser().feed(REPLY + tail)
+        assert [(kind, idx) for kind, idx, _ in events] == [("person_analysis", None), ("outfit", 0)]
+
+def test_salvage_keeps_closed_looks_of_a_truncated_reply():
+    raw = '{"outfits": [\n' + LOOK + ',\n{"name": "Evening", "pie'
+    assert salvage_looks(raw) == {"outfits": [json.loads(LOOK)]}
+
+def test_salvage_recovers_extras_and_ignores_trailing_junk():
+    raw = ('{"outfits": [\n' + LOOK + '\n], "universal_tips": ["tuck it"], "signature_piece": "loafers",\n'
+           '"avoid": "neon"}}\nThat is the lookbook. }')
+    looks = salvage_looks(raw)
+    assert looks["outfits"] == [json.loads(LOOK)]
+    assert looks["universal_tips"] == ["tuck it"]
+    assert looks["signature_piece"] == "loafers"
+    assert looks["avoid"] == "neon"
+
+def test_salvage_of_unparseable_text_is_empty():
+    assert salvage_looks("Sorry, I can't help with that.") == {"outfits": []}